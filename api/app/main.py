@@ -1,17 +1,57 @@
-from fastapi import FastAPI, Depends, Query, UploadFile, File, HTTPException, Response, Body
+from fastapi import FastAPI, Depends, Query, UploadFile, File, HTTPException, Response, Body, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 from typing import List, Optional
+import asyncio
 import io
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from sqlalchemy import select, func, or_
 from sqlalchemy.orm import selectinload
 
-from api.database.base import get_db
-from api.schemas import MetaboliteOut, SearchResponse, AnnotationResponse, AnnotationCandidate, AnnotationItem, EnzymeOut
+from api.database.base import get_db, async_engine, AsyncSessionLocal
+from api.schemas import (
+    MetaboliteOut, SearchResponse, AnnotationResponse, EnzymeOut, AnnotationJob, AnnotationJobResults,
+    FormulaGenerationResponse, FormulaAnnotationResponse, CompoundAnnotationResponse, MassSearchResponse,
+    KendrickSeriesResponse, LipidHomologsResponse, GlycanSearchResponse, PeptideMassFingerprintResponse,
+    MsmsSpectrumIn, MsmsAnnotationResponse, FeatureTableResponse, MetaboliteLookupResponse, FuzzySearchResponse
+)
 from api.models import Metabolite, Enzyme
+from api.services import AnnotationService
+from api.services.adducts import resolve_adducts
+from api.services.job_service import job_manager
+from api.services.annotation_cache import annotation_cache
+from api.services.mzml_service import MzmlService
+from api.services.formula_service import FormulaService
+from api.services.compound_service import CompoundService
+from api.services.metabolite_service import MetaboliteService
+from api.services.lipid_service import LipidService
+from api.services.glycan_service import GlycanService
+from api.services.peptide_service import PeptideService
+from api.services.msms_service import MsmsService
+from api.services.spectral_library import SpectralLibraryUnavailable
+from api.services.alignment_service import AlignmentService
+from api.services.fuzzy_service import FuzzySearchService
+from api.services.columnar import negotiate_columnar, parse_mz_buffer, serialize_matches
+from api.services.sharded_search import shutdown_pool
+from api.services.fulltext import ensure_fulltext_index, metabolite_text_condition
+from api.services.pagination import fetch_page
+from api.services.search_count import normalize_filters, search_total
+from api.services.data_version import ensure_change_tracking
+from api.services.fuzzy_index import get_fuzzy_index
+
+logger = logging.getLogger(__name__)
+
+# Sort orders of the paginated searches (query value -> model attribute)
+METABOLITE_SORT_KEYS = {"id": "id", "name": "name", "mass": "exact_mass"}
+ENZYME_SORT_KEYS = {"id": "id", "name": "name", "mass": "molecular_weight"}
 
 # Create FastAPI app
 app = FastAPI(
@@ -29,6 +69,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_fulltext_index():
+    """Создаем полнотекстовый индекс метаболитов, если его еще нет"""
+    try:
+        await ensure_fulltext_index(async_engine)
+    except Exception as e:
+        logger.warning(f"Полнотекстовый индекс недоступен, поиск через LIKE: {e}")
+
+@app.on_event("startup")
+async def create_change_tracking():
+    """Создаем счетчик изменений таблиц (сброс кэшей при правке названий и идентификаторов)"""
+    try:
+        await ensure_change_tracking(async_engine)
+    except Exception as e:
+        logger.warning(f"Счетчик изменений недоступен, кэши сверяются только по отпечатку таблиц: {e}")
+
+@app.on_event("startup")
+async def build_fuzzy_index():
+    """Строим индекс нечеткого поиска по названиям заранее, чтобы первый запрос не ждал"""
+    try:
+        async with AsyncSessionLocal() as session:
+            await get_fuzzy_index(session)
+    except Exception as e:
+        logger.warning(f"Индекс нечеткого поиска будет построен при первом запросе: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    """Останавливаем фоновые задания аннотации и пул процессов"""
+    await job_manager.shutdown()
+    shutdown_pool()
+
 @app.get("/", response_model=dict)
 async def root():
     """Корневой endpoint с информацией о приложении"""
@@ -39,7 +110,23 @@ async def root():
         "endpoints": {
             "/health": "Проверка состояния сервера",
             "/metabolites/search": "Поиск метаболитов",
-            "/annotate/csv": "Аннотация CSV файлов"
+            "/metabolites/lookup": "Пакетный поиск метаболитов по идентификаторам HMDB, KEGG, ChEBI, PubChem",
+            "/search/mass": "Поиск по массе во всех базах (метаболиты, липиды, углеводы)",
+            "/search/fuzzy": "Поиск по названию с опечатками (метаболиты, ферменты, липиды, углеводы)",
+            "/annotate/csv": "Аннотация CSV файлов",
+            "/annotate/csv/stream": "Потоковая аннотация больших CSV файлов",
+            "/annotate/mz-list/binary": "Аннотация бинарного списка m/z (float64, Arrow)",
+            "/annotate/mzml": "Потоковая аннотация файлов mzML",
+            "/annotate/jobs": "Фоновые задания аннотации",
+            "/annotate/cache": "Статистика кэша аннотации",
+            "/annotate/unified": "Аннотация по всем базам соединений",
+            "/annotate/formulas": "Аннотация на уровне брутто-формул (изомеры по запросу)",
+            "/annotate/batch": "Выравнивание пиков нескольких образцов и таблица признаков с аннотацией",
+            "/annotate/msms": "Аннотация MS/MS спектров по спектральной библиотеке (косинусное сходство)",
+            "/lipids/series": "Гомологические ряды липидов по дефекту массы Кендрика",
+            "/carbohydrates/compositions": "Поиск гликановых композиций (Hex, HexNAc, dHex, NeuAc, Pent) по массе",
+            "/formulas/generate": "Генерация брутто-формул для неаннотированных пиков",
+            "/enzymes/pmf": "Идентификация ферментов по пептидному массовому отпечатку (трипсин)"
         }
     }
 
@@ -72,6 +159,9 @@ async def search_metabolites(
     tol_ppm: float = Query(default=10.0, description="Допуск в ppm для поиска по массе"),
     page: int = Query(default=1, ge=1, description="Номер страницы"),
     page_size: int = Query(default=50, ge=1, le=200, description="Размер страницы"),
+    sort: str = Query(default="id", regex="^(id|name|mass)$", description="Сортировка: id, name или mass"),
+    cursor: Optional[str] = Query(default=None, description="Курсор следующей страницы (next_cursor), заменяет page"),
+    count: str = Query(default="exact", regex="^(exact|estimate|none)$", description="Общее количество: exact (кэшируется), estimate или none (только has_more)"),
     session: AsyncSession = Depends(get_db)
 ):
     """Поиск метаболитов по названию, формуле или массе"""
@@ -85,19 +175,9 @@ async def search_metabolites(
             
             # Применяем фильтры
             if q:
-                # Поиск по названию (английскому и русскому) или формуле (регистронезависимый)
-                # Используем lower() для регистронезависимого поиска в SQLite
-                query = query.where(
-                    or_(
-                        func.lower(Metabolite.name).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.name_ru).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.formula).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.hmdb_id).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.kegg_id).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.chebi_id).like(f"%{q.lower()}%"),
-                        func.lower(Metabolite.pubchem_cid).like(f"%{q.lower()}%")
-                    )
-                )
+                # Поиск по названию (английскому и русскому), формуле и идентификаторам (регистронезависимый)
+                # Через триграммный полнотекстовый индекс, если он есть, иначе через LIKE
+                query = query.where(await metabolite_text_condition(session, q))
             
             if mass is not None:
                 # Поиск по массе с допуском
@@ -106,17 +186,15 @@ async def search_metabolites(
                 high_mass = mass + delta
                 query = query.where(Metabolite.exact_mass.between(low_mass, high_mass))
             
-            # Подсчитываем общее количество
-            count_query = select(func.count()).select_from(query.subquery())
-            total_result = await session.execute(count_query)
-            total = total_result.scalar()
-            
-            # Применяем пагинацию
-            query = query.offset((page - 1) * page_size).limit(page_size)
+            # Общее количество: точное из кэша по фильтру, оценка или без подсчета
+            total, total_estimated = await search_total(
+                session, query, count, "metabolites", normalize_filters(q=q, mass=mass, tol_ppm=tol_ppm)
+            )
             
-            # Выполняем запрос
-            result = await session.execute(query)
-            metabolites = result.scalars().all()
+            # Пагинация: по курсору (поиск по индексу) или по номеру страницы
+            metabolites, next_cursor = await fetch_page(
+                session, query, Metabolite, METABOLITE_SORT_KEYS[sort], page_size, cursor, (page - 1) * page_size
+            )
             
             # Формируем ответ
             metabolite_list = []
@@ -141,9 +219,59 @@ async def search_metabolites(
                 metabolites=metabolite_list,
                 total=total,
                 page=page,
-                page_size=page_size
+                page_size=page_size,
+                next_cursor=next_cursor,
+                has_more=next_cursor is not None,
+                total_estimated=total_estimated
             )
             
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
+
+@app.post("/metabolites/lookup", response_model=MetaboliteLookupResponse)
+async def lookup_metabolites(
+    identifiers: List[str] = Body(..., description="Идентификаторы HMDB, KEGG, ChEBI или PubChem CID"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Пакетное разрешение идентификаторов одним запросом по уникальным индексам"""
+    try:
+        return await MetaboliteService.lookup_identifiers(session, identifiers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
+
+@app.get("/search/mass", response_model=MassSearchResponse)
+async def search_mass(
+    mass: float = Query(..., gt=0, description="Нейтральная масса для поиска"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm"),
+    limit: int = Query(default=50, ge=1, le=500, description="Максимальное количество соединений"),
+    sources: Optional[str] = Query(default=None, description="Базы через запятую: metabolites,lipids,carbohydrates"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Поиск соединений по массе сразу во всех базах, один список по возрастанию ошибки"""
+    try:
+        return await CompoundService.search_mass(session, mass, tol_ppm, limit, sources)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
+
+@app.get("/search/fuzzy", response_model=FuzzySearchResponse)
+async def search_fuzzy(
+    q: str = Query(..., min_length=1, description="Название на английском или русском, допускаются опечатки"),
+    sources: Optional[str] = Query(default=None, description="Базы через запятую: metabolites,enzymes,lipids,carbohydrates"),
+    max_edits: Optional[int] = Query(default=None, ge=0, le=3, description="Допустимое число правок (по умолчанию по длине запроса)"),
+    limit: int = Query(default=20, ge=1, le=200, description="Максимальное количество результатов"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Нечеткий поиск по названиям: опечатки и смешение кириллицы с латиницей"""
+    try:
+        return await FuzzySearchService.search(session, q, sources, max_edits, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
 
@@ -190,9 +318,14 @@ async def annotate_csv(
     mz_column: str = Query(default="mz", description="Название столбца с массами (m/z)"),
     tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
     max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    intensity_column: str = Query(default="intensity", description="Столбец интенсивности моноизотопного пика"),
+    m1_column: str = Query(default="intensity_m1", description="Столбец интенсивности пика M+1 (для оценки изотопов)"),
+    m2_column: str = Query(default="intensity_m2", description="Столбец интенсивности пика M+2 (для оценки изотопов)"),
     session: AsyncSession = Depends(get_db)
 ):
-    """Аннотация CSV файла с пиками LC-MS"""
+    """Аннотация CSV файла с пиками LC-MS (при наличии интенсивностей M+1/M+2 кандидаты ранжируются по изотопам)"""
     try:
         # Проверяем тип файла
         if not file.filename.endswith('.csv'):
@@ -228,160 +361,527 @@ async def annotate_csv(
                 detail=f"Ошибка преобразования столбца '{mz_column}' в числа: {str(e)}"
             )
         
-        # Аннотируем каждый пик
-        annotation_items = []
-        annotated_count = 0
+        # Наблюдаемые изотопные отношения, если в файле есть интенсивности
+        isotopes = AnnotationService.isotope_ratios(df, (intensity_column, m1_column, m2_column))
         
-        for mz in mz_values:
-                # Поиск кандидатов по массе
-                delta = mz * tol_ppm / 1e6
-                low_mass = mz - delta
-                high_mass = mz + delta
-                
-                query = select(Metabolite).options(
-                    selectinload(Metabolite.class_)
-                ).where(
-                    Metabolite.exact_mass.between(low_mass, high_mass)
-                ).order_by(
-                    func.abs(Metabolite.exact_mass - mz)
-                ).limit(max_candidates)
-                
-                result = await session.execute(query)
-                candidates = result.scalars().all()
-                
-                # Формируем кандидатов
-                candidate_list = []
-                for candidate in candidates:
-                    mass_error_da = candidate.exact_mass - mz
-                    mass_error_ppm = (mass_error_da / mz) * 1e6
-                    
-                    candidate_data = AnnotationCandidate(
-                        metabolite=MetaboliteOut(
-                            id=candidate.id,
-                            name=candidate.name,
-                            formula=candidate.formula,
-                            exact_mass=candidate.exact_mass,
-                            hmdb_id=candidate.hmdb_id,
-                            chebi_id=candidate.chebi_id,
-                            kegg_id=candidate.kegg_id,
-                            pubchem_cid=candidate.pubchem_cid,
-                            class_id=candidate.class_id,
-                            class_name=candidate.class_.name if candidate.class_ else None,
-                            pathways=[],
-                            enzymes=[]
-                        ),
-                        mass_error_ppm=round(mass_error_ppm, 2),
-                        mass_error_da=round(mass_error_da, 6)
-                    )
-                    candidate_list.append(candidate_data)
-                
-                # Лучший кандидат (первый в списке, если есть)
-                best_match = candidate_list[0] if candidate_list else None
-                if best_match:
-                    annotated_count += 1
-                
-                # Создаем элемент аннотации
-                item = AnnotationItem(
-                    mz=round(mz, 6),
-                    candidates=candidate_list,
-                    best_match=best_match
-                )
-                annotation_items.append(item)
+        # Аннотируем все пики за один проход по индексу масс
+        return await AnnotationService.annotate_mz_list(
+            session, mz_values, tol_ppm, max_candidates, adducts, ion_mode, isotopes
+        )
         
-        return AnnotationResponse(
-            items=annotation_items,
-            total_peaks=len(mz_values),
-            annotated_peaks=annotated_count
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
+
+@app.post("/annotate/batch", response_model=FeatureTableResponse)
+async def annotate_batch(
+    files: List[UploadFile] = File(..., description="CSV файлы образцов или ZIP архив с CSV файлами"),
+    mz_column: str = Query(default="mz", description="Название столбца с массами (m/z)"),
+    rt_column: str = Query(default="rt", description="Столбец времени удерживания"),
+    intensity_column: str = Query(default="intensity", description="Столбец интенсивности (без него матрица присутствия)"),
+    tol_ppm: float = Query(default=10.0, gt=0, description="Допуск в ppm для выравнивания и аннотации"),
+    rt_tol: Optional[float] = Query(default=None, gt=0, description="Допуск по времени удерживания (без него только по m/z)"),
+    min_samples: int = Query(default=1, ge=1, description="Минимум образцов, в которых найден признак"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на признак"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Выравнивание пиков образцов (sort-and-sweep по m/z и RT) и однократная аннотация каждого признака"""
+    try:
+        # Загрузки читаются по частям с ограничением ALIGNMENT_MAX_UPLOAD_MB вне цикла событий
+        uploads = [(upload.filename or "sample.csv", upload.file) for upload in files]
+        samples = await asyncio.to_thread(AlignmentService.read_samples, uploads)
+        if not samples:
+            raise HTTPException(status_code=400, detail="Не найдено ни одного CSV файла")
+        
+        return await AlignmentService.build_feature_table(
+            session, samples, mz_column, rt_column, intensity_column, tol_ppm, rt_tol, min_samples,
+            max_candidates, adducts, ion_mode
         )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
 
+@app.post("/annotate/csv/stream")
+async def annotate_csv_stream(
+    file: UploadFile = File(..., description="CSV файл с данными"),
+    mz_column: str = Query(default="mz", description="Название столбца с массами (m/z)"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    format: str = Query(default="ndjson", regex="^(ndjson|csv)$", description="Формат вывода"),
+    chunk_size: int = Query(default=5000, ge=100, le=100000, description="Количество строк в одном блоке"),
+    intensity_column: str = Query(default="intensity", description="Столбец интенсивности моноизотопного пика"),
+    m1_column: str = Query(default="intensity_m1", description="Столбец интенсивности пика M+1 (для оценки изотопов)"),
+    m2_column: str = Query(default="intensity_m2", description="Столбец интенсивности пика M+2 (для оценки изотопов)"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Потоковая аннотация CSV файла любого размера (NDJSON или CSV по мере обработки)"""
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Файл должен быть в формате CSV")
+    
+    try:
+        resolve_adducts(adducts, ion_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    
+    try:
+        # Читаем файл блоками и разбираем только столбцы с массами и интенсивностями
+        isotope_columns = (intensity_column, m1_column, m2_column)
+        chunks = AnnotationService.open_csv_chunks(file.file, mz_column, chunk_size, isotope_columns)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Столбец '{mz_column}' не найден или файл не читается: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка чтения CSV файла: {str(e)}")
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        AnnotationService.stream_csv_annotations(
+            session, chunks, mz_column, tol_ppm, max_candidates, format, adducts, ion_mode, isotope_columns
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=annotation.{format}"}
+    )
+
+@app.post("/annotate/mzml")
+async def annotate_mzml(
+    file: UploadFile = File(..., description="Файл mzML (или mzML.gz)"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для объединения пиков и аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на признак"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    min_intensity: float = Query(default=0.0, ge=0, description="Минимальная интенсивность пика"),
+    max_gap_scans: int = Query(default=5, ge=0, description="Сколько сканов признак может отсутствовать"),
+    min_scans: int = Query(default=1, ge=1, description="Минимальное число сканов в признаке"),
+    mode: str = Query(default="auto", regex="^(auto|profile|centroid)$", description="Режим спектров"),
+    format: str = Query(default="ndjson", regex="^(ndjson|csv)$", description="Формат вывода"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Потоковая аннотация mzML: пики по сканам объединяются в признаки с диапазонами времени удерживания"""
+    filename = file.filename or ""
+    if not filename.lower().endswith((".mzml", ".mzml.gz")):
+        raise HTTPException(status_code=400, detail="Файл должен быть в формате mzML")
+    
+    try:
+        MzmlService.check_available()
+        resolve_adducts(adducts, ion_mode)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    
+    # pymzml читает файл с диска, поэтому сохраняем загрузку во временный файл
+    suffix = ".mzML.gz" if filename.lower().endswith(".gz") else ".mzML"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as target:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, target)
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        MzmlService.stream_mzml_annotations(
+            session, path, tol_ppm, max_candidates, adducts, ion_mode,
+            min_intensity, max_gap_scans, min_scans, mode, format
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=features.{format}"},
+        background=BackgroundTask(os.remove, path)
+    )
+
 @app.post("/annotate/mz-list", response_model=AnnotationResponse)
 async def annotate_mz_list(
+    request: Request,
     mz_list: List[float] = Body(..., description="Список масс (m/z) для аннотации"),
     tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
     max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
     session: AsyncSession = Depends(get_db)
 ):
-    """Аннотация списка масс (m/z)"""
+    """Аннотация списка масс (m/z); Accept: Arrow/Parquet/npz возвращает плоскую таблицу кандидатов"""
     try:
         if not mz_list:
             raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
         
-        # Аннотируем каждый пик
-        annotation_items = []
-        annotated_count = 0
+        return await _annotate_negotiated(
+            request, session, np.asarray(mz_list, dtype=np.float64), tol_ppm, max_candidates, adducts, ion_mode
+        )
         
-        for mz in mz_list:
-                # Поиск кандидатов по массе
-                delta = mz * tol_ppm / 1e6
-                low_mass = mz - delta
-                high_mass = mz + delta
-                
-                query = select(Metabolite).options(
-                    selectinload(Metabolite.class_)
-                ).where(
-                    Metabolite.exact_mass.between(low_mass, high_mass)
-                ).order_by(
-                    func.abs(Metabolite.exact_mass - mz)
-                ).limit(max_candidates)
-                
-                result = await session.execute(query)
-                candidates = result.scalars().all()
-                
-                # Формируем кандидатов
-                candidate_list = []
-                for candidate in candidates:
-                    mass_error_da = candidate.exact_mass - mz
-                    mass_error_ppm = (mass_error_da / mz) * 1e6
-                    
-                    candidate_data = AnnotationCandidate(
-                        metabolite=MetaboliteOut(
-                            id=candidate.id,
-                            name=candidate.name,
-                            formula=candidate.formula,
-                            exact_mass=candidate.exact_mass,
-                            hmdb_id=candidate.hmdb_id,
-                            chebi_id=candidate.chebi_id,
-                            kegg_id=candidate.kegg_id,
-                            pubchem_cid=candidate.pubchem_cid,
-                            class_id=candidate.class_id,
-                            class_name=candidate.class_.name if candidate.class_ else None,
-                            pathways=[],
-                            enzymes=[]
-                        ),
-                        mass_error_ppm=round(mass_error_ppm, 2),
-                        mass_error_da=round(mass_error_da, 6)
-                    )
-                    candidate_list.append(candidate_data)
-                
-                # Лучший кандидат (первый в списке, если есть)
-                best_match = candidate_list[0] if candidate_list else None
-                if best_match:
-                    annotated_count += 1
-                
-                # Создаем элемент аннотации
-                item = AnnotationItem(
-                    mz=round(mz, 6),
-                    candidates=candidate_list,
-                    best_match=best_match
-                )
-                annotation_items.append(item)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
+
+@app.post("/annotate/mz-list/binary", response_model=AnnotationResponse)
+async def annotate_mz_list_binary(
+    request: Request,
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    mz_column: str = Query(default="mz", description="Колонка с m/z в Arrow потоке"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Аннотация m/z из бинарного тела: little-endian float64 (application/octet-stream) или Arrow IPC stream"""
+    try:
+        body = await request.body()
+        mz_values = parse_mz_buffer(body, request.headers.get("content-type"), mz_column)
+        if len(mz_values) == 0:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await _annotate_negotiated(
+            request, session, mz_values, tol_ppm, max_candidates, adducts, ion_mode
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
+
+async def _annotate_negotiated(request, session, mz_values, tol_ppm, max_candidates, adducts, ion_mode):
+    """JSON-ответ или плоская колоночная таблица в зависимости от заголовка Accept"""
+    media_type = negotiate_columnar(request.headers.get("accept"))
+    if media_type is None:
+        # Аннотируем все пики за один проход по индексу масс
+        return await AnnotationService.annotate_mz_list(
+            session, mz_values, tol_ppm, max_candidates, adducts, ion_mode
+        )
+    
+    matches = await AnnotationService.annotate_matches(
+        session, mz_values, tol_ppm, max_candidates, adducts, ion_mode
+    )
+    return Response(
+        content=serialize_matches(matches, media_type),
+        media_type=media_type,
+        headers={"X-Total-Peaks": str(len(mz_values))}
+    )
+
+@app.post("/annotate/unified", response_model=CompoundAnnotationResponse)
+async def annotate_unified(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) для аннотации"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    sources: Optional[str] = Query(default=None, description="Базы через запятую: metabolites,lipids,carbohydrates"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Аннотация списка масс по объединенному индексу метаболитов, липидов и углеводов"""
+    try:
+        if not mz_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await CompoundService.annotate(
+            session, mz_list, tol_ppm, max_candidates, adducts, ion_mode, sources
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
+
+@app.post("/annotate/formulas", response_model=FormulaAnnotationResponse, response_model_exclude_none=True)
+async def annotate_formulas(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) для аннотации"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество формул на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    expand: Optional[str] = Query(default=None, regex="^(ids|metabolites)$", description="Раскрыть изомеры: ids или metabolites"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Аннотация списка масс по брутто-формулам: один кандидат на формулу вместо каждого изомера"""
+    try:
+        if not mz_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
         
-        return AnnotationResponse(
-            items=annotation_items,
-            total_peaks=len(mz_list),
-            annotated_peaks=annotated_count
+        return await AnnotationService.annotate_formulas(
+            session, mz_list, tol_ppm, max_candidates, adducts, ion_mode, expand
         )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
 
+@app.post("/annotate/msms", response_model=MsmsAnnotationResponse)
+async def annotate_msms(
+    spectra: List[MsmsSpectrumIn] = Body(..., description="MS/MS спектры: масса прекурсора и фрагменты"),
+    precursor_tol_ppm: float = Query(default=10.0, gt=0, description="Допуск по массе прекурсора (ppm)"),
+    fragment_tol: float = Query(default=0.02, gt=0, le=1, description="Допуск по массе фрагментов (Да)"),
+    modified: bool = Query(default=False, description="Модифицированный косинус (учет сдвига массы прекурсора)"),
+    min_score: float = Query(default=0.6, ge=0, le=1, description="Минимальное косинусное сходство"),
+    min_matched_peaks: int = Query(default=3, ge=1, description="Минимум совпавших фрагментов"),
+    max_results: int = Query(default=5, ge=1, le=100, description="Максимальное количество совпадений на спектр"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации библиотечных спектров"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Поиск по спектральной библиотеке: окно по прекурсору, затем косинусное сходство фрагментов"""
+    try:
+        if not spectra:
+            raise HTTPException(status_code=400, detail="Список спектров не может быть пустым")
+        
+        return await MsmsService.annotate(
+            session, spectra, precursor_tol_ppm, fragment_tol, modified, min_score, min_matched_peaks,
+            max_results, ion_mode
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except SpectralLibraryUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Спектральная библиотека недоступна: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации MS/MS: {str(e)}")
+
+@app.post("/annotate/jobs/mz-list", response_model=AnnotationJob, status_code=202)
+async def submit_mz_list_job(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) для аннотации"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)")
+):
+    """Фоновая аннотация списка масс: возвращает идентификатор задания"""
+    if not mz_list:
+        raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+    try:
+        resolve_adducts(adducts, ion_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    
+    return await job_manager.submit_mz_list(
+        mz_list, tol_ppm=tol_ppm, max_candidates=max_candidates, adducts=adducts, ion_mode=ion_mode
+    )
+
+@app.post("/annotate/jobs/csv", response_model=AnnotationJob, status_code=202)
+async def submit_csv_job(
+    file: UploadFile = File(..., description="CSV файл с данными"),
+    mz_column: str = Query(default="mz", description="Название столбца с массами (m/z)"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)")
+):
+    """Фоновая аннотация CSV файла: возвращает идентификатор задания"""
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Файл должен быть в формате CSV")
+    try:
+        resolve_adducts(adducts, ion_mode)
+        return await job_manager.submit_csv(
+            file.file, mz_column, tol_ppm=tol_ppm, max_candidates=max_candidates,
+            adducts=adducts, ion_mode=ion_mode
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров или CSV файла: {str(e)}")
+
+@app.get("/annotate/jobs/{job_id}", response_model=AnnotationJob)
+async def get_annotation_job(job_id: str):
+    """Статус и прогресс задания аннотации"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job
+
+@app.delete("/annotate/jobs/{job_id}", response_model=dict)
+async def delete_annotation_job(job_id: str):
+    """Удаление задания аннотации и его файлов (выполняющееся задание удалить нельзя)"""
+    try:
+        deleted = job_manager.delete_job(job_id)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="Задание выполняется, удалить его можно после завершения")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return {"job_id": job_id, "deleted": True}
+
+@app.get("/annotate/jobs/{job_id}/results", response_model=AnnotationJobResults)
+async def get_annotation_job_results(
+    job_id: str,
+    offset: int = Query(default=0, ge=0, description="Смещение (номер первого пика)"),
+    limit: int = Query(default=100, ge=1, le=5000, description="Количество пиков на странице"),
+):
+    """Постраничное чтение результатов задания (доступно и во время выполнения)"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    
+    return AnnotationJobResults(
+        job_id=job.job_id,
+        status=job.status,
+        offset=offset,
+        limit=limit,
+        processed_peaks=job.processed_peaks,
+        items=await job_manager.read_results(job_id, offset, limit)
+    )
+
+@app.get("/annotate/jobs/{job_id}/download")
+async def download_annotation_job(
+    job_id: str,
+    format: str = Query(default="csv", regex="^(csv|ndjson)$", description="Формат файла")
+):
+    """Скачивание результатов завершенного задания файлом"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Задание еще не завершено (статус: {job.status})")
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return FileResponse(
+        job_manager.result_path(job_id, format),
+        media_type=media_type,
+        filename=f"annotation_{job_id}.{format}"
+    )
+
+@app.get("/annotate/cache", response_model=dict)
+async def get_annotation_cache_stats():
+    """Статистика кэша аннотации (попадания, промахи, размер)"""
+    return annotation_cache.stats()
+
+@app.delete("/annotate/cache", response_model=dict)
+async def clear_annotation_cache():
+    """Очистка кэша аннотации"""
+    annotation_cache.clear()
+    return annotation_cache.stats()
+
+@app.post("/lipids/series", response_model=KendrickSeriesResponse)
+async def annotate_lipid_series(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) пиков"),
+    tol_ppm: float = Query(default=10.0, description="Допуск в ppm для аннотации"),
+    max_candidates: int = Query(default=10, description="Максимальное количество кандидатов на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    base: str = Query(default="CH2", description="Повторяющееся звено: CH2 (длина цепи), H2 (двойные связи), C2H4O, CH2O"),
+    kmd_tol: float = Query(default=0.002, gt=0, le=0.05, description="Допуск по дефекту массы Кендрика (Да)"),
+    min_support: int = Query(default=2, ge=1, description="Минимум пиков ряда, объясняемых гомологами кандидата"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Группировка пиков в гомологические ряды (KMD) и аннотация липидов с фильтром по ряду"""
+    try:
+        if not mz_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await LipidService.annotate_series(
+            session, mz_list, tol_ppm, max_candidates, adducts, ion_mode, base, kmd_tol, min_support
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров аннотации: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка аннотации: {str(e)}")
+
+@app.get("/lipids/homologs", response_model=LipidHomologsResponse)
+async def get_lipid_homologs(
+    mass: float = Query(..., gt=0, description="Нейтральная масса липида"),
+    base: str = Query(default="CH2", description="Повторяющееся звено: CH2, H2, C2H4O, CH2O"),
+    kmd_tol: float = Query(default=0.002, gt=0, le=0.05, description="Допуск по дефекту массы Кендрика (Да)"),
+    limit: int = Query(default=100, ge=1, le=1000, description="Максимальное количество липидов"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Липиды гомологического ряда заданной массы (одинаковый дефект массы Кендрика)"""
+    try:
+        return await LipidService.get_homologs(session, mass, base, kmd_tol, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска гомологов: {str(e)}")
+
+@app.post("/carbohydrates/compositions", response_model=GlycanSearchResponse)
+async def search_glycan_compositions(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) или нейтральных масс без аддуктов"),
+    tol_ppm: float = Query(default=10.0, gt=0, le=100, description="Допуск в ppm"),
+    max_results: int = Query(default=10, ge=1, le=100, description="Максимальное количество композиций на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    max_dp: int = Query(default=12, ge=1, le=30, description="Максимальная степень полимеризации"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Перебор композиций олигосахаридов по предрассчитанной таблице масс"""
+    try:
+        if not mz_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await GlycanService.search_compositions(
+            session, mz_list, tol_ppm, max_results, adducts, ion_mode, max_dp
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска композиций: {str(e)}")
+
+@app.post("/formulas/generate", response_model=FormulaGenerationResponse)
+async def generate_formulas(
+    mz_list: List[float] = Body(..., description="Список масс (m/z) или нейтральных масс без аддуктов"),
+    tol_ppm: float = Query(default=5.0, gt=0, le=100, description="Допуск в ppm"),
+    max_results: int = Query(default=10, ge=1, le=100, description="Максимальное количество формул на пик"),
+    adducts: Optional[str] = Query(default=None, description="Аддукты через запятую, например [M+H]+,[M+Na]+"),
+    ion_mode: Optional[str] = Query(default=None, regex="^(positive|negative)$", description="Режим ионизации (набор аддуктов по умолчанию)"),
+    halogens: bool = Query(default=False, description="Учитывать Cl, Br, F"),
+    check_database: bool = Query(default=True, description="Отмечать формулы, присутствующие в базе метаболитов"),
+    unmatched_only: bool = Query(default=False, description="Генерировать формулы только для пиков без кандидатов в базе"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Генерация брутто-формул CHNOPS(+галогены) в окне ppm с фильтрами Seven Golden Rules
+
+    Покрываются нейтральные массы до FORMULA_MAX_MASS (по умолчанию 1000 Да); пики, у которых
+    все гипотезы аддуктов выше этого предела, возвращаются с out_of_range=true и без формул.
+    """
+    try:
+        if not mz_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await FormulaService.generate_for_peaks(
+            session, mz_list, tol_ppm, max_results, adducts, ion_mode, halogens, check_database, unmatched_only
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров генерации: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка генерации формул: {str(e)}")
+
+@app.get("/formulas/{formula}/isomers", response_model=List[MetaboliteOut])
+async def get_formula_isomers(
+    formula: str,
+    limit: int = Query(default=100, ge=1, le=1000, description="Максимальное количество метаболитов"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Метаболиты с заданной брутто-формулой (в любой записи формулы)"""
+    try:
+        return await AnnotationService.get_isomers(session, formula, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска изомеров: {str(e)}")
+
 @app.get("/export/csv")
 async def export_metabolites_csv(
     format: str = Query(default="csv", regex="^(csv|excel)$", description="Формат экспорта"),
@@ -451,6 +951,9 @@ async def search_enzymes(
     ec_number: Optional[str] = Query(default=None, description="EC номер"),
     page: int = Query(default=1, ge=1, description="Номер страницы"),
     page_size: int = Query(default=50, ge=1, le=200, description="Размер страницы"),
+    sort: str = Query(default="id", regex="^(id|name|mass)$", description="Сортировка: id, name или mass (молекулярная масса)"),
+    cursor: Optional[str] = Query(default=None, description="Курсор следующей страницы (next_cursor), заменяет page"),
+    count: str = Query(default="exact", regex="^(exact|estimate|none)$", description="Общее количество: exact (кэшируется), estimate или none (только has_more)"),
     session: AsyncSession = Depends(get_db)
 ):
     """Поиск ферментов по различным критериям"""
@@ -480,17 +983,17 @@ async def search_enzymes(
         if ec_number:
             query = query.where(func.lower(Enzyme.ec_number).like(f"%{ec_number.lower()}%"))
         
-        # Подсчет общего количества
-        count_result = await session.execute(select(func.count()).select_from(query.subquery()))
-        total = count_result.scalar()
+        # Общее количество: точное из кэша по фильтру, оценка или без подсчета
+        total, total_estimated = await search_total(
+            session, query, count, "enzymes",
+            normalize_filters(q=q, organism_type=organism_type, ec_number=ec_number)
+        )
         
-        # Пагинация
+        # Пагинация: по курсору (поиск по индексу) или по номеру страницы
         offset = (page - 1) * page_size
-        query = query.offset(offset).limit(page_size)
-        
-        # Выполняем запрос
-        result = await session.execute(query)
-        enzymes = result.scalars().all()
+        enzymes, next_cursor = await fetch_page(
+            session, query, Enzyme, ENZYME_SORT_KEYS[sort], page_size, cursor, offset
+        )
         
         # Формируем результат
         enzyme_list = []
@@ -521,12 +1024,43 @@ async def search_enzymes(
             "total": total,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size
+            "total_pages": (total + page_size - 1) // page_size if total is not None else None,
+            "total_estimated": total_estimated,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска ферментов: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка поиска ферментов: {str(e)}")
 
+@app.post("/enzymes/pmf", response_model=PeptideMassFingerprintResponse)
+async def peptide_mass_fingerprint(
+    mass_list: List[float] = Body(..., description="Список масс пептидов"),
+    tol_ppm: float = Query(default=20.0, gt=0, le=500, description="Допуск в ppm"),
+    missed_cleavages: Optional[int] = Query(default=None, ge=0, description="Максимум пропущенных сайтов расщепления (по умолчанию все из индекса)"),
+    mass_type: str = Query(default="mh", regex="^(mh|neutral)$", description="Тип масс: mh ([M+H]+) или neutral"),
+    max_results: int = Query(default=20, ge=1, le=200, description="Максимальное количество белков"),
+    min_hits: int = Query(default=2, ge=1, description="Минимум совпавших пиков для белка"),
+    session: AsyncSession = Depends(get_db)
+):
+    """Сопоставление масс пептидов с триптическими пептидами всех ферментов с последовательностью"""
+    try:
+        if not mass_list:
+            raise HTTPException(status_code=400, detail="Список масс не может быть пустым")
+        
+        return await PeptideService.fingerprint(
+            session, mass_list, tol_ppm, missed_cleavages, mass_type, max_results, min_hits
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка параметров поиска: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска по массовому отпечатку: {str(e)}")
+
 @app.get("/enzymes/{enzyme_id}", response_model=dict)
 async def get_enzyme(enzyme_id: int, session: AsyncSession = Depends(get_db)):
     """Получение информации о конкретном ферменте по ID"""
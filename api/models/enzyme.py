@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Text, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from api.database.base import Base
 from .associations import metabolite_enzyme
 
@@ -17,7 +17,7 @@ class Enzyme(Base):
     organism_type = Column(String(100), index=True, nullable=True)  # Тип организма (plant, animal, bacteria, etc.)
     family = Column(String(255), nullable=True)  # Семейство фермента
     description = Column(Text, nullable=True)  # Описание функции
-    molecular_weight = Column(Float, nullable=True)  # Молекулярная масса (kDa)
+    molecular_weight = Column(Float, index=True, nullable=True)  # Молекулярная масса (kDa)
     optimal_ph = Column(Float, nullable=True)  # Оптимальный pH
     optimal_temperature = Column(Float, nullable=True)  # Оптимальная температура (°C)
     brenda_id = Column(String(50), nullable=True)  # ID в BRENDA
@@ -26,6 +26,7 @@ class Enzyme(Base):
     gene_name = Column(String(100), nullable=True)  # Название гена
     tissue_specificity = Column(Text, nullable=True)  # Тканевая специфичность
     subcellular_location = Column(String(255), nullable=True)  # Субклеточная локализация
+    sequence = deferred(Column(Text, nullable=True))  # Аминокислотная последовательность (UniProt)
     
     # Relationships
     metabolites = relationship(
@@ -3,6 +3,21 @@ from .pathway import PathwayOut, PathwayCreate
 from .enzyme import EnzymeOut, EnzymeCreate  
 from .class_schema import ClassOut, ClassCreate
 from .search import SearchResponse, AnnotationResponse, AnnotationItem, AnnotationCandidate
+from .job import AnnotationJob, AnnotationJobResults
+from .formula import (
+    FormulaCandidate, FormulaGenerationItem, FormulaGenerationResponse,
+    FormulaHit, FormulaAnnotationItem, FormulaAnnotationResponse
+)
+from .compound import (
+    CompoundOut, CompoundCandidate, CompoundAnnotationItem, CompoundAnnotationResponse, MassSearchResponse
+)
+from .lipid import SeriesCandidate, SeriesPeak, KendrickSeries, KendrickSeriesResponse, LipidHomologsResponse
+from .glycan import GlycanComposition, GlycanItem, GlycanSearchResponse
+from .peptide import PeptideMatch, ProteinIdentification, PeptideMassFingerprintResponse
+from .msms import MsmsSpectrumIn, MsmsMatch, MsmsAnnotationItem, MsmsAnnotationResponse
+from .alignment import AlignedFeature, FeatureTableResponse
+from .lookup import MetaboliteLookupItem, MetaboliteLookupResponse
+from .fuzzy import FuzzyMatch, FuzzySearchResponse
 
 __all__ = [
     "MetaboliteOut",
@@ -17,5 +32,39 @@ __all__ = [
     "SearchResponse",
     "AnnotationResponse",
     "AnnotationItem",
-    "AnnotationCandidate"
+    "AnnotationCandidate",
+    "AnnotationJob",
+    "AnnotationJobResults",
+    "FormulaCandidate",
+    "FormulaGenerationItem",
+    "FormulaGenerationResponse",
+    "FormulaHit",
+    "FormulaAnnotationItem",
+    "FormulaAnnotationResponse",
+    "CompoundOut",
+    "CompoundCandidate",
+    "CompoundAnnotationItem",
+    "CompoundAnnotationResponse",
+    "MassSearchResponse",
+    "SeriesCandidate",
+    "SeriesPeak",
+    "KendrickSeries",
+    "KendrickSeriesResponse",
+    "LipidHomologsResponse",
+    "GlycanComposition",
+    "GlycanItem",
+    "GlycanSearchResponse",
+    "PeptideMatch",
+    "ProteinIdentification",
+    "PeptideMassFingerprintResponse",
+    "MsmsSpectrumIn",
+    "MsmsMatch",
+    "MsmsAnnotationItem",
+    "MsmsAnnotationResponse",
+    "AlignedFeature",
+    "FeatureTableResponse",
+    "MetaboliteLookupItem",
+    "MetaboliteLookupResponse",
+    "FuzzyMatch",
+    "FuzzySearchResponse"
 ]
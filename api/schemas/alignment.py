@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from .metabolite import MetaboliteOut
+from .search import AnnotationCandidate
+
+class AlignedFeature(BaseModel):
+    id: int
+    mz: float
+    mz_min: float
+    mz_max: float
+    rt: Optional[float] = None
+    n_samples: int
+    candidates: List[AnnotationCandidate]
+    best_match: Optional[MetaboliteOut] = None
+
+class FeatureTableResponse(BaseModel):
+    samples: List[str]
+    features: List[AlignedFeature]
+    matrix: List[List[Optional[float]]]
+    total_peaks: int
+    total_features: int
+    annotated_features: int
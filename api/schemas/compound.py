@@ -0,0 +1,37 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class CompoundOut(BaseModel):
+    source: str
+    id: int
+    name: str
+    name_ru: Optional[str] = None
+    formula: Optional[str] = None
+    exact_mass: Optional[float] = None
+    hmdb_id: Optional[str] = None
+    kegg_id: Optional[str] = None
+    chebi_id: Optional[str] = None
+    type: Optional[str] = None
+
+class CompoundCandidate(BaseModel):
+    compound: CompoundOut
+    mass_error_ppm: float
+    mass_error_da: float
+    adduct: Optional[str] = None
+
+class CompoundAnnotationItem(BaseModel):
+    mz: float
+    candidates: List[CompoundCandidate]
+    best_match: Optional[CompoundOut] = None
+
+class CompoundAnnotationResponse(BaseModel):
+    items: List[CompoundAnnotationItem]
+    total_peaks: int
+    annotated_peaks: int
+    sources: Dict[str, int] = {}
+
+class MassSearchResponse(BaseModel):
+    mass: float
+    tol_ppm: float
+    candidates: List[CompoundCandidate]
+    sources: Dict[str, int] = {}
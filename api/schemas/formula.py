@@ -0,0 +1,43 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from .metabolite import MetaboliteOut
+
+class FormulaCandidate(BaseModel):
+    formula: str
+    neutral_mass: float
+    mass_error_ppm: float
+    mass_error_da: float
+    rdbe: float
+    adduct: Optional[str] = None
+    in_database: bool = False
+    metabolite_count: int = 0
+
+class FormulaGenerationItem(BaseModel):
+    mz: float
+    candidates: List[FormulaCandidate]
+    matched: bool = False
+    out_of_range: bool = False
+
+class FormulaGenerationResponse(BaseModel):
+    items: List[FormulaGenerationItem]
+    total_peaks: int
+    generated_peaks: int
+
+class FormulaHit(BaseModel):
+    formula: Optional[str] = None
+    exact_mass: float
+    mass_error_ppm: float
+    mass_error_da: float
+    adduct: Optional[str] = None
+    metabolite_count: int
+    metabolite_ids: Optional[List[int]] = None
+    metabolites: Optional[List[MetaboliteOut]] = None
+
+class FormulaAnnotationItem(BaseModel):
+    mz: float
+    hits: List[FormulaHit]
+
+class FormulaAnnotationResponse(BaseModel):
+    items: List[FormulaAnnotationItem]
+    total_peaks: int
+    annotated_peaks: int
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List
+
+class FuzzyMatch(BaseModel):
+    source: str
+    id: int
+    name: str
+    matched_name: str
+    field: str
+    distance: int
+    similarity: float
+
+class FuzzySearchResponse(BaseModel):
+    query: str
+    normalized_query: str
+    max_edits: int
+    matches: List[FuzzyMatch]
+    total_names: int
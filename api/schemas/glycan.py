@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class GlycanComposition(BaseModel):
+    composition: str
+    residues: Dict[str, int]
+    formula: str
+    neutral_mass: float
+    dp: int
+    mass_error_ppm: float
+    mass_error_da: float
+    adduct: Optional[str] = None
+    database_matches: List[str] = []
+
+class GlycanItem(BaseModel):
+    mz: float
+    compositions: List[GlycanComposition]
+
+class GlycanSearchResponse(BaseModel):
+    items: List[GlycanItem]
+    total_peaks: int
+    matched_peaks: int
+    max_dp: int
@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from .search import AnnotationItem
+
+class AnnotationJob(BaseModel):
+    job_id: str
+    status: str  # queued|running|completed|failed|interrupted
+    source: str  # mz-list|csv
+    total_peaks: int = 0
+    processed_peaks: int = 0
+    annotated_peaks: int = 0
+    progress: float = 0.0
+    params: Dict[str, Any] = {}
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+class AnnotationJobResults(BaseModel):
+    job_id: str
+    status: str
+    offset: int
+    limit: int
+    processed_peaks: int
+    items: List[AnnotationItem]
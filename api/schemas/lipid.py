@@ -0,0 +1,36 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from .compound import CompoundOut
+
+class SeriesCandidate(BaseModel):
+    compound: CompoundOut
+    mass_error_ppm: float
+    mass_error_da: float
+    adduct: Optional[str] = None
+    series_support: int = 1
+
+class SeriesPeak(BaseModel):
+    mz: float
+    kendrick_mass: float
+    kmd: float
+    series: int
+    candidates: List[SeriesCandidate]
+
+class KendrickSeries(BaseModel):
+    series: int
+    kmd: float
+    residue: int
+    peaks: List[int]
+
+class KendrickSeriesResponse(BaseModel):
+    base: str
+    items: List[SeriesPeak]
+    series: List[KendrickSeries]
+    total_peaks: int
+    annotated_peaks: int
+
+class LipidHomologsResponse(BaseModel):
+    mass: float
+    base: str
+    kmd: float
+    lipids: List[CompoundOut]
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from .metabolite import MetaboliteOut
+
+class MetaboliteLookupItem(BaseModel):
+    identifier: str
+    matched_by: Optional[str] = None
+    metabolite: Optional[MetaboliteOut] = None
+
+class MetaboliteLookupResponse(BaseModel):
+    items: List[MetaboliteLookupItem]
+    total_identifiers: int
+    resolved: int
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class MsmsSpectrumIn(BaseModel):
+    id: Optional[str] = None
+    precursor_mz: float = Field(..., gt=0)
+    mz: List[float]
+    intensities: List[float]
+
+class MsmsMatch(BaseModel):
+    name: Optional[str] = None
+    formula: Optional[str] = None
+    inchikey: Optional[str] = None
+    precursor_type: Optional[str] = None
+    library: Optional[str] = None
+    precursor_mz: float
+    precursor_error_ppm: float
+    score: float
+    matched_peaks: int
+
+class MsmsAnnotationItem(BaseModel):
+    id: Optional[str] = None
+    precursor_mz: float
+    matches: List[MsmsMatch]
+    best_match: Optional[MsmsMatch] = None
+
+class MsmsAnnotationResponse(BaseModel):
+    items: List[MsmsAnnotationItem]
+    total_spectra: int
+    annotated_spectra: int
+    library_size: int
+    modified_cosine: bool
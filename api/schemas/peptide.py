@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class PeptideMatch(BaseModel):
+    peak: int
+    mz: float
+    peptide: str
+    start: int
+    end: int
+    missed_cleavages: int
+    mass: float
+    mass_error_ppm: float
+
+class ProteinIdentification(BaseModel):
+    enzyme_id: int
+    name: str
+    uniprot_id: Optional[str] = None
+    ec_number: Optional[str] = None
+    organism: Optional[str] = None
+    score: float
+    matched_peaks: int
+    expected_random_matches: float
+    sequence_coverage: float
+    peptides: List[PeptideMatch]
+
+class PeptideMassFingerprintResponse(BaseModel):
+    identifications: List[ProteinIdentification]
+    total_peaks: int
+    matched_peaks: int
+    proteins_searched: int
+    peptides_searched: int
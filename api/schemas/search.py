@@ -4,14 +4,19 @@ from .metabolite import MetaboliteOut
 
 class SearchResponse(BaseModel):
     metabolites: List[MetaboliteOut]
-    total: int
+    total: Optional[int] = None
     page: int = 1
     page_size: int = 50
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+    total_estimated: bool = False
 
 class AnnotationCandidate(BaseModel):
     metabolite: MetaboliteOut
     mass_error_ppm: float
     mass_error_da: float
+    adduct: Optional[str] = None
+    isotope_score: Optional[float] = None
 
 class AnnotationItem(BaseModel):
     mz: float
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+from api.services.formula import ELECTRON_MASS
+
+PROTON_MASS = 1.007276
+
+
+@dataclass(frozen=True)
+class Adduct:
+    """Ion species: m/z = (multiplier * M + mass_shift) / |charge|"""
+    name: str
+    multiplier: int
+    mass_shift: float
+    charge: int
+    # Heavy atoms added to M (protons and lost hydrogens barely affect isotope ratios)
+    composition: str = ""
+
+    @property
+    def ion_mode(self) -> str:
+        return "positive" if self.charge > 0 else "negative"
+
+
+# Common ESI adducts (Fiehn lab adduct table)
+ADDUCTS: Dict[str, Adduct] = {a.name: a for a in [
+    Adduct("[M+H]+", 1, PROTON_MASS, 1),
+    Adduct("[M+NH4]+", 1, 18.033823, 1, "NH4"),
+    Adduct("[M+Na]+", 1, 22.989218, 1, "Na"),
+    Adduct("[M+K]+", 1, 38.963158, 1, "K"),
+    Adduct("[M+H-H2O]+", 1, PROTON_MASS - 18.010565, 1),
+    Adduct("[M+2H]2+", 1, 2 * PROTON_MASS, 2),
+    Adduct("[2M+H]+", 2, PROTON_MASS, 1),
+    Adduct("[2M+Na]+", 2, 22.989218, 1, "Na"),
+    Adduct("[M]+", 1, -ELECTRON_MASS, 1),
+    Adduct("[M-H]-", 1, -PROTON_MASS, -1),
+    Adduct("[M+Cl]-", 1, 34.969402, -1, "Cl"),
+    Adduct("[M+FA-H]-", 1, 44.998201, -1, "CHO2"),
+    Adduct("[M+Hac-H]-", 1, 59.013851, -1, "C2H3O2"),
+    Adduct("[M-H2O-H]-", 1, -PROTON_MASS - 18.010565, -1),
+    Adduct("[M+Na-2H]-", 1, 20.974666, -1, "Na"),
+    Adduct("[M-2H]2-", 1, -2 * PROTON_MASS, -2),
+    Adduct("[2M-H]-", 2, -PROTON_MASS, -1),
+]}
+
+# Adducts used when only ion_mode is given
+DEFAULT_ADDUCTS = {
+    "positive": ["[M+H]+", "[M+Na]+", "[M+K]+", "[M+NH4]+"],
+    "negative": ["[M-H]-", "[M+Cl]-", "[M+FA-H]-"],
+}
+
+
+def _normalize(name: str) -> str:
+    """'[M+H]+', 'M+H' and 'm+h' all map to 'M+H'"""
+    name = name.strip().upper().replace(" ", "")
+    if name.startswith("["):
+        name = name[1:name.rindex("]")] if "]" in name else name[1:]
+    return name
+
+
+_ALIASES = {_normalize(name): adduct for name, adduct in ADDUCTS.items()}
+
+
+def resolve_adducts(
+    adducts: Optional[Union[str, Sequence[str]]] = None,
+    ion_mode: Optional[str] = None
+) -> List[Adduct]:
+    """Turn adduct names and/or an ion mode into Adduct definitions (empty list means neutral masses)"""
+    if ion_mode is not None and ion_mode not in DEFAULT_ADDUCTS:
+        raise ValueError(f"Unknown ion mode: {ion_mode}")
+
+    if isinstance(adducts, str):
+        adducts = [a for a in adducts.split(",") if a.strip()]
+    if not adducts:
+        return [ADDUCTS[name] for name in DEFAULT_ADDUCTS[ion_mode]] if ion_mode else []
+
+    resolved = []
+    for name in adducts:
+        adduct = _ALIASES.get(_normalize(name))
+        if adduct is None:
+            raise ValueError(f"Unknown adduct: {name}. Available: {', '.join(ADDUCTS)}")
+        if ion_mode and adduct.ion_mode != ion_mode:
+            raise ValueError(f"Adduct {adduct.name} does not match ion mode {ion_mode}")
+        if adduct not in resolved:
+            resolved.append(adduct)
+    return resolved
+
+
+def adduct_arrays(adducts: Sequence[Adduct]):
+    """Multiplier, mass shift and |charge| as NumPy arrays"""
+    return (
+        np.array([a.multiplier for a in adducts], dtype=np.float64),
+        np.array([a.mass_shift for a in adducts], dtype=np.float64),
+        np.array([abs(a.charge) for a in adducts], dtype=np.float64),
+    )
+
+
+def neutral_mass_matrix(mz_values: np.ndarray, adducts: Sequence[Adduct]) -> np.ndarray:
+    """peaks x adducts matrix of neutral masses M for every ion hypothesis"""
+    multiplier, shift, charge = adduct_arrays(adducts)
+    mz_values = np.asarray(mz_values, dtype=np.float64)
+    return (mz_values[:, None] * charge[None, :] - shift[None, :]) / multiplier[None, :]
+
+
+def ion_mz(masses: np.ndarray, adducts: Sequence[Adduct], adduct_index: np.ndarray) -> np.ndarray:
+    """Theoretical m/z of neutral masses observed as the given adducts"""
+    multiplier, shift, charge = adduct_arrays(adducts)
+    return (multiplier[adduct_index] * masses + shift[adduct_index]) / charge[adduct_index]
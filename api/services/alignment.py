@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+
+
+@dataclass
+class AlignedFeatures:
+    """Consensus features across samples and the sample x feature intensity matrix"""
+    mz: np.ndarray
+    mz_min: np.ndarray
+    mz_max: np.ndarray
+    rt: np.ndarray
+    n_samples: np.ndarray
+    matrix: np.ndarray
+    peak_feature: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.mz)
+
+
+def _split_on_gaps(groups: np.ndarray, values: np.ndarray, max_gap: np.ndarray) -> np.ndarray:
+    """Sweep entries sorted by (group, value) and start a new group at every gap above max_gap"""
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (groups[1:] != groups[:-1]) | (np.diff(values) > max_gap[1:])
+    return np.cumsum(starts) - 1
+
+
+def _split_wide(groups: np.ndarray, values: np.ndarray, max_width: np.ndarray) -> np.ndarray:
+    """Start a new group at every entry lying more than max_width above its group's first entry
+
+    Each pass opens a new group at the first entry of every group that is too wide, so the number
+    of passes is bounded by the most sub-groups a single chained group splits into.
+    """
+    while len(groups):
+        first = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        start = first[groups]
+        too_wide = np.flatnonzero(values - values[start] > max_width[start])
+        if not len(too_wide):
+            break
+        too_wide = too_wide[np.r_[True, groups[too_wide][1:] != groups[too_wide][:-1]]]
+        starts = np.zeros(len(groups), dtype=bool)
+        starts[first] = True
+        starts[too_wide] = True
+        groups = np.cumsum(starts) - 1
+    return groups
+
+
+def align_peaks(
+    sample: np.ndarray,
+    mz: np.ndarray,
+    intensity: Optional[np.ndarray] = None,
+    rt: Optional[np.ndarray] = None,
+    n_samples: Optional[int] = None,
+    tol_ppm: float = 10.0,
+    rt_tol: Optional[float] = None
+) -> AlignedFeatures:
+    """Group peaks of all samples into consensus features by sort-and-sweep
+
+    Peaks sorted by m/z are chained while neighbours are within tol_ppm, and a group is closed once
+    a peak lies more than tol_ppm above its first m/z, so no feature is wider than tol_ppm; with
+    retention times each m/z group is swept again by RT and split at gaps above rt_tol. A sample
+    contributes its most intense peak to a feature, the consensus m/z is the intensity-weighted mean.
+    """
+    sample = np.asarray(sample, dtype=np.int64)
+    mz = np.asarray(mz, dtype=np.float64)
+    intensity = np.ones(len(mz)) if intensity is None else np.nan_to_num(np.asarray(intensity, dtype=np.float64))
+    n_samples = int(sample.max()) + 1 if n_samples is None and len(sample) else (n_samples or 0)
+    use_rt = rt is not None and rt_tol is not None
+    if use_rt:
+        rt = np.asarray(rt, dtype=np.float64)
+
+    valid = np.isfinite(mz) & (~np.isnan(rt) if use_rt else True)
+    peak_feature = np.full(len(mz), -1, dtype=np.int64)
+    index = np.flatnonzero(valid)
+    index = index[np.argsort(mz[index], kind="stable")]
+    tolerance = mz[index] * tol_ppm / 1e6
+    groups = _split_on_gaps(np.zeros(len(index), dtype=np.int64), mz[index], tolerance)
+    groups = _split_wide(groups, mz[index], tolerance)
+    if use_rt:
+        order = np.lexsort((rt[index], groups))
+        index, groups = index[order], groups[order]
+        groups = _split_on_gaps(groups, rt[index], np.full(len(index), rt_tol))
+    peak_feature[index] = groups
+    n_features = int(groups.max()) + 1 if len(groups) else 0
+
+    labels, weights = groups, intensity[index]
+    total = np.bincount(labels, weights=weights, minlength=n_features)
+    count = np.bincount(labels, minlength=n_features)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted_mz = np.bincount(labels, weights=weights * mz[index], minlength=n_features) / total
+        mean_mz = np.bincount(labels, weights=mz[index], minlength=n_features) / np.maximum(count, 1)
+    consensus = np.where(total > 0, weighted_mz, mean_mz)
+    mz_min = np.full(n_features, np.inf)
+    mz_max = np.full(n_features, -np.inf)
+    np.minimum.at(mz_min, labels, mz[index])
+    np.maximum.at(mz_max, labels, mz[index])
+    feature_rt = np.full(n_features, np.nan)
+    if use_rt:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            feature_rt = np.bincount(labels, weights=rt[index], minlength=n_features) / np.maximum(count, 1)
+
+    # Sample x feature matrix; a feature the sample did not detect stays NaN
+    matrix = np.full((n_samples, n_features), np.nan)
+    cells = sample[index] * n_features + labels
+    flat = np.full(n_samples * n_features, -np.inf)
+    np.maximum.at(flat, cells, weights)
+    filled = np.isfinite(flat)
+    matrix.ravel()[filled] = flat[filled]
+
+    return AlignedFeatures(
+        mz=consensus,
+        mz_min=mz_min,
+        mz_max=mz_max,
+        rt=feature_rt,
+        n_samples=filled.reshape(n_samples, n_features).sum(axis=0),
+        matrix=matrix,
+        peak_feature=peak_feature
+    )
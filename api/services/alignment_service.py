@@ -0,0 +1,149 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import BinaryIO, List, Optional, Sequence, Tuple, Union
+import io
+import os
+import zipfile
+from pathlib import PurePosixPath
+import numpy as np
+import pandas as pd
+from api.schemas import AlignedFeature, FeatureTableResponse
+from api.services.annotation_service import AnnotationService
+from api.services.alignment import align_peaks
+
+# Total size (MB) of the uncompressed peak lists accepted by one batch request
+ALIGNMENT_MAX_UPLOAD_MB = int(os.getenv("ALIGNMENT_MAX_UPLOAD_MB", "100"))
+
+# Bytes read (or decompressed) per step while enforcing the upload limit
+_READ_CHUNK = 1 << 20
+
+class AlignmentService:
+
+    @staticmethod
+    def read_samples(files: Sequence[Tuple[str, Union[bytes, BinaryIO]]]) -> List[Tuple[str, pd.DataFrame]]:
+        """Sample peak lists from uploaded CSV files and ZIP archives of CSV files
+        (raises ValueError for other files, unreadable CSV or oversized uploads)
+
+        Files and archive members are read in chunks against one budget of ALIGNMENT_MAX_UPLOAD_MB,
+        so an oversized upload or a ZIP bomb is rejected before it is held in memory.
+        """
+
+        budget = [ALIGNMENT_MAX_UPLOAD_MB * 1024 * 1024]
+        tables: List[Tuple[str, bytes]] = []
+        for filename, source in files:
+            if isinstance(source, (bytes, bytearray)):
+                source = io.BytesIO(source)
+            if filename.lower().endswith(".zip"):
+                try:
+                    archive = zipfile.ZipFile(source)
+                except zipfile.BadZipFile:
+                    raise ValueError(f"{filename}: not a valid ZIP archive")
+                with archive:
+                    members = [
+                        m for m in archive.infolist()
+                        if m.filename.lower().endswith(".csv") and not PurePosixPath(m.filename).name.startswith(".")
+                    ]
+                    for member in members:
+                        # Decompressed size is counted as it is produced, not taken from the header
+                        with archive.open(member) as f:
+                            tables.append((member.filename, AlignmentService._read_limited(f, budget, filename)))
+            elif filename.lower().endswith(".csv"):
+                tables.append((filename, AlignmentService._read_limited(source, budget, filename)))
+            else:
+                raise ValueError(f"{filename}: expected a CSV file or a ZIP archive of CSV files")
+
+        samples = []
+        for filename, content in tables:
+            try:
+                df = pd.read_csv(io.BytesIO(content))
+            except Exception as e:
+                raise ValueError(f"{filename}: CSV could not be read ({e})")
+            samples.append((PurePosixPath(filename).stem, df))
+        return samples
+
+    @staticmethod
+    def _read_limited(source: BinaryIO, budget: List[int], filename: str) -> bytes:
+        """Read a file chunk by chunk, charging the shared budget and stopping as soon as it is exceeded"""
+        parts = []
+        for chunk in iter(lambda: source.read(_READ_CHUNK), b""):
+            budget[0] -= len(chunk)
+            if budget[0] < 0:
+                raise ValueError(f"{filename}: peak lists exceed {ALIGNMENT_MAX_UPLOAD_MB} MB")
+            parts.append(chunk)
+        return b"".join(parts)
+
+    @staticmethod
+    async def build_feature_table(
+        db: AsyncSession,
+        samples: Sequence[Tuple[str, pd.DataFrame]],
+        mz_column: str = "mz",
+        rt_column: str = "rt",
+        intensity_column: str = "intensity",
+        tol_ppm: float = 10.0,
+        rt_tol: Optional[float] = None,
+        min_samples: int = 1,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None
+    ) -> FeatureTableResponse:
+        """Align peaks of all samples into consensus features and annotate every feature once
+        (raises ValueError for missing columns or unknown adducts)
+
+        Without rt_tol features are grouped by m/z only. Samples without an intensity column
+        contribute 1.0 for every detected feature (a presence matrix).
+        """
+
+        sample_ids, mz_parts, rt_parts, intensity_parts = [], [], [], []
+        for i, (name, df) in enumerate(samples):
+            if mz_column not in df.columns:
+                raise ValueError(f"Sample {name}: column '{mz_column}' not found. Available: {', '.join(df.columns)}")
+            if rt_tol is not None and rt_column not in df.columns:
+                raise ValueError(f"Sample {name}: column '{rt_column}' is required for RT alignment")
+            mz = pd.to_numeric(df[mz_column], errors="coerce").to_numpy(dtype=np.float64)
+            sample_ids.append(np.full(len(mz), i, dtype=np.int64))
+            mz_parts.append(mz)
+            rt_parts.append(
+                pd.to_numeric(df[rt_column], errors="coerce").to_numpy(dtype=np.float64)
+                if rt_tol is not None else np.full(len(mz), np.nan)
+            )
+            intensity_parts.append(
+                pd.to_numeric(df[intensity_column], errors="coerce").to_numpy(dtype=np.float64)
+                if intensity_column in df.columns else np.ones(len(mz))
+            )
+
+        def joined(parts, dtype):
+            return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        features = align_peaks(
+            joined(sample_ids, np.int64), joined(mz_parts, np.float64), joined(intensity_parts, np.float64),
+            joined(rt_parts, np.float64) if rt_tol is not None else None,
+            len(samples), tol_ppm, rt_tol
+        )
+        keep = np.flatnonzero(features.n_samples >= min_samples)
+
+        # One annotation per consensus feature, however many samples detected it
+        annotation = await AnnotationService.annotate_mz_list(
+            db, features.mz[keep].tolist(), tol_ppm, max_candidates, adducts, ion_mode
+        )
+
+        items = []
+        for feature_id, (j, item) in enumerate(zip(keep.tolist(), annotation.items)):
+            items.append(AlignedFeature(
+                id=feature_id,
+                mz=round(float(features.mz[j]), 6),
+                mz_min=round(float(features.mz_min[j]), 6),
+                mz_max=round(float(features.mz_max[j]), 6),
+                rt=None if np.isnan(features.rt[j]) else round(float(features.rt[j]), 4),
+                n_samples=int(features.n_samples[j]),
+                candidates=item.candidates,
+                best_match=item.best_match
+            ))
+
+        matrix = features.matrix[:, keep]
+        return FeatureTableResponse(
+            samples=[name for name, _ in samples],
+            features=items,
+            matrix=[[None if np.isnan(v) else v for v in row] for row in matrix.tolist()],
+            total_peaks=int(sum(len(m) for m in mz_parts)),
+            total_features=len(items),
+            annotated_features=annotation.annotated_peaks
+        )
@@ -0,0 +1,177 @@
+import os
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.services.data_version import VersionedIndex
+from api.services.mass_index import MassMatches
+
+# Maximum number of cached peaks (0 disables the cache)
+ANNOTATION_CACHE_SIZE = int(os.getenv("ANNOTATION_CACHE_SIZE", "200000"))
+
+# Width of an m/z cache bin as a fraction of the tolerance
+ANNOTATION_CACHE_RESOLUTION = float(os.getenv("ANNOTATION_CACHE_RESOLUTION", "0.1"))
+
+# A bin is filled with this many times max_candidates, so every peak of the bin keeps its own top candidates
+ANNOTATION_CACHE_OVERFETCH = int(os.getenv("ANNOTATION_CACHE_OVERFETCH", "4"))
+
+# Candidates of one bin: ids, neutral masses, theoretical ion m/z, adduct names (or None)
+CacheEntry = Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]
+
+
+async def _new_generation(db: AsyncSession) -> object:
+    return object()
+
+
+class AnnotationCache:
+    """LRU cache of candidates per m/z bin, keyed by quantized m/z, search parameters and data version
+
+    An entry holds every candidate within the tolerance of any m/z in its bin, so each peak gets the
+    same candidates as an uncached search after filtering and re-ranking against its exact m/z.
+    """
+
+    def __init__(self, max_entries: int = ANNOTATION_CACHE_SIZE, resolution: float = ANNOTATION_CACHE_RESOLUTION):
+        self.max_entries = max_entries
+        self.resolution = resolution
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        # A new generation object is built whenever the metabolites table changes
+        self._generations = VersionedIndex(_new_generation)
+        self._generation = None
+        # Structure whose positional ids (formula group numbers) the entries refer to
+        self._source = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def ttl(self) -> float:
+        """Seconds between data version checks"""
+        return self._generations.ttl
+
+    @ttl.setter
+    def ttl(self, value: float) -> None:
+        self._generations.ttl = value
+
+    async def sync(self, db: AsyncSession, source: Optional[object] = None) -> None:
+        """Drop every entry if an importer rewrote the metabolites table, or if source (the index
+        whose positional ids are cached) is not the one the entries were built from"""
+        generation = await self._generations.get(db)
+        if generation is not self._generation or (source is not None and source is not self._source):
+            self._entries.clear()
+            self._generation = generation
+        if source is not None:
+            self._source = source
+
+    def keys(self, mz_values: np.ndarray, params: Hashable, tol_ppm: float) -> List[Optional[Hashable]]:
+        """Cache keys per peak; bins are equal in ppm, so log(m/z) is quantized (None for invalid m/z)"""
+        step = tol_ppm * 1e-6 * self.resolution
+        valid = np.isfinite(mz_values) & (mz_values > 0)
+        bins = np.zeros(len(mz_values), dtype=np.int64)
+        if step > 0:
+            bins[valid] = np.floor(np.log(mz_values[valid]) / step).astype(np.int64)
+        return [(params, b) if ok and step > 0 else None for b, ok in zip(bins.tolist(), valid.tolist())]
+
+    def fill_window(self, key: Hashable, tol_ppm: float) -> Tuple[float, float]:
+        """Center m/z and tolerance (ppm) of a search covering the windows of every m/z in a bin"""
+        step = tol_ppm * 1e-6 * self.resolution
+        center = float(np.exp((key[1] + 0.5) * step))
+        # Half a bin on each side plus the tolerance, with the other half bin as margin
+        return center, tol_ppm * (1 + self.resolution)
+
+    def get(self, key: Optional[Hashable]) -> Optional[CacheEntry]:
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Optional[Hashable], entry: CacheEntry) -> None:
+        if key is None or not self.enabled:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generations.invalidate()
+        self._generation = None
+        self._source = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "resolution": self.resolution,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "data_version": self._generations.version,
+        }
+
+
+def split_matches(matches: MassMatches, mz_values: np.ndarray) -> List[CacheEntry]:
+    """Per-peak cache entries from flat matches of the given peaks"""
+    bounds = np.searchsorted(matches.query_index, np.arange(len(mz_values) + 1))
+    ion_mz = matches.error_da + mz_values[matches.query_index]
+    entries = []
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        entries.append((
+            matches.ids[start:stop],
+            matches.masses[start:stop],
+            ion_mz[start:stop],
+            matches.adducts[start:stop] if matches.adducts is not None else None,
+        ))
+    return entries
+
+
+def assemble_matches(
+    mz_values: np.ndarray,
+    entries: Sequence[CacheEntry],
+    tol_ppm: float,
+    max_candidates: int,
+    with_adducts: bool
+) -> MassMatches:
+    """Flat matches for the given peaks with errors recomputed against their exact m/z"""
+    counts = np.array([len(entry[0]) for entry in entries], dtype=np.int64)
+    if counts.sum() == 0:
+        return MassMatches.empty()
+
+    peak = np.repeat(np.arange(len(entries)), counts)
+    ion_mz = np.concatenate([entry[2] for entry in entries])
+    error_da = ion_mz - mz_values[peak]
+    error_ppm = error_da / mz_values[peak] * 1e6
+
+    # A bin covers the windows of all its m/z values: drop candidates outside this peak's
+    # tolerance, re-rank within the peak and keep its top max_candidates
+    inside = np.flatnonzero(np.abs(error_ppm) <= tol_ppm * (1 + 1e-9))
+    order = inside[np.lexsort((np.abs(error_ppm[inside]), peak[inside]))]
+    rank = np.arange(len(order)) - np.searchsorted(peak[order], peak[order], side="left")
+    order, rank = order[rank < max_candidates], rank[rank < max_candidates]
+    peak = peak[order]
+    adducts = None
+    if with_adducts:
+        adducts = np.concatenate([entry[3] for entry in entries])[order]
+    return MassMatches(
+        query_index=peak,
+        ids=np.concatenate([entry[0] for entry in entries])[order],
+        masses=np.concatenate([entry[1] for entry in entries])[order],
+        error_da=error_da[order],
+        error_ppm=error_ppm[order],
+        rank=rank,
+        adducts=adducts
+    )
+
+
+annotation_cache = AnnotationCache()
@@ -1,11 +1,46 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List
+from sqlalchemy import text
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Sequence, Union
+import asyncio
+import csv
+import json
+import os
+import numpy as np
 import pandas as pd
 import io
-from api.models import Metabolite
-from api.schemas import AnnotationResponse, AnnotationItem, AnnotationCandidate, MetaboliteOut
+from api.schemas import (
+    AnnotationResponse, AnnotationItem, AnnotationCandidate, MetaboliteOut,
+    FormulaAnnotationResponse, FormulaAnnotationItem, FormulaHit
+)
+from api.services.annotation_cache import (
+    ANNOTATION_CACHE_OVERFETCH, annotation_cache, split_matches, assemble_matches
+)
+from api.services.isotopes import get_isotope_index, envelope_terms, envelope_from_terms, isotope_scores
+from api.services.adducts import ADDUCTS, Adduct, resolve_adducts, neutral_mass_matrix, adduct_arrays, ion_mz
+from api.services.mass_index import MassIndex, MassMatches, get_mass_index
+from api.services.formula_index import FormulaIndex, get_formula_index
 from api.services.metabolite_service import MetaboliteService
+from api.services.sharded_search import use_process_pool, search_sharded
+
+# "index" keeps all masses in RAM, "sql" ranks candidates in the database
+# ("formula" is used internally for formula-level annotation)
+ANNOTATION_ENGINE = os.getenv("ANNOTATION_ENGINE", "index")
+
+# Peaks per statement in the batched SQL mode (4 bound parameters per peak)
+SQL_BATCH_SIZE = int(os.getenv("ANNOTATION_SQL_BATCH_SIZE", "2000"))
+
+# With isotope scoring, this many times max_candidates are searched before re-ranking
+ISOTOPE_CANDIDATE_FACTOR = int(os.getenv("ANNOTATION_ISOTOPE_CANDIDATE_FACTOR", "5"))
+
+# CSV columns with the monoisotopic, M+1 and M+2 peak intensities
+ISOTOPE_COLUMNS = ("intensity", "intensity_m1", "intensity_m2")
+
+# Columns of the flat CSV produced by streaming annotation
+STREAM_CSV_COLUMNS = [
+    "row", "mz", "rank", "metabolite_id", "name", "formula", "exact_mass",
+    "adduct", "mass_error_ppm", "mass_error_da", "hmdb_id", "kegg_id", "chebi_id", "pubchem_cid",
+    "isotope_score"
+]
 
 class AnnotationService:
     
@@ -14,35 +49,119 @@ class AnnotationService:
         db: AsyncSession,
         mz_values: List[float],
         tol_ppm: float = 10.0,
-        max_candidates: int = 10
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        isotopes: Optional[np.ndarray] = None
     ) -> AnnotationResponse:
-        """Annotate a list of m/z values"""
+        """Annotate a list of m/z values (raises ValueError for unknown adducts)
         
-        items = []
-        annotated_count = 0
+        isotopes holds observed (M+1/M0, M+2/M0) ratios per peak; candidates are then ranked by isotope score.
+        """
         
-        for mz in mz_values:
-            candidates = await AnnotationService._find_candidates(
-                db, mz, tol_ppm, max_candidates
-            )
-            
-            best_match = None
-            if candidates:
-                best_match = candidates[0].metabolite
-                annotated_count += 1
-            
-            items.append(AnnotationItem(
-                mz=mz,
-                candidates=candidates,
-                best_match=best_match
-            ))
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        matches = await AnnotationService.annotate_matches(
+            db, mz_array, tol_ppm, max_candidates, adducts, ion_mode, isotopes
+        )
+        metabolites = await AnnotationService._load_metabolites(db, np.unique(matches.ids))
         
-        return AnnotationResponse(
+        return AnnotationService._build_response(mz_array, matches, metabolites)
+    
+    @staticmethod
+    async def annotate_matches(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        isotopes: Optional[np.ndarray] = None
+    ) -> MassMatches:
+        """Flat candidate matches for columnar responses (no metabolite objects are built)"""
+        
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        scoring = isotopes is not None and bool(np.isfinite(isotopes).any())
+        search_k = max_candidates * ISOTOPE_CANDIDATE_FACTOR if scoring else max_candidates
+        matches = await AnnotationService._find_candidates(
+            db, mz_array, tol_ppm, search_k, adducts=adducts, ion_mode=ion_mode
+        )
+        if scoring:
+            matches = await AnnotationService._score_isotopes(db, matches, isotopes, max_candidates)
+        return matches
+    
+    @staticmethod
+    async def annotate_formulas(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        expand: Optional[str] = None
+    ) -> FormulaAnnotationResponse:
+        """Formula-level annotation: one hit per (formula, mass) group instead of one per isomer
+        
+        expand="ids" adds the metabolite ids of every hit, expand="metabolites" the full records.
+        """
+        
+        if expand not in (None, "ids", "metabolites"):
+            raise ValueError(f"Unknown expand mode: {expand}")
+        
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        # Group numbers in the matches are only meaningful for the index they were searched in
+        index = await get_formula_index(db)
+        matches = await AnnotationService._find_candidates(
+            db, mz_array, tol_ppm, max_candidates, engine="formula", adducts=adducts, ion_mode=ion_mode,
+            formula_index=index
+        )
+        
+        groups = matches.ids.tolist()
+        counts = index.counts(matches.ids).tolist()
+        metabolites = {}
+        if expand == "metabolites":
+            metabolites = await AnnotationService._load_metabolites(db, np.unique(index.expand(np.unique(matches.ids))))
+        
+        bounds = np.searchsorted(matches.query_index, np.arange(len(mz_array) + 1))
+        error_ppm = matches.error_ppm.tolist()
+        error_da = matches.error_da.tolist()
+        adduct_names = matches.adducts.tolist() if matches.adducts is not None else [None] * len(groups)
+        
+        items = []
+        for peak, mz in enumerate(mz_array.tolist()):
+            hits = []
+            for j in range(bounds[peak], bounds[peak + 1]):
+                group = groups[j]
+                hit = FormulaHit(
+                    formula=index.formulas[group],
+                    exact_mass=round(float(index.masses[group]), 6),
+                    mass_error_ppm=round(error_ppm[j], 2),
+                    mass_error_da=round(error_da[j], 6),
+                    adduct=adduct_names[j],
+                    metabolite_count=counts[j]
+                )
+                if expand is not None:
+                    members = index.members(group).tolist()
+                    hit.metabolite_ids = members
+                    if expand == "metabolites":
+                        hit.metabolites = [metabolites[i] for i in members if i in metabolites]
+                hits.append(hit)
+            items.append(FormulaAnnotationItem(mz=round(mz, 6), hits=hits))
+        
+        return FormulaAnnotationResponse(
             items=items,
-            total_peaks=len(mz_values),
-            annotated_peaks=annotated_count
+            total_peaks=len(mz_array),
+            annotated_peaks=sum(1 for item in items if item.hits)
         )
     
+    @staticmethod
+    async def get_isomers(db: AsyncSession, formula: str, limit: int = 100) -> List[MetaboliteOut]:
+        """Metabolites sharing a formula (lazy expansion of a formula-level hit)"""
+        
+        index = await get_formula_index(db)
+        ids = index.isomers(formula)[:limit]
+        metabolites = await AnnotationService._load_metabolites(db, ids)
+        return [metabolites[i] for i in ids.tolist() if i in metabolites]
+    
     @staticmethod
     async def annotate_csv_data(
         db: AsyncSession,
@@ -63,47 +182,425 @@ class AnnotationService:
         mz_values = df[mz_column].astype(float).tolist()
         
         return await AnnotationService.annotate_mz_list(
-            db, mz_values, tol_ppm, max_candidates
+            db, mz_values, tol_ppm, max_candidates, isotopes=AnnotationService.isotope_ratios(df)
         )
     
+    @staticmethod
+    def open_csv_chunks(
+        source: BinaryIO,
+        mz_column: str = "mz",
+        chunk_size: int = 5000,
+        extra_columns: Sequence[str] = ()
+    ):
+        """Chunked CSV reader that parses only the m/z column and those extra columns that exist
+        (raises ValueError if the m/z column is missing)"""
+        
+        usecols = [mz_column]
+        if extra_columns:
+            header = pd.read_csv(source, nrows=0).columns
+            source.seek(0)
+            usecols += [c for c in extra_columns if c in header and c != mz_column]
+        return pd.read_csv(source, usecols=usecols, chunksize=chunk_size)
+    
+    @staticmethod
+    def isotope_ratios(df: pd.DataFrame, columns: Sequence[str] = ISOTOPE_COLUMNS) -> Optional[np.ndarray]:
+        """Observed (M+1/M0, M+2/M0) ratios per row, None if the CSV has no isotope intensities"""
+        
+        intensity_column, m1_column, m2_column = columns
+        if intensity_column not in df.columns or (m1_column not in df.columns and m2_column not in df.columns):
+            return None
+        
+        def numeric(column):
+            if column not in df.columns:
+                return np.full(len(df), np.nan)
+            return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+        
+        base = numeric(intensity_column)
+        base = np.where(base > 0, base, np.nan)
+        return np.column_stack([numeric(m1_column) / base, numeric(m2_column) / base])
+    
+    @staticmethod
+    async def stream_csv_annotations(
+        db: AsyncSession,
+        chunks,
+        mz_column: str = "mz",
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        output_format: str = "ndjson",
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        isotope_columns: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[bytes]:
+        """Annotate CSV chunks as they are read and yield NDJSON lines or flat CSV rows"""
+        
+        iterator = iter(chunks)
+        row_offset = 0
+        
+        if output_format == "csv":
+            yield (",".join(STREAM_CSV_COLUMNS) + "\n").encode("utf-8")
+        
+        while True:
+            # Parsing is blocking I/O, keep it off the event loop
+            df = await asyncio.to_thread(next, iterator, None)
+            if df is None:
+                break
+            
+            mz_values = pd.to_numeric(df[mz_column], errors="coerce").to_numpy(dtype=np.float64)
+            isotopes = AnnotationService.isotope_ratios(df, isotope_columns) if isotope_columns else None
+            response = await AnnotationService.annotate_mz_list(
+                db, mz_values, tol_ppm, max_candidates, adducts, ion_mode, isotopes
+            )
+            
+            if output_format == "csv":
+                yield AnnotationService._items_to_csv(response.items, row_offset)
+            else:
+                yield AnnotationService._items_to_ndjson(response.items, row_offset)
+            
+            row_offset += len(mz_values)
+    
+    @staticmethod
+    def _items_to_ndjson(items: List[AnnotationItem], row_offset: int = 0) -> bytes:
+        """Serialize annotation items as one JSON object per line"""
+        
+        lines = []
+        for row, item in enumerate(items, start=row_offset):
+            payload = item.model_dump(mode="json")
+            payload["row"] = row
+            if np.isnan(item.mz):
+                payload["mz"] = None
+            lines.append(json.dumps(payload, ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+    
+    @staticmethod
+    def _items_to_csv(items: List[AnnotationItem], row_offset: int = 0) -> bytes:
+        """Flatten annotation items into one CSV row per candidate (or per unmatched peak)"""
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for row, item in enumerate(items, start=row_offset):
+            if not item.candidates:
+                mz = "" if np.isnan(item.mz) else item.mz
+                writer.writerow([row, mz] + [""] * (len(STREAM_CSV_COLUMNS) - 2))
+                continue
+            for rank, candidate in enumerate(item.candidates):
+                metabolite = candidate.metabolite
+                writer.writerow([
+                    row, item.mz, rank, metabolite.id, metabolite.name, metabolite.formula,
+                    metabolite.exact_mass, candidate.adduct, candidate.mass_error_ppm, candidate.mass_error_da,
+                    metabolite.hmdb_id, metabolite.kegg_id, metabolite.chebi_id, metabolite.pubchem_cid,
+                    candidate.isotope_score
+                ])
+        return buffer.getvalue().encode("utf-8")
+    
     @staticmethod
     async def _find_candidates(
         db: AsyncSession,
-        mz: float,
+        mz_values: np.ndarray,
         tol_ppm: float,
+        max_candidates: int,
+        engine: Optional[str] = None,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        formula_index: Optional[FormulaIndex] = None
+    ) -> MassMatches:
+        """Find metabolite candidates for every m/z value, served from the annotation cache when possible
+        
+        With engine="formula" the ids are group numbers of formula_index (the shared index if omitted).
+        """
+        
+        mz_values = np.asarray(mz_values, dtype=np.float64)
+        adduct_list = resolve_adducts(adducts, ion_mode)
+        if (engine or ANNOTATION_ENGINE) == "formula" and formula_index is None:
+            formula_index = await get_formula_index(db)
+        index = formula_index.mass_index if formula_index is not None else None
+        if not annotation_cache.enabled or len(mz_values) == 0:
+            return await AnnotationService._search_candidates(
+                db, mz_values, tol_ppm, max_candidates, adduct_list, engine, index
+            )
+        
+        await annotation_cache.sync(db, formula_index)
+        params = (float(tol_ppm), int(max_candidates), tuple(a.name for a in adduct_list), engine or ANNOTATION_ENGINE)
+        keys = annotation_cache.keys(mz_values, params, tol_ppm)
+        entries = [annotation_cache.get(key) for key in keys]
+        
+        # Missing bins are filled once each, with a window covering every m/z of the bin
+        missing_keys = list(dict.fromkeys(key for key, entry in zip(keys, entries) if entry is None and key is not None))
+        filled = {}
+        if missing_keys:
+            windows = [annotation_cache.fill_window(key, tol_ppm) for key in missing_keys]
+            centers = np.array([center for center, _ in windows])
+            fill_limit = max_candidates * ANNOTATION_CACHE_OVERFETCH
+            fresh = await AnnotationService._search_candidates(
+                db, centers, windows[0][1], fill_limit, adduct_list, engine, index
+            )
+            for key, entry in zip(missing_keys, split_matches(fresh, centers)):
+                # A bin that hit the fill limit may lack candidates of some of its peaks
+                if len(entry[0]) < fill_limit:
+                    filled[key] = entry
+                    annotation_cache.put(key, entry)
+        for i, key in enumerate(keys):
+            if entries[i] is None and key in filled:
+                entries[i] = filled[key]
+        
+        exact = np.array([i for i, entry in enumerate(entries) if entry is None], dtype=np.int64)
+        if len(exact):
+            # Invalid m/z values and crowded bins are searched per peak without caching
+            fresh = await AnnotationService._search_candidates(
+                db, mz_values[exact], tol_ppm, max_candidates, adduct_list, engine, index
+            )
+            for i, entry in zip(exact.tolist(), split_matches(fresh, mz_values[exact])):
+                entries[i] = entry
+        
+        return assemble_matches(mz_values, entries, tol_ppm, max_candidates, bool(adduct_list))
+    
+    @staticmethod
+    async def _search_candidates(
+        db: AsyncSession,
+        mz_values: np.ndarray,
+        tol_ppm: float,
+        max_candidates: int,
+        adduct_list: List[Adduct],
+        engine: Optional[str] = None,
+        index: Optional[MassIndex] = None
+    ) -> MassMatches:
+        """Search candidates for every m/z value, optionally under several adduct hypotheses
+        
+        index replaces the engine's own mass index (e.g. the merged cross-database index).
+        """
+        
+        if not adduct_list:
+            # Raw m/z compared directly with neutral exact masses
+            delta = mz_values * tol_ppm / 1e6
+            return await AnnotationService._search_windows(
+                db, mz_values, mz_values - delta, mz_values + delta, max_candidates, engine, index
+            )
+        
+        # Expand every peak into a peaks x adducts matrix of neutral masses and search it in one pass
+        n_adducts = len(adduct_list)
+        multiplier, _, charge = adduct_arrays(adduct_list)
+        centers = neutral_mass_matrix(mz_values, adduct_list)
+        half_width = (mz_values * tol_ppm / 1e6)[:, None] * charge[None, :] / multiplier[None, :]
+        hits = await AnnotationService._search_windows(
+            db, centers.ravel(), (centers - half_width).ravel(), (centers + half_width).ravel(),
+            max_candidates, engine, index
+        )
+        if len(hits) == 0:
+            return hits
+        
+        # Errors are reported in m/z space and candidates re-ranked per peak across adducts
+        peak = hits.query_index // n_adducts
+        adduct_index = hits.query_index % n_adducts
+        error_da = ion_mz(hits.masses, adduct_list, adduct_index) - mz_values[peak]
+        error_ppm = error_da / mz_values[peak] * 1e6
+        
+        order = np.lexsort((np.abs(error_ppm), peak))
+        peak, adduct_index, error_da, error_ppm = peak[order], adduct_index[order], error_da[order], error_ppm[order]
+        starts = np.searchsorted(peak, peak, side="left")
+        rank = np.arange(len(peak)) - starts
+        keep = rank < max_candidates
+        
+        names = np.array([a.name for a in adduct_list], dtype=object)
+        return MassMatches(
+            query_index=peak[keep],
+            ids=hits.ids[order][keep],
+            masses=hits.masses[order][keep],
+            error_da=error_da[keep],
+            error_ppm=error_ppm[keep],
+            rank=rank[keep],
+            adducts=names[adduct_index[keep]]
+        )
+    
+    @staticmethod
+    async def _score_isotopes(
+        db: AsyncSession,
+        matches: MassMatches,
+        isotopes: np.ndarray,
+        max_candidates: int
+    ) -> MassMatches:
+        """Score candidates against observed isotope ratios and re-rank each peak by score, then mass error"""
+        
+        if len(matches) == 0:
+            return matches
+        
+        index = await get_isotope_index(db)
+        terms = index.terms(matches.ids)
+        if matches.adducts is not None:
+            # Ion envelope = multiplier * M plus the atoms brought by the adduct
+            names = matches.adducts.tolist()
+            species = [ADDUCTS[name] for name in names]
+            multiplier = np.array([a.multiplier for a in species], dtype=np.float64)
+            adduct_terms = envelope_terms([a.composition for a in species])
+            terms = terms * multiplier[:, None] + np.nan_to_num(adduct_terms)
+        m1, m2 = envelope_from_terms(terms)
+        
+        observed = np.asarray(isotopes, dtype=np.float64)[matches.query_index]
+        score = isotope_scores(observed, m1, m2)
+        
+        peak = matches.query_index
+        order = np.lexsort((np.abs(matches.error_ppm), -np.nan_to_num(score, nan=-1.0), peak))
+        peak = peak[order]
+        rank = np.arange(len(peak)) - np.searchsorted(peak, peak, side="left")
+        keep = order[rank < max_candidates]
+        return MassMatches(
+            query_index=matches.query_index[keep],
+            ids=matches.ids[keep],
+            masses=matches.masses[keep],
+            error_da=matches.error_da[keep],
+            error_ppm=matches.error_ppm[keep],
+            rank=rank[rank < max_candidates],
+            adducts=matches.adducts[keep] if matches.adducts is not None else None,
+            isotope_score=score[keep]
+        )
+    
+    @staticmethod
+    async def _search_windows(
+        db: AsyncSession,
+        centers: np.ndarray,
+        low: np.ndarray,
+        high: np.ndarray,
+        max_candidates: int,
+        engine: Optional[str] = None,
+        index: Optional[MassIndex] = None
+    ) -> MassMatches:
+        """Top-k exact masses closest to each center inside its [low, high] window"""
+        
+        engine = engine or ANNOTATION_ENGINE
+        if index is None:
+            if engine == "sql":
+                return await AnnotationService._find_candidates_batched(db, centers, low, high, max_candidates)
+            if engine == "formula":
+                # Entries are (formula, mass) groups; ids in the result are group numbers
+                index = (await get_formula_index(db)).mass_index
+            elif engine == "index":
+                index = await get_mass_index(db)
+            else:
+                raise ValueError(f"Unknown annotation engine: {engine}")
+        
+        if use_process_pool(len(centers)):
+            return await search_sharded(index, centers, low, high, max_candidates)
+        return index.search_windows(centers, low, high, max_candidates)
+    
+    @staticmethod
+    async def _find_candidates_batched(
+        db: AsyncSession,
+        centers: np.ndarray,
+        low: np.ndarray,
+        high: np.ndarray,
         max_candidates: int
-    ) -> List[AnnotationCandidate]:
-        """Find metabolite candidates for a given m/z value"""
-        
-        delta = mz * tol_ppm / 1e6
-        low, high = mz - delta, mz + delta
-        
-        # Find metabolites within mass tolerance
-        stmt = (
-            select(Metabolite)
-            .where(Metabolite.exact_mass.between(low, high))
-            .order_by(func.abs(Metabolite.exact_mass - mz))
-            .limit(max_candidates)
+    ) -> MassMatches:
+        """Rank top-k candidates per window in the database, one statement per chunk of windows"""
+        
+        centers = np.asarray(centers, dtype=np.float64)
+        columns = {name: [] for name in ("query_index", "ids", "masses", "error_da", "rank")}
+        
+        for start in range(0, len(centers), SQL_BATCH_SIZE):
+            stop = start + SQL_BATCH_SIZE
+            rows = []
+            params = {"max_candidates": max_candidates}
+            for i, (mz, lo, hi) in enumerate(zip(
+                centers[start:stop].tolist(), low[start:stop].tolist(), high[start:stop].tolist()
+            )):
+                rows.append(
+                    f"(CAST(:p{i} AS INTEGER), CAST(:m{i} AS FLOAT), "
+                    f"CAST(:lo{i} AS FLOAT), CAST(:hi{i} AS FLOAT))"
+                )
+                params.update({f"p{i}": start + i, f"m{i}": mz, f"lo{i}": lo, f"hi{i}": hi})
+            
+            stmt = text(f"""
+                WITH peaks(peak, mz, low, high) AS (VALUES {", ".join(rows)}),
+                ranked AS (
+                    SELECT peaks.peak AS peak,
+                           metabolites.id AS id,
+                           metabolites.exact_mass AS exact_mass,
+                           metabolites.exact_mass - peaks.mz AS error_da,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY peaks.peak
+                               ORDER BY abs(metabolites.exact_mass - peaks.mz), metabolites.exact_mass, metabolites.id
+                           ) AS rn
+                    FROM peaks
+                    JOIN metabolites ON metabolites.exact_mass BETWEEN peaks.low AND peaks.high
+                )
+                SELECT peak, id, exact_mass, error_da, rn - 1 FROM ranked
+                WHERE rn <= :max_candidates
+                ORDER BY peak, rn
+            """)
+            result = await db.execute(stmt, params)
+            for peak, metabolite_id, exact_mass, error_da, rank in result.all():
+                columns["query_index"].append(peak)
+                columns["ids"].append(metabolite_id)
+                columns["masses"].append(exact_mass)
+                columns["error_da"].append(error_da)
+                columns["rank"].append(rank)
+        
+        if not columns["ids"]:
+            return MassMatches.empty()
+        
+        query_index = np.asarray(columns["query_index"], dtype=np.int64)
+        error_da = np.asarray(columns["error_da"], dtype=np.float64)
+        return MassMatches(
+            query_index=query_index,
+            ids=np.asarray(columns["ids"], dtype=np.int64),
+            masses=np.asarray(columns["masses"], dtype=np.float64),
+            error_da=error_da,
+            error_ppm=error_da / centers[query_index] * 1e6,
+            rank=np.asarray(columns["rank"], dtype=np.int64)
         )
+    
+    @staticmethod
+    async def _load_metabolites(db: AsyncSession, ids: np.ndarray) -> Dict[int, MetaboliteOut]:
+        """Fetch and convert candidate metabolites in bulk"""
+        
+        metabolites = await MetaboliteService.get_metabolites_by_ids(db, [int(i) for i in ids])
+        converted = await MetaboliteService.convert_many(db, metabolites)
+        return {metabolite.id: metabolite for metabolite in converted}
+    
+    @staticmethod
+    def _build_response(
+        mz_values: np.ndarray,
+        matches: MassMatches,
+        metabolites: Dict[int, MetaboliteOut]
+    ) -> AnnotationResponse:
+        """Group flat matches by peak into the nested annotation response"""
+        
+        bounds = np.searchsorted(matches.query_index, np.arange(len(mz_values) + 1))
+        ids = matches.ids.tolist()
+        error_ppm = matches.error_ppm.tolist()
+        error_da = matches.error_da.tolist()
+        adducts = matches.adducts.tolist() if matches.adducts is not None else [None] * len(ids)
+        scores = matches.isotope_score.tolist() if matches.isotope_score is not None else [None] * len(ids)
+        
+        items = []
+        annotated_count = 0
         
-        result = await db.execute(stmt)
-        metabolites = result.scalars().all()
-        
-        candidates = []
-        for metabolite in metabolites:
-            if metabolite.exact_mass is not None:
-                mass_error_da = abs(metabolite.exact_mass - mz)
-                mass_error_ppm = (mass_error_da / mz) * 1e6
-                
-                metabolite_out = await MetaboliteService.convert_to_schema(db, metabolite)
-                
+        for peak, mz in enumerate(mz_values.tolist()):
+            candidates = []
+            for j in range(bounds[peak], bounds[peak + 1]):
+                metabolite = metabolites.get(ids[j])
+                if metabolite is None:
+                    continue
                 candidates.append(AnnotationCandidate(
-                    metabolite=metabolite_out,
-                    mass_error_ppm=mass_error_ppm,
-                    mass_error_da=mass_error_da
+                    metabolite=metabolite,
+                    mass_error_ppm=round(error_ppm[j], 2),
+                    mass_error_da=round(error_da[j], 6),
+                    adduct=adducts[j],
+                    isotope_score=None if scores[j] is None or np.isnan(scores[j]) else round(scores[j], 4)
                 ))
+            
+            best_match = candidates[0].metabolite if candidates else None
+            if best_match:
+                annotated_count += 1
+            
+            items.append(AnnotationItem(
+                mz=round(mz, 6),
+                candidates=candidates,
+                best_match=best_match
+            ))
         
-        return candidates
+        return AnnotationResponse(
+            items=items,
+            total_peaks=len(mz_values),
+            annotated_peaks=annotated_count
+        )
     
     @staticmethod
     def export_annotation_results(
@@ -0,0 +1,110 @@
+import io
+from typing import Optional
+import numpy as np
+from api.services.mass_index import MassMatches
+
+# Request bodies
+FLOAT64_MEDIA_TYPE = "application/octet-stream"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+
+# Columnar responses
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+NPZ_MEDIA_TYPE = "application/x-npz"
+
+_MEDIA_ALIASES = {
+    "application/x-parquet": PARQUET_MEDIA_TYPE,
+}
+
+COLUMNAR_MEDIA_TYPES = (ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE, PARQUET_MEDIA_TYPE, NPZ_MEDIA_TYPE)
+
+
+def _require_pyarrow():
+    """pyarrow is optional: only the Arrow and Parquet formats need it"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Arrow/Parquet support requires the pyarrow package") from e
+    return pyarrow
+
+
+def negotiate_columnar(accept: Optional[str]) -> Optional[str]:
+    """Columnar media type requested in an Accept header (None means JSON)"""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        media_type = _MEDIA_ALIASES.get(media_type, media_type)
+        if media_type in COLUMNAR_MEDIA_TYPES:
+            return media_type
+        if media_type in ("application/json", "*/*"):
+            return None
+    return None
+
+
+def parse_mz_buffer(body: bytes, content_type: Optional[str], column: str = "mz") -> np.ndarray:
+    """m/z values from a raw little-endian float64 buffer or an Arrow IPC stream/file"""
+    media_type = (content_type or FLOAT64_MEDIA_TYPE).split(";")[0].strip().lower()
+    media_type = _MEDIA_ALIASES.get(media_type, media_type)
+
+    if media_type == FLOAT64_MEDIA_TYPE:
+        if len(body) % 8:
+            raise ValueError("Binary body length must be a multiple of 8 bytes (little-endian float64)")
+        return np.frombuffer(body, dtype="<f8").astype(np.float64, copy=False)
+
+    if media_type in (ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE):
+        pa = _require_pyarrow()
+        if media_type == ARROW_FILE_MEDIA_TYPE:
+            table = pa.ipc.open_file(pa.py_buffer(body)).read_all()
+        else:
+            table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        if table.num_columns == 0:
+            raise ValueError("Arrow body has no columns")
+        values = table.column(column) if column in table.column_names else table.column(0)
+        return values.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+
+    raise ValueError(f"Unsupported content type: {media_type}")
+
+
+def matches_columns(matches: MassMatches) -> dict:
+    """Flat result columns: one row per (peak, candidate)"""
+    columns = {
+        "peak": matches.query_index.astype(np.int64, copy=False),
+        "metabolite_id": matches.ids.astype(np.int64, copy=False),
+        "exact_mass": matches.masses,
+        "mass_error_ppm": matches.error_ppm,
+        "mass_error_da": matches.error_da,
+        "rank": matches.rank.astype(np.int32, copy=False),
+    }
+    if matches.adducts is not None:
+        columns["adduct"] = matches.adducts.astype(str)
+    if matches.isotope_score is not None:
+        columns["isotope_score"] = matches.isotope_score
+    return columns
+
+
+def serialize_matches(matches: MassMatches, media_type: str) -> bytes:
+    """Encode flat matches as an Arrow IPC stream or file, Parquet file or NumPy .npz archive"""
+    columns = matches_columns(matches)
+
+    if media_type == NPZ_MEDIA_TYPE:
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+        return buffer.getvalue()
+
+    pa = _require_pyarrow()
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif media_type == ARROW_FILE_MEDIA_TYPE:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif media_type == PARQUET_MEDIA_TYPE:
+        pa.parquet.write_table(table, sink)
+    else:
+        raise ValueError(f"Unsupported response format: {media_type}")
+    return sink.getvalue().to_pybytes()
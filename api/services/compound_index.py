@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from typing import Dict, FrozenSet, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models import Metabolite, Class
+from api.services.data_version import VersionedIndex, metabolites_version
+from api.services.formula import canonical_formula
+from api.services.mass_index import MassIndex
+from api.services.metabolite_service import ID_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# SQLite databases read by the UI that share the metabolites column layout (table name = source name)
+LIPIDS_DB_PATH = os.getenv("LIPIDS_DB_PATH", "data/lipids.db")
+CARBOHYDRATES_DB_PATH = os.getenv("CARBOHYDRATES_DB_PATH", "data/carbohydrates.db")
+
+SIDECAR_SOURCES: Dict[str, str] = {
+    "lipids": LIPIDS_DB_PATH,
+    "carbohydrates": CARBOHYDRATES_DB_PATH,
+}
+
+COMPOUND_SOURCES = ("metabolites",) + tuple(SIDECAR_SOURCES)
+
+# Columns returned for every compound regardless of its source
+COMPOUND_COLUMNS = ("id", "name", "name_ru", "formula", "exact_mass", "hmdb_id", "kegg_id", "chebi_id", "type")
+
+
+def resolve_sources(sources: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """Validate source names ("lipids,carbohydrates" or a list); None means all sources"""
+    if isinstance(sources, str):
+        sources = [s.strip() for s in sources.split(",") if s.strip()]
+    if not sources:
+        return COMPOUND_SOURCES
+    unknown = [s for s in sources if s not in COMPOUND_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source: {', '.join(unknown)}. Available: {', '.join(COMPOUND_SOURCES)}")
+    return tuple(s for s in COMPOUND_SOURCES if s in sources)
+
+
+def _read_sidecar_masses(path: str, table: str) -> Tuple[np.ndarray, np.ndarray]:
+    if not os.path.exists(path):
+        logger.warning(f"Compound source {table} not found: {path}")
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    conn = sqlite3.connect(path)
+    try:
+        # Generic entries (e.g. "C5H6O5R2") are stored with a zero mass
+        rows = conn.execute(f"SELECT id, exact_mass FROM {table} WHERE exact_mass > 0").fetchall()
+    finally:
+        conn.close()
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    masses = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return ids, masses
+
+
+def _read_sidecar_records(path: str, table: str, ids: List[int]) -> Dict[int, dict]:
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        records = {}
+        for start in range(0, len(ids), ID_CHUNK_SIZE):
+            chunk = ids[start:start + ID_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT {', '.join(COMPOUND_COLUMNS)} FROM {table} WHERE id IN ({placeholders})", chunk
+            ).fetchall()
+            records.update({row["id"]: dict(row) for row in rows})
+        return records
+    finally:
+        conn.close()
+
+
+def read_sidecar_formulas(source: str) -> Dict[str, List[str]]:
+    """Compound names of a sidecar database grouped by canonical (Hill) formula"""
+    path = SIDECAR_SOURCES[source]
+    if not os.path.exists(path):
+        return {}
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(f"SELECT name, formula FROM {source} WHERE formula IS NOT NULL ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    names: Dict[str, List[str]] = {}
+    for name, formula in rows:
+        canonical = canonical_formula(formula)
+        if canonical:
+            names.setdefault(canonical, []).append(name)
+    return names
+
+
+class CompoundIndex:
+    """Merged mass index over metabolites and the sidecar compound databases
+
+    Entry i of mass_index has id i; source_codes[i] and local_ids[i] map it back to its database row.
+    """
+
+    def __init__(self, sources: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.source_names = list(sources)
+        codes, ids, masses = [], [], []
+        for code, name in enumerate(self.source_names):
+            source_ids, source_masses = sources[name]
+            codes.append(np.full(len(source_ids), code, dtype=np.int8))
+            ids.append(np.asarray(source_ids, dtype=np.int64))
+            masses.append(np.asarray(source_masses, dtype=np.float64))
+        self.source_codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int8)
+        self.local_ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        masses = np.concatenate(masses) if masses else np.empty(0)
+        self.mass_index = MassIndex(masses, np.arange(len(masses), dtype=np.int64))
+        self._subsets: Dict[FrozenSet[str], MassIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self.local_ids)
+
+    def source_sizes(self) -> Dict[str, int]:
+        counts = np.bincount(self.source_codes, minlength=len(self.source_names))
+        return {name: int(count) for name, count in zip(self.source_names, counts)}
+
+    @classmethod
+    async def from_sources(cls, db: AsyncSession) -> "CompoundIndex":
+        """Load masses of metabolites (through the session) and of every sidecar database"""
+        result = await db.execute(
+            select(Metabolite.id, Metabolite.exact_mass).where(Metabolite.exact_mass.isnot(None))
+        )
+        rows = result.all()
+        sources = {"metabolites": (
+            np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)),
+        )}
+        for name, path in SIDECAR_SOURCES.items():
+            sources[name] = await asyncio.to_thread(_read_sidecar_masses, path, name)
+        return cls(sources)
+
+    def mass_index_for(self, sources: Sequence[str]) -> MassIndex:
+        """Mass index restricted to some sources (built once per combination, sharing the sort order)"""
+        key = frozenset(sources)
+        if key >= frozenset(self.source_names):
+            return self.mass_index
+        if key not in self._subsets:
+            codes = [self.source_names.index(s) for s in self.source_names if s in key]
+            keep = np.isin(self.source_codes[self.mass_index.ids], codes)
+            self._subsets[key] = MassIndex.from_sorted(self.mass_index.masses[keep], self.mass_index.ids[keep])
+        return self._subsets[key]
+
+    def decode(self, entries: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Source names and row ids of merged index entries"""
+        entries = np.asarray(entries, dtype=np.int64)
+        return [self.source_names[c] for c in self.source_codes[entries].tolist()], self.local_ids[entries]
+
+
+async def compounds_version(db: AsyncSession) -> Hashable:
+    """Metabolites fingerprint plus modification time and size of every sidecar database"""
+    files = []
+    for path in SIDECAR_SOURCES.values():
+        try:
+            stat = os.stat(path)
+            files.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            files.append((path, None, None))
+    return (await metabolites_version(db), tuple(files))
+
+
+async def load_compound_records(
+    db: AsyncSession,
+    sources: Sequence[str],
+    ids: Sequence[int]
+) -> Dict[Tuple[str, int], dict]:
+    """Compound rows keyed by (source, id), fetched in id chunks per source"""
+    wanted: Dict[str, List[int]] = {}
+    for source, compound_id in zip(sources, ids):
+        wanted.setdefault(source, []).append(int(compound_id))
+
+    records: Dict[Tuple[str, int], dict] = {}
+    for source, source_ids in wanted.items():
+        source_ids = sorted(set(source_ids))
+        if source == "metabolites":
+            found = {}
+            for start in range(0, len(source_ids), ID_CHUNK_SIZE):
+                stmt = (
+                    select(
+                        Metabolite.id, Metabolite.name, Metabolite.name_ru, Metabolite.formula, Metabolite.exact_mass,
+                        Metabolite.hmdb_id, Metabolite.kegg_id, Metabolite.chebi_id, Class.name
+                    )
+                    .outerjoin(Class, Metabolite.class_id == Class.id)
+                    .where(Metabolite.id.in_(source_ids[start:start + ID_CHUNK_SIZE]))
+                )
+                for row in (await db.execute(stmt)).all():
+                    found[row[0]] = dict(zip(COMPOUND_COLUMNS, row))
+        else:
+            found = await asyncio.to_thread(_read_sidecar_records, SIDECAR_SOURCES[source], source, source_ids)
+        for compound_id, record in found.items():
+            records[(source, compound_id)] = record
+    return records
+
+
+_compound_index = VersionedIndex(CompoundIndex.from_sources, compounds_version)
+
+
+async def get_compound_index(db: AsyncSession) -> CompoundIndex:
+    """Shared merged index, rebuilt when metabolites or a sidecar database change"""
+    return await _compound_index.get(db)
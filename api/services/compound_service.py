@@ -0,0 +1,86 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence, Union
+import numpy as np
+from api.schemas import (
+    CompoundOut, CompoundCandidate, CompoundAnnotationItem, CompoundAnnotationResponse, MassSearchResponse
+)
+from api.services.adducts import resolve_adducts
+from api.services.annotation_service import AnnotationService
+from api.services.compound_index import get_compound_index, load_compound_records, resolve_sources
+
+class CompoundService:
+
+    @staticmethod
+    async def annotate(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        sources: Optional[Union[str, Sequence[str]]] = None
+    ) -> CompoundAnnotationResponse:
+        """Annotate m/z values against metabolites, lipids and carbohydrates in one ranked search
+        (raises ValueError for unknown adducts or sources)"""
+
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        adduct_list = resolve_adducts(adducts, ion_mode)
+        selected = resolve_sources(sources)
+
+        index = await get_compound_index(db)
+        matches = await AnnotationService._search_candidates(
+            db, mz_array, tol_ppm, max_candidates, adduct_list, index=index.mass_index_for(selected)
+        )
+        source_names, local_ids = index.decode(matches.ids)
+        records = await load_compound_records(db, source_names, local_ids.tolist())
+
+        bounds = np.searchsorted(matches.query_index, np.arange(len(mz_array) + 1))
+        local_ids = local_ids.tolist()
+        error_ppm = matches.error_ppm.tolist()
+        error_da = matches.error_da.tolist()
+        adduct_names = matches.adducts.tolist() if matches.adducts is not None else [None] * len(local_ids)
+
+        items = []
+        for peak, mz in enumerate(mz_array.tolist()):
+            candidates = []
+            for j in range(bounds[peak], bounds[peak + 1]):
+                record = records.get((source_names[j], local_ids[j]))
+                if record is None:
+                    continue
+                candidates.append(CompoundCandidate(
+                    compound=CompoundOut(source=source_names[j], **record),
+                    mass_error_ppm=round(error_ppm[j], 2),
+                    mass_error_da=round(error_da[j], 6),
+                    adduct=adduct_names[j]
+                ))
+            items.append(CompoundAnnotationItem(
+                mz=round(mz, 6),
+                candidates=candidates,
+                best_match=candidates[0].compound if candidates else None
+            ))
+
+        sizes = index.source_sizes()
+        return CompoundAnnotationResponse(
+            items=items,
+            total_peaks=len(items),
+            annotated_peaks=sum(1 for item in items if item.candidates),
+            sources={name: sizes.get(name, 0) for name in selected}
+        )
+
+    @staticmethod
+    async def search_mass(
+        db: AsyncSession,
+        mass: float,
+        tol_ppm: float = 10.0,
+        limit: int = 50,
+        sources: Optional[Union[str, Sequence[str]]] = None
+    ) -> MassSearchResponse:
+        """Compounds of every source within tol_ppm of a neutral mass, closest first"""
+
+        response = await CompoundService.annotate(db, [mass], tol_ppm, limit, sources=sources)
+        return MassSearchResponse(
+            mass=mass,
+            tol_ppm=tol_ppm,
+            candidates=response.items[0].candidates,
+            sources=response.sources
+        )
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy import inspect, select, func, text
+from api.models import Metabolite, Enzyme
+
+# How often (seconds) an in-memory index re-checks the database fingerprint
+INDEX_VERSION_TTL = float(os.getenv("INDEX_VERSION_TTL", "5"))
+
+# Tables whose every insert, update and delete bumps a counter in CHANGE_COUNTER_TABLE
+TRACKED_TABLES = ("metabolites", "enzymes")
+
+CHANGE_COUNTER_TABLE = "data_changes"
+
+_counter_table = (
+    f"CREATE TABLE IF NOT EXISTS {CHANGE_COUNTER_TABLE} "
+    "(table_name VARCHAR(64) PRIMARY KEY, counter BIGINT NOT NULL DEFAULT 0)"
+)
+
+# SQLite has only row-level triggers
+SQLITE_CHANGE_TRIGGERS = {
+    f"{table}_changes_{event.lower()}": f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE {CHANGE_COUNTER_TABLE} SET counter = counter + 1 WHERE table_name = '{table}';
+        END"""
+    for table in TRACKED_TABLES for event in ("INSERT", "UPDATE", "DELETE")
+}
+
+# One statement-level trigger per table on PostgreSQL
+POSTGRES_CHANGE_STATEMENTS = [
+    _counter_table,
+    f"""CREATE OR REPLACE FUNCTION count_data_change() RETURNS trigger AS $$
+        BEGIN
+            UPDATE {CHANGE_COUNTER_TABLE} SET counter = counter + 1 WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql""",
+] + [
+    statement
+    for table in TRACKED_TABLES
+    for statement in (
+        f"INSERT INTO {CHANGE_COUNTER_TABLE} (table_name, counter) VALUES ('{table}', 0) ON CONFLICT DO NOTHING",
+        f"DROP TRIGGER IF EXISTS {table}_changes ON {table}",
+        f"CREATE TRIGGER {table}_changes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_data_change()",
+    )
+]
+
+
+def ensure_sqlite_change_tracking(execute: Callable[[str], List[tuple]]) -> bool:
+    """Create the change counter and the triggers of every existing tracked table if missing
+
+    Importers that drop and recreate a table also drop its triggers, so they call this again.
+    """
+    existing = {row[0] for row in execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    tables = [table for table in TRACKED_TABLES if table in existing]
+    if not tables:
+        return False
+    execute(_counter_table)
+    for table in tables:
+        execute(f"INSERT OR IGNORE INTO {CHANGE_COUNTER_TABLE} (table_name, counter) VALUES ('{table}', 0)")
+        for event in ("insert", "update", "delete"):
+            execute(SQLITE_CHANGE_TRIGGERS[f"{table}_changes_{event}"])
+    return True
+
+
+def update_change_tracking(conn: sqlite3.Connection) -> bool:
+    """Reinstall the change triggers of an SQLite database and count the import as a change
+    (called by importers, whose writes may have run while the triggers were missing)"""
+    installed = ensure_sqlite_change_tracking(lambda sql: conn.execute(sql).fetchall())
+    if installed:
+        conn.execute(f"UPDATE {CHANGE_COUNTER_TABLE} SET counter = counter + 1")
+    conn.commit()
+    return installed
+
+
+async def ensure_change_tracking(engine: AsyncEngine) -> bool:
+    """Create the change counter and its triggers for the configured database at startup"""
+    async with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            def run(sync_conn):
+                def execute(sql: str) -> List[tuple]:
+                    result = sync_conn.exec_driver_sql(sql)
+                    return result.fetchall() if result.returns_rows else []
+                return ensure_sqlite_change_tracking(execute)
+            return await conn.run_sync(run)
+        if conn.dialect.name == "postgresql":
+            for statement in POSTGRES_CHANGE_STATEMENTS:
+                await conn.exec_driver_sql(statement)
+            return True
+    return False
+
+
+async def change_counter(db: AsyncSession, table: str) -> Optional[int]:
+    """Number of writes to a tracked table, or None where change tracking is not installed"""
+    tracked = await db.run_sync(lambda session: inspect(session.connection()).has_table(CHANGE_COUNTER_TABLE))
+    if not tracked:
+        return None
+    result = await db.execute(
+        text(f"SELECT counter FROM {CHANGE_COUNTER_TABLE} WHERE table_name = :table"), {"table": table}
+    )
+    return result.scalar()
+
+
+async def metabolites_version(db: AsyncSession) -> Hashable:
+    """Cheap fingerprint of the metabolites table that changes whenever an importer rewrites it"""
+    stmt = select(
+        func.count(Metabolite.id),
+        func.max(Metabolite.id),
+        func.sum(Metabolite.exact_mass)
+    )
+    result = await db.execute(stmt)
+    count, max_id, mass_sum = result.one()
+    return (count, max_id, round(mass_sum or 0.0, 6))
+
+
+async def enzymes_table_version(db: AsyncSession) -> Hashable:
+    """Cheap fingerprint of the enzymes table"""
+    result = await db.execute(select(func.count(Enzyme.id), func.max(Enzyme.id), func.sum(Enzyme.molecular_weight)))
+    count, max_id, weight_sum = result.one()
+    return (count, max_id, round(weight_sum or 0.0, 6))
+
+
+async def metabolites_content_version(db: AsyncSession) -> Hashable:
+    """Fingerprint plus change counter: also changes when names, formulas or identifiers are edited"""
+    return (await metabolites_version(db), await change_counter(db, "metabolites"))
+
+
+async def enzymes_content_version(db: AsyncSession) -> Hashable:
+    """Fingerprint plus change counter of the enzymes table"""
+    return (await enzymes_table_version(db), await change_counter(db, "enzymes"))
+
+
+class VersionedIndex:
+    """In-memory structure built from the database and rebuilt when its data version changes"""
+
+    def __init__(
+        self,
+        builder: Callable[[AsyncSession], Awaitable[Any]],
+        version: Callable[[AsyncSession], Awaitable[Hashable]] = metabolites_version,
+        ttl: Optional[float] = None
+    ):
+        self._builder = builder
+        self._version_func = version
+        self.ttl = INDEX_VERSION_TTL if ttl is None else ttl
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> Optional[Hashable]:
+        return self._version
+
+    async def get(self, db: AsyncSession) -> Any:
+        """Return the current structure, rebuilding it if the data changed"""
+        if self._value is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._value
+
+        async with self._lock:
+            version = await self._version_func(db)
+            if self._value is None or version != self._version:
+                self._value = await self._builder(db)
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._value
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next access"""
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
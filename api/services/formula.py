@@ -0,0 +1,180 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+ELECTRON_MASS = 0.00054857990946
+
+# Mass of the most abundant isotope of each element (NIST)
+MONOISOTOPIC_MASSES: Dict[str, float] = {
+    "H": 1.00782503207, "D": 2.0141017778, "Li": 7.01600455, "B": 11.0093054,
+    "C": 12.0, "N": 14.0030740048, "O": 15.99491461956, "F": 18.99840322,
+    "Na": 22.9897692809, "Mg": 23.985041700, "Al": 26.98153863, "Si": 27.9769265325,
+    "P": 30.97376163, "S": 31.97207100, "Cl": 34.96885268, "K": 38.96370668,
+    "Ca": 39.96259098, "Ti": 47.9479463, "V": 50.9439595, "Cr": 51.9405075,
+    "Mn": 54.9380451, "Fe": 55.9349375, "Co": 58.9331950, "Ni": 57.9353429,
+    "Cu": 62.9295975, "Zn": 63.9291422, "Ga": 68.9255736, "Ge": 73.9211778,
+    "As": 74.9215965, "Se": 79.9165213, "Br": 78.9183371, "Rb": 84.911789738,
+    "Sr": 87.9056121, "Mo": 97.9054082, "Ag": 106.905097, "Cd": 113.9033585,
+    "I": 126.904473, "Cs": 132.905451933, "Ba": 137.9052472, "W": 183.9509312,
+    "Pt": 194.9647911, "Au": 196.9665687, "Hg": 201.970643, "Pb": 207.9766521,
+    "Bi": 208.9803987,
+}
+
+_TOKEN_PATTERN = re.compile(r"([A-Z][a-z]?)|(\d+)|([(\[{])|([)\]}])")
+# "NH4+", "C6H5O7-3" or "[C6H5O7]3-"; a bare number before the sign belongs to the element
+_CHARGE_PATTERN = re.compile(r"(?:([+-])(\d*)|(?<=[)\]}])(\d+)([+-]))$")
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+
+_ELEMENTS = list(MONOISOTOPIC_MASSES)
+_ELEMENT_MASSES = np.array([MONOISOTOPIC_MASSES[e] for e in _ELEMENTS])
+
+
+def _parse_part(text: str) -> Optional[Dict[str, int]]:
+    """Element counts of one hydrate/salt component with nested brackets"""
+    stack = [{}]
+    opened = []
+    last: Optional[Dict[str, int]] = None
+    pos = 0
+
+    def flush():
+        if last:
+            for element, count in last.items():
+                stack[-1][element] = stack[-1].get(element, 0) + count
+
+    for match in _TOKEN_PATTERN.finditer(text):
+        if match.start() != pos:
+            return None
+        pos = match.end()
+        element, number, open_bracket, close_bracket = match.groups()
+        if element:
+            flush()
+            last = {element: 1}
+        elif number:
+            if last is None:
+                return None
+            last = {e: c * int(number) for e, c in last.items()}
+            flush()
+            last = None
+        elif open_bracket:
+            flush()
+            last = None
+            stack.append({})
+            opened.append(open_bracket)
+        else:
+            if not opened or opened.pop() != _BRACKETS[close_bracket]:
+                return None
+            flush()
+            last = stack.pop()
+
+    flush()
+    if pos != len(text) or len(stack) != 1:
+        return None
+    return stack[0]
+
+
+@lru_cache(maxsize=65536)
+def _parse(formula: str) -> Optional[Tuple[Tuple[Tuple[str, int], ...], int]]:
+    text = formula.replace(" ", "")
+    charge = 0
+    match = _CHARGE_PATTERN.search(text)
+    if match:
+        sign, digits = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+        charge = (int(digits) if digits else 1) * (1 if sign == "+" else -1)
+        text = text[:match.start()]
+
+    counts: Dict[str, int] = {}
+    # Hydrates and salts are written as "CuSO4·5H2O" or "C6H12O6.H2O"
+    for part in re.split(r"[·.*]", text):
+        if not part:
+            continue
+        multiplier = 1
+        leading = re.match(r"^(\d+)(.*)$", part)
+        if leading:
+            multiplier, part = int(leading.group(1)), leading.group(2)
+        parsed = _parse_part(part)
+        if not parsed:
+            return None
+        for element, count in parsed.items():
+            counts[element] = counts.get(element, 0) + count * multiplier
+    if not counts:
+        return None
+    return tuple(sorted(counts.items())), charge
+
+
+def parse_formula_with_charge(formula: Optional[str]) -> Optional[Tuple[Dict[str, int], int]]:
+    """Element counts and net charge of a formula, None if it cannot be parsed"""
+    if not formula or not isinstance(formula, str):
+        return None
+    parsed = _parse(formula)
+    return (dict(parsed[0]), parsed[1]) if parsed is not None else None
+
+
+def parse_formula(formula: Optional[str]) -> Optional[Dict[str, int]]:
+    """Element counts of a molecular formula, None if it cannot be parsed"""
+    parsed = parse_formula_with_charge(formula)
+    return parsed[0] if parsed is not None else None
+
+
+@lru_cache(maxsize=65536)
+def _mass(formula: str) -> Optional[float]:
+    parsed = _parse(formula)
+    if parsed is None:
+        return None
+    counts, charge = parsed
+    if any(element not in MONOISOTOPIC_MASSES for element, _ in counts):
+        return None
+    return sum(MONOISOTOPIC_MASSES[element] * count for element, count in counts) - charge * ELECTRON_MASS
+
+
+def monoisotopic_mass(formula: Optional[str]) -> Optional[float]:
+    """Exact monoisotopic mass of a formula (ions lose or gain electrons), None if unknown"""
+    if not formula or not isinstance(formula, str):
+        return None
+    return _mass(formula)
+
+
+def monoisotopic_masses(formulas: Iterable[Optional[str]]) -> np.ndarray:
+    """Monoisotopic masses of a whole column of formulas (NaN where a formula cannot be parsed)
+
+    Each distinct formula is parsed once; masses come from one count-matrix product.
+    """
+    keys = np.array([f if isinstance(f, str) else "" for f in formulas], dtype=object)
+    if len(keys) == 0:
+        return np.empty(0)
+    unique, inverse = np.unique(keys, return_inverse=True)
+
+    column = {element: j for j, element in enumerate(_ELEMENTS)}
+    counts = np.zeros((len(unique), len(_ELEMENTS)))
+    charges = np.zeros(len(unique))
+    valid = np.zeros(len(unique), dtype=bool)
+    for i, formula in enumerate(unique.tolist()):
+        parsed = _parse(formula) if formula else None
+        if parsed is None or any(element not in column for element, _ in parsed[0]):
+            continue
+        valid[i] = True
+        charges[i] = parsed[1]
+        for element, count in parsed[0]:
+            counts[i, column[element]] = count
+
+    masses = counts @ _ELEMENT_MASSES - charges * ELECTRON_MASS
+    masses[~valid] = np.nan
+    return masses[inverse.ravel()]
+
+
+def hill_formula(counts: Dict[str, int]) -> str:
+    """Formula string in Hill order (C, H, then alphabetical)"""
+    parts = []
+    heads = [e for e in ("C", "H") if e in counts] if counts.get("C") else []
+    elements = heads + sorted(e for e in counts if e not in heads)
+    for element in elements:
+        count = counts[element]
+        if count > 0:
+            parts.append(element if count == 1 else f"{element}{count}")
+    return "".join(parts)
+
+
+def canonical_formula(formula: Optional[str]) -> Optional[str]:
+    """Hill-order form of any parsable formula, used to compare database and generated formulas"""
+    counts = parse_formula(formula)
+    return hill_formula(counts) if counts else None
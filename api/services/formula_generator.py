@@ -0,0 +1,250 @@
+import itertools
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.services.formula import MONOISOTOPIC_MASSES, hill_formula
+from api.services.formula_index import get_formula_index
+
+# Largest neutral mass covered by the precomputed composition table
+FORMULA_MAX_MASS = float(os.getenv("FORMULA_MAX_MASS", "1000"))
+
+# Peak x offset windows searched per vectorized pass (bounds temporary memory)
+FORMULA_WINDOWS_PER_PASS = int(os.getenv("FORMULA_WINDOWS_PER_PASS", "500000"))
+
+# Heavy (multivalent) atoms stored in the table; H and halogens are added as mass offsets
+HEAVY_ELEMENTS = ("C", "N", "O", "P", "S")
+HALOGENS = ("Cl", "Br", "F")
+
+# Seven Golden Rules, rule 1: element maxima by mass range (upper mass bound, C, H, N, O, P, S)
+ELEMENT_LIMITS = [
+    (500.0, 39, 72, 20, 20, 9, 10),
+    (1000.0, 78, 126, 25, 27, 9, 14),
+    (2000.0, 156, 236, 32, 63, 9, 14),
+]
+
+# Halogen counts enumerated when halogens are enabled
+HALOGEN_LIMITS = {"Cl": 4, "Br": 2, "F": 4}
+
+# Tables are capped at 4 P and 4 S atoms: more is practically absent in metabolites
+MAX_P = 4
+MAX_S = 4
+
+# Rule 6: HNOPS probability check (elements that all exceed 1 -> strict upper bounds)
+HNOPS_RULES = [
+    (("N", "O", "P", "S"), {"N": 10, "O": 20, "P": 4, "S": 3}),
+    (("N", "O", "P"), {"N": 11, "O": 22, "P": 6}),
+    (("O", "P", "S"), {"O": 14, "P": 3, "S": 3}),
+    (("P", "S", "N"), {"P": 3, "S": 3, "N": 4}),
+    (("N", "O", "S"), {"N": 19, "O": 14, "S": 8}),
+]
+
+_VALENCE = {"C": 4, "H": 1, "N": 3, "O": 2, "P": 3, "S": 2, "Cl": 1, "Br": 1, "F": 1}
+
+
+@dataclass
+class FormulaMatches:
+    """Flat generated compositions sorted by query, then absolute error"""
+    query_index: np.ndarray
+    counts: np.ndarray  # (n, len(ELEMENT_COLUMNS)) element counts
+    mass: np.ndarray
+    error_da: np.ndarray
+    rdbe: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.query_index)
+
+
+ELEMENT_COLUMNS = HEAVY_ELEMENTS + ("H",) + HALOGENS
+
+
+class FormulaGenerator:
+    """Enumerates CHNOPS(+halogen) compositions in mass windows
+
+    Heavy-atom compositions that pass the ratio and HNOPS rules are precomputed once and
+    sorted by mass. A query subtracts every H/halogen combination from the window and
+    binary-searches the table, so all peaks and offsets are searched in one vectorized pass.
+    """
+
+    def __init__(self, max_mass: float = FORMULA_MAX_MASS):
+        self.max_mass = max_mass
+        self._limits = next((row for row in ELEMENT_LIMITS if max_mass <= row[0]), ELEMENT_LIMITS[-1])
+        self.masses, self.heavy = self._build_table()
+        self._offsets = {False: self._build_offsets(False)}
+
+    def _build_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        _, max_c, _, max_n, max_o, max_p, max_s = self._limits
+        element_mass = np.array([MONOISOTOPIC_MASSES[e] for e in HEAVY_ELEMENTS])
+        c, n, o = np.meshgrid(
+            np.arange(1, max_c + 1), np.arange(max_n + 1), np.arange(max_o + 1), indexing="ij"
+        )
+        c, n, o = c.ravel(), n.ravel(), o.ravel()
+
+        blocks = []
+        for p, s in itertools.product(range(min(max_p, MAX_P) + 1), range(min(max_s, MAX_S) + 1)):
+            counts = np.column_stack([c, n, o, np.full_like(c, p), np.full_like(c, s)])
+            mass = counts @ element_mass
+            # Rule 5 element ratios (heteroatom / carbon)
+            keep = (mass <= self.max_mass) & (n <= 4 * c) & (o <= 3 * c) & (p <= 2 * c) & (s <= 3 * c)
+            counts = counts[keep]
+            keep = self._hnops_mask(counts)
+            blocks.append(counts[keep])
+
+        heavy = np.concatenate(blocks).astype(np.int16)
+        masses = heavy @ element_mass
+        order = np.argsort(masses, kind="stable")
+        return masses[order], heavy[order]
+
+    @staticmethod
+    def _hnops_mask(counts: np.ndarray) -> np.ndarray:
+        column = {e: j for j, e in enumerate(HEAVY_ELEMENTS)}
+        keep = np.ones(len(counts), dtype=bool)
+        for elements, limits in HNOPS_RULES:
+            applies = np.all([counts[:, column[e]] > 1 for e in elements], axis=0)
+            within = np.all([counts[:, column[e]] < limits[e] for e in elements], axis=0)
+            keep &= ~applies | within
+        return keep
+
+    def _build_offsets(self, halogens: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """All (H, Cl, Br, F) combinations and their masses"""
+        max_h = self._limits[2]
+        ranges = [range(max_h + 1)] + [
+            range(HALOGEN_LIMITS[x] + 1 if halogens else 1) for x in HALOGENS
+        ]
+        combos = np.array(list(itertools.product(*ranges)), dtype=np.int16)
+        element_mass = np.array([MONOISOTOPIC_MASSES[e] for e in ("H",) + HALOGENS])
+        return combos, combos @ element_mass
+
+    def offsets(self, halogens: bool) -> Tuple[np.ndarray, np.ndarray]:
+        if halogens not in self._offsets:
+            self._offsets[halogens] = self._build_offsets(halogens)
+        return self._offsets[halogens]
+
+    def generate(
+        self,
+        masses: np.ndarray,
+        tolerance_da: np.ndarray,
+        max_results: int = 20,
+        halogens: bool = False
+    ) -> FormulaMatches:
+        """Compositions within each [mass - tol, mass + tol] window passing the golden rules"""
+        masses = np.asarray(masses, dtype=np.float64)
+        tolerance_da = np.broadcast_to(np.asarray(tolerance_da, dtype=np.float64), masses.shape)
+        combos, combo_mass = self.offsets(halogens)
+
+        # Bound the peaks x offsets window matrix of one pass
+        chunk = max(1, FORMULA_WINDOWS_PER_PASS // len(combos))
+        parts = []
+        for begin in range(0, len(masses), chunk):
+            part = self._generate_chunk(
+                masses[begin:begin + chunk], tolerance_da[begin:begin + chunk], max_results, combos, combo_mass
+            )
+            part.query_index += begin
+            parts.append(part)
+        if not parts:
+            return self._empty()
+        return FormulaMatches(
+            query_index=np.concatenate([p.query_index for p in parts]),
+            counts=np.concatenate([p.counts for p in parts]),
+            mass=np.concatenate([p.mass for p in parts]),
+            error_da=np.concatenate([p.error_da for p in parts]),
+            rdbe=np.concatenate([p.rdbe for p in parts])
+        )
+
+    def _generate_chunk(
+        self,
+        masses: np.ndarray,
+        tolerance_da: np.ndarray,
+        max_results: int,
+        combos: np.ndarray,
+        combo_mass: np.ndarray
+    ) -> FormulaMatches:
+        # Heavy-atom mass windows for every (peak, H/halogen offset) pair
+        low = (masses - tolerance_da)[:, None] - combo_mass[None, :]
+        high = (masses + tolerance_da)[:, None] - combo_mass[None, :]
+        valid = (np.isfinite(masses)[:, None] & (high > 0)).ravel()
+        start = np.searchsorted(self.masses, low.ravel(), side="left")
+        stop = np.searchsorted(self.masses, high.ravel(), side="right")
+        sizes = np.where(valid, stop - start, 0)
+        if sizes.sum() == 0:
+            return self._empty()
+
+        window = np.repeat(np.arange(len(sizes)), sizes)
+        row = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes) + start[window]
+        query = window // len(combos)
+        offset = window % len(combos)
+        counts = np.column_stack([self.heavy[row], combos[offset]]).astype(np.int32)
+        mass = self.masses[row] + combo_mass[offset]
+
+        keep = self._golden_rules(counts, mass)
+        query, counts, mass = query[keep], counts[keep], mass[keep]
+        error = mass - masses[query]
+
+        order = np.lexsort((np.abs(error), query))
+        query, counts, mass, error = query[order], counts[order], mass[order], error[order]
+        rank = np.arange(len(query)) - np.searchsorted(query, query, side="left")
+        keep = rank < max_results
+        counts = counts[keep]
+        return FormulaMatches(
+            query_index=query[keep],
+            counts=counts,
+            mass=mass[keep],
+            error_da=error[keep],
+            rdbe=self.rdbe(counts)
+        )
+
+    @staticmethod
+    def rdbe(counts: np.ndarray) -> np.ndarray:
+        """Ring plus double bond equivalents: C + 1 + (N + P)/2 - (H + X)/2"""
+        c, n, o, p, s, h, cl, br, f = counts.T
+        return c + 1 + (n + p) / 2 - (h + cl + br + f) / 2
+
+    def _golden_rules(self, counts: np.ndarray, mass: np.ndarray) -> np.ndarray:
+        c, n, o, p, s, h, cl, br, f = counts.T
+        monovalent = h + cl + br + f
+        valence = 4 * c + 3 * n + 2 * o + 3 * p + 2 * s + monovalent
+        atoms = counts.sum(axis=1)
+
+        # Rule 2: LEWIS (even valence sum = integer RDBE) and SENIOR
+        keep = (valence % 2 == 0) & (valence >= 2 * (atoms - 1)) & (self.rdbe(counts) >= 0)
+        # Rule 4: hydrogen / carbon ratio
+        keep &= (h >= 0.1 * c) & (monovalent <= 6 * c)
+        # Rule 1: element maxima for the mass range of each candidate
+        for upper, max_c, max_h, max_n, max_o, _, max_s in reversed(ELEMENT_LIMITS):
+            band = mass <= upper
+            keep &= ~band | ((c <= max_c) & (h <= max_h) & (n <= max_n) & (o <= max_o) & (s <= max_s))
+        return keep
+
+    @staticmethod
+    def _empty() -> FormulaMatches:
+        return FormulaMatches(
+            query_index=np.empty(0, dtype=np.int64),
+            counts=np.empty((0, len(ELEMENT_COLUMNS)), dtype=np.int32),
+            mass=np.empty(0),
+            error_da=np.empty(0),
+            rdbe=np.empty(0)
+        )
+
+    @staticmethod
+    def formulas(matches: FormulaMatches) -> List[str]:
+        return [
+            hill_formula(dict(zip(ELEMENT_COLUMNS, row)))
+            for row in matches.counts.tolist()
+        ]
+
+
+_generator: Optional[FormulaGenerator] = None
+
+
+def get_formula_generator() -> FormulaGenerator:
+    """Shared generator; the composition table is built on first use"""
+    global _generator
+    if _generator is None:
+        _generator = FormulaGenerator()
+    return _generator
+
+
+async def get_database_formulas(db: AsyncSession) -> Dict[str, int]:
+    """Number of metabolites per canonical (Hill) formula"""
+    return (await get_formula_index(db)).metabolite_counts
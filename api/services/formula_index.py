@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models import Metabolite
+from api.services.data_version import VersionedIndex
+from api.services.formula import canonical_formula
+from api.services.mass_index import MassIndex
+
+
+class FormulaIndex:
+    """Metabolites collapsed into (formula, exact mass) groups
+
+    Isomers share a formula and therefore a mass, so annotation searches one entry per group
+    (mass_index ids are group numbers) and expands a group into metabolite ids only on request.
+    Members are stored in CSR layout: ids of group g are member_ids[offsets[g]:offsets[g + 1]].
+    """
+
+    def __init__(self, ids: np.ndarray, masses: np.ndarray, formulas: Sequence[Optional[str]]):
+        ids = np.asarray(ids, dtype=np.int64)
+        masses = np.asarray(masses, dtype=np.float64)
+        raw = pd.Series(list(formulas), dtype=object)
+        # Canonical (Hill) notation per distinct raw formula; unparsable ones keep their text
+        canonical = {f: canonical_formula(f) or f for f in raw.dropna().unique()}
+        keys = raw.map(canonical)
+        # Rows without a formula cannot be isomers of anything and stay single
+        keys = keys.where(keys.notna(), pd.Series([f"#{i}" for i in ids.tolist()], dtype=object))
+
+        frame = pd.DataFrame({"key": keys, "mass": np.round(masses, 6), "id": ids})
+        group = frame.groupby(["key", "mass"], sort=False).ngroup().to_numpy()
+        order = np.lexsort((ids, group))
+
+        self.member_ids = ids[order]
+        sizes = np.bincount(group, minlength=int(group.max()) + 1 if len(group) else 0)
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        first = order[self.offsets[:-1]]
+        self.masses = masses[first]
+        self.formulas = np.array(
+            [None if key.startswith("#") else key for key in keys.to_numpy()[first].tolist()], dtype=object
+        )
+        self.mass_index = MassIndex(self.masses, np.arange(len(self.masses), dtype=np.int64))
+
+        self.metabolite_counts: Dict[str, int] = {}
+        self._groups_by_formula: Dict[str, List[int]] = {}
+        for g, formula in enumerate(self.formulas.tolist()):
+            if formula is not None:
+                self.metabolite_counts[formula] = self.metabolite_counts.get(formula, 0) + int(sizes[g])
+                self._groups_by_formula.setdefault(formula, []).append(g)
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+    @property
+    def metabolite_total(self) -> int:
+        return len(self.member_ids)
+
+    @classmethod
+    async def from_database(cls, db: AsyncSession) -> "FormulaIndex":
+        """Group all metabolites with a known exact mass"""
+        stmt = select(Metabolite.id, Metabolite.exact_mass, Metabolite.formula).where(Metabolite.exact_mass.isnot(None))
+        result = await db.execute(stmt)
+        rows = result.all()
+        return cls(
+            np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)),
+            [row[2] for row in rows]
+        )
+
+    def counts(self, groups: np.ndarray) -> np.ndarray:
+        """Number of metabolites in each group"""
+        groups = np.asarray(groups, dtype=np.int64)
+        return self.offsets[groups + 1] - self.offsets[groups]
+
+    def members(self, group: int) -> np.ndarray:
+        """Metabolite ids of one group, ascending"""
+        return self.member_ids[self.offsets[group]:self.offsets[group + 1]]
+
+    def expand(self, groups: np.ndarray) -> np.ndarray:
+        """Metabolite ids of every group, concatenated in group order"""
+        groups = np.asarray(groups, dtype=np.int64)
+        sizes = self.counts(groups)
+        starts = np.repeat(self.offsets[groups], sizes)
+        within = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return self.member_ids[starts + within]
+
+    def isomers(self, formula: str) -> np.ndarray:
+        """Metabolite ids sharing a formula in any notation"""
+        groups = self._groups_by_formula.get(canonical_formula(formula) or formula, [])
+        return np.sort(self.expand(np.array(groups, dtype=np.int64)))
+
+
+_formula_index = VersionedIndex(FormulaIndex.from_database)
+
+
+async def get_formula_index(db: AsyncSession) -> FormulaIndex:
+    """Shared formula-level index, rebuilt when the metabolites table changes"""
+    return await _formula_index.get(db)
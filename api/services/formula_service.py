@@ -0,0 +1,88 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence, Union
+import numpy as np
+from api.schemas import FormulaCandidate, FormulaGenerationItem, FormulaGenerationResponse
+from api.services.adducts import adduct_arrays, ion_mz, neutral_mass_matrix, resolve_adducts
+from api.services.annotation_service import AnnotationService
+from api.services.formula_generator import get_database_formulas, get_formula_generator
+
+class FormulaService:
+
+    @staticmethod
+    async def generate_for_peaks(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 5.0,
+        max_results: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        halogens: bool = False,
+        check_database: bool = True,
+        unmatched_only: bool = False
+    ) -> FormulaGenerationResponse:
+        """Enumerate candidate formulas for m/z values (raises ValueError for unknown adducts)
+
+        Without adducts the values are treated as neutral masses. With unmatched_only, peaks that
+        already have a metabolite candidate are returned with matched=True and no formulas. Peaks
+        whose every neutral mass lies above the generator's FORMULA_MAX_MASS are returned with
+        out_of_range=True, so "no valid composition" and "mass not covered" stay distinguishable.
+        """
+
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        adduct_list = resolve_adducts(adducts, ion_mode)
+
+        matched = np.zeros(len(mz_array), dtype=bool)
+        if unmatched_only and len(mz_array):
+            matches = await AnnotationService.annotate_matches(db, mz_array, tol_ppm, 1, adducts, ion_mode)
+            matched[matches.query_index] = True
+
+        if adduct_list:
+            multiplier, _, charge = adduct_arrays(adduct_list)
+            neutral = neutral_mass_matrix(mz_array, adduct_list)
+            # The m/z window maps onto a window scaled by |charge| / multiplier in neutral mass
+            tolerance = (mz_array * tol_ppm * 1e-6)[:, None] * (charge / multiplier)[None, :]
+        else:
+            neutral = mz_array[:, None]
+            tolerance = (mz_array * tol_ppm * 1e-6)[:, None]
+        hypotheses = neutral.shape[1]
+
+        generator = get_formula_generator()
+        out_of_range = np.all(neutral - tolerance > generator.max_mass, axis=1)
+        peaks = np.flatnonzero(~matched & ~out_of_range)
+        neutral, tolerance = neutral[peaks], tolerance[peaks]
+        found = generator.generate(neutral.ravel(), tolerance.ravel(), max_results, halogens)
+        peak = peaks[found.query_index // hypotheses]
+        adduct_index = found.query_index % hypotheses
+        ion = ion_mz(found.mass, adduct_list, adduct_index) if adduct_list else found.mass
+        error_da = ion - mz_array[peak]
+        error_ppm = error_da / mz_array[peak] * 1e6
+
+        # Merge adduct hypotheses per peak and keep the closest max_results
+        order = np.lexsort((np.abs(error_ppm), peak))
+        rank = np.arange(len(order)) - np.searchsorted(peak[order], peak[order], side="left")
+        order = order[rank < max_results]
+
+        formulas = generator.formulas(found)
+        known = await get_database_formulas(db) if check_database else {}
+
+        items = [
+            FormulaGenerationItem(mz=float(mz), candidates=[], matched=bool(m), out_of_range=bool(r) and not m)
+            for mz, m, r in zip(mz_array.tolist(), matched, out_of_range)
+        ]
+        for i in order.tolist():
+            items[peak[i]].candidates.append(FormulaCandidate(
+                formula=formulas[i],
+                neutral_mass=round(float(found.mass[i]), 6),
+                mass_error_ppm=round(float(error_ppm[i]), 2),
+                mass_error_da=round(float(error_da[i]), 6),
+                rdbe=float(found.rdbe[i]),
+                adduct=adduct_list[adduct_index[i]].name if adduct_list else None,
+                in_database=formulas[i] in known,
+                metabolite_count=known.get(formulas[i], 0)
+            ))
+
+        return FormulaGenerationResponse(
+            items=items,
+            total_peaks=len(items),
+            generated_peaks=sum(1 for item in items if item.candidates)
+        )
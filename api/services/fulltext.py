@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+from typing import Callable, List, Set
+from sqlalchemy import column, func, or_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from api.models import Metabolite
+from api.services.identifiers import identifier_condition, is_bare_number, parse_identifier
+
+logger = logging.getLogger(__name__)
+
+# Columns searched by /metabolites/search (names, formula and external identifiers)
+FULLTEXT_COLUMNS = ("name", "name_ru", "formula", "hmdb_id", "kegg_id", "chebi_id", "pubchem_cid")
+
+FULLTEXT_TABLE = "metabolites_fts"
+
+# The trigram tokenizer needs at least three characters; shorter queries fall back to LIKE
+MIN_FULLTEXT_QUERY = 3
+
+_columns = ", ".join(FULLTEXT_COLUMNS)
+_new_values = ", ".join(f"new.{c}" for c in FULLTEXT_COLUMNS)
+_old_values = ", ".join(f"old.{c}" for c in FULLTEXT_COLUMNS)
+
+# External-content FTS5 table over metabolites, kept in sync by triggers
+SQLITE_FULLTEXT_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FULLTEXT_TABLE} USING fts5("
+    f"{_columns}, content='metabolites', content_rowid='id', tokenize='trigram')"
+)
+SQLITE_FULLTEXT_TRIGGERS = {
+    "metabolites_fts_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS metabolites_fts_insert AFTER INSERT ON metabolites BEGIN
+            INSERT INTO {FULLTEXT_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END""",
+    "metabolites_fts_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS metabolites_fts_delete AFTER DELETE ON metabolites BEGIN
+            INSERT INTO {FULLTEXT_TABLE}({FULLTEXT_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        END""",
+    "metabolites_fts_update": f"""
+        CREATE TRIGGER IF NOT EXISTS metabolites_fts_update AFTER UPDATE ON metabolites BEGIN
+            INSERT INTO {FULLTEXT_TABLE}({FULLTEXT_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+            INSERT INTO {FULLTEXT_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END""",
+}
+
+# Trigram GIN indexes on the lower(column) expressions used by the LIKE search
+POSTGRES_TRIGRAM_STATEMENTS = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"CREATE INDEX IF NOT EXISTS ix_metabolites_{c}_trgm ON metabolites USING gin (lower({c}) gin_trgm_ops)"
+    for c in FULLTEXT_COLUMNS
+]
+
+
+def ensure_sqlite_fulltext(execute: Callable[[str], List[tuple]], rebuild: bool = False) -> bool:
+    """Create the FTS5 index and its triggers if missing; rebuild it when it may be stale
+
+    Importers that drop and recreate the metabolites table also drop the triggers, so missing
+    triggers mean the index has to be rebuilt from the table. Returns False when this SQLite
+    build has no FTS5 trigram tokenizer.
+    """
+    if not execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'metabolites'"):
+        return False
+    existing = {row[0] for row in execute(
+        f"SELECT name FROM sqlite_master WHERE name = '{FULLTEXT_TABLE}' OR name LIKE 'metabolites_fts_%'"
+    )}
+    try:
+        execute(SQLITE_FULLTEXT_TABLE)
+    except Exception as e:
+        logger.warning(f"SQLite full-text index unavailable (FTS5 trigram tokenizer needs SQLite 3.34+): {e}")
+        return False
+    stale = rebuild or FULLTEXT_TABLE not in existing or not set(SQLITE_FULLTEXT_TRIGGERS) <= existing
+    for statement in SQLITE_FULLTEXT_TRIGGERS.values():
+        execute(statement)
+    if stale:
+        execute(f"INSERT INTO {FULLTEXT_TABLE}({FULLTEXT_TABLE}) VALUES ('rebuild')")
+        logger.info("Metabolite full-text index rebuilt")
+    return True
+
+
+def update_fulltext_index(conn: sqlite3.Connection, rebuild: bool = True) -> bool:
+    """Bring the full-text index of an SQLite database up to date (called by importers)"""
+    available = ensure_sqlite_fulltext(lambda sql: conn.execute(sql).fetchall(), rebuild)
+    conn.commit()
+    return available
+
+
+async def ensure_fulltext_index(engine: AsyncEngine) -> bool:
+    """Create the full-text search structures for the configured database at startup"""
+    async with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            def run(sync_conn):
+                def execute(sql: str) -> List[tuple]:
+                    result = sync_conn.exec_driver_sql(sql)
+                    return result.fetchall() if result.returns_rows else []
+                return ensure_sqlite_fulltext(execute)
+            return await conn.run_sync(run)
+        if conn.dialect.name == "postgresql":
+            for statement in POSTGRES_TRIGRAM_STATEMENTS:
+                await conn.exec_driver_sql(statement)
+            return True
+    return False
+
+
+_fulltext_databases: Set[str] = set()
+
+
+async def _has_fulltext(db: AsyncSession) -> bool:
+    url = str(db.bind.url)
+    if url not in _fulltext_databases:
+        result = await db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FULLTEXT_TABLE}
+        )
+        if result.first() is None:
+            return False
+        _fulltext_databases.add(url)
+    return True
+
+
+def _like_condition(q: str):
+    pattern = f"%{q.strip().lower()}%"
+    return or_(*(func.lower(getattr(Metabolite, c)).like(pattern) for c in FULLTEXT_COLUMNS))
+
+
+async def metabolite_text_condition(db: AsyncSession, q: str):
+    """Case-insensitive substring match over FULLTEXT_COLUMNS
+
+    Prefixed identifiers (HMDB0000122, C00031, CHEBI:4167, CID:5793) go to the unique indexes of
+    their columns only. Otherwise on SQLite with the FTS5 index this is a trigram MATCH on the index;
+    elsewhere (short queries, no index, PostgreSQL where pg_trgm indexes serve the LIKE directly) the
+    LIKE predicate. A bare number is OR'd with its CID/ChEBI lookup so "12" still finds "Vitamin B12".
+    """
+    identifiers = parse_identifier(q)
+    if identifiers and not is_bare_number(q):
+        return identifier_condition(identifiers)
+    condition = await _substring_condition(db, q)
+    if identifiers:
+        return or_(identifier_condition(identifiers), condition)
+    return condition
+
+
+async def _substring_condition(db: AsyncSession, q: str):
+    if db.bind.dialect.name == "sqlite" and len(q.strip()) >= MIN_FULLTEXT_QUERY and await _has_fulltext(db):
+        phrase = '"' + q.strip().replace('"', '""') + '"'
+        fts = table(FULLTEXT_TABLE, column("rowid"))
+        matches = select(fts.c.rowid).where(text(f"{FULLTEXT_TABLE} MATCH :fts_query").bindparams(fts_query=phrase))
+        return Metabolite.id.in_(matches)
+    return _like_condition(q)
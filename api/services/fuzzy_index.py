@@ -0,0 +1,269 @@
+import asyncio
+import os
+import re
+import sqlite3
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models import Metabolite, Enzyme
+from api.services import compound_index
+from api.services.compound_index import compounds_version
+from api.services.data_version import VersionedIndex, change_counter, enzymes_content_version
+
+# Sources covered by the fuzzy name index
+FUZZY_SOURCES = ("metabolites", "enzymes") + tuple(compound_index.SIDECAR_SOURCES)
+
+# Names sharing the most trigrams with a query that are checked for edit distance
+FUZZY_MAX_CANDIDATES = int(os.getenv("FUZZY_MAX_CANDIDATES", "1000"))
+
+# Characters of a name compared by the edit distance check
+FUZZY_VERIFY_LENGTH = 64
+
+NAME_FIELDS = ("name", "name_ru")
+
+# Cyrillic letters that look like Latin ones ("глюкозa" with a Latin a) fold to the Latin letter
+_HOMOGLYPHS = str.maketrans("аеорсухкмтнвіјѕ", "aeopcyxkmthbijs")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def fold_name(text: str) -> str:
+    """Lowercase, strip diacritics, fold Cyrillic homoglyphs to Latin and collapse punctuation to spaces"""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c)).translate(_HOMOGLYPHS)
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def resolve_fuzzy_sources(sources: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """Validate source names ("metabolites,enzymes" or a list); None means all sources"""
+    if isinstance(sources, str):
+        sources = [s.strip() for s in sources.split(",") if s.strip()]
+    if not sources:
+        return FUZZY_SOURCES
+    unknown = [s for s in sources if s not in FUZZY_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source: {', '.join(unknown)}. Available: {', '.join(FUZZY_SOURCES)}")
+    return tuple(s for s in FUZZY_SOURCES if s in sources)
+
+
+def auto_max_edits(query: str) -> int:
+    """Edits tolerated by default: none up to 3 characters, one up to 6, two beyond"""
+    return 0 if len(query) <= 3 else 1 if len(query) <= 6 else 2
+
+
+def _codepoints(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def substring_edit_distance(query: str, texts: Sequence[str], max_length: int = FUZZY_VERIFY_LENGTH) -> np.ndarray:
+    """Fewest edits turning query into a substring of each text (Sellers' algorithm, all texts at once)
+
+    Each row of the dynamic programming table is computed for every text together; the insertion
+    term along the text becomes a running minimum of D - j.
+    """
+    count = len(texts)
+    if count == 0:
+        return np.empty(0, dtype=np.int32)
+    lengths = np.array([min(len(t), max_length) for t in texts], dtype=np.int64)
+    width = max(int(lengths.max()), 1)
+    chars = np.zeros((count, width), dtype=np.uint32)
+    flat = _codepoints("".join(t[:max_length] for t in texts))
+    rows = np.repeat(np.arange(count), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    chars[rows, cols] = flat
+    # Padding never matches a query character
+    chars[np.arange(width)[None, :] >= lengths[:, None]] = 0xFFFFFFFF
+
+    j = np.arange(width + 1, dtype=np.int32)
+    previous = np.zeros((count, width + 1), dtype=np.int32)
+    for i, char in enumerate(_codepoints(query).tolist(), 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(previous[:, 1:] + 1, previous[:, :-1] + (chars != char))
+        previous = np.minimum.accumulate(current - j, axis=1) + j
+    previous[j[None, :] > lengths[:, None]] = np.iinfo(np.int32).max
+    return previous.min(axis=1)
+
+
+def _trigram_codes(chars: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(owner, code) of every character trigram of strings packed in chars at starts/lengths"""
+    counts = np.maximum(lengths - 2, 0)
+    owners = np.repeat(np.arange(len(lengths)), counts)
+    positions = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    chars = chars.astype(np.int64)
+    codes = (chars[positions] << 42) | (chars[positions + 1] << 21) | chars[positions + 2]
+    return owners, codes
+
+
+@dataclass
+class FuzzyMatches:
+    """Best fuzzy hits, one per (source, row), ordered by edit distance then trigram similarity"""
+    entries: np.ndarray
+    distance: np.ndarray
+    similarity: np.ndarray
+
+
+class FuzzyNameIndex:
+    """Trigram inverted index over folded compound and enzyme names, stored as CSR arrays
+
+    Entry i is one name (NAME_FIELDS[fields[i]]) of row row_ids[i] in source source_names[source_codes[i]],
+    primary[i] the entry of that row's English name; the postings of trigram grams[k] are postings[offsets[k]:offsets[k + 1]].
+    """
+
+    def __init__(self, sources: Dict[str, Tuple[np.ndarray, List[str], List[Optional[str]]]]):
+        self.source_names = list(sources)
+        codes, ids, fields, primary, names = [], [], [], [], []
+        for code, source in enumerate(self.source_names):
+            source_ids, source_names, source_names_ru = sources[source]
+            source_ids = np.asarray(source_ids, dtype=np.int64)
+            for field, column in enumerate((source_names, source_names_ru)):
+                keep = [i for i, name in enumerate(column) if name and name.strip()]
+                codes.append(np.full(len(keep), code, dtype=np.int8))
+                ids.append(source_ids[keep])
+                fields.append(np.full(len(keep), field, dtype=np.int8))
+                names.extend(column[i] for i in keep)
+            # Entry holding the English name of each row, for hits on its Russian name
+            first = len(names) - len(ids[-1]) - len(ids[-2])
+            name_ids, ru_ids = ids[-2], ids[-1]
+            order = np.argsort(name_ids, kind="stable")
+            found = np.minimum(np.searchsorted(name_ids, ru_ids, sorter=order), max(len(name_ids) - 1, 0))
+            ru_entries = np.arange(len(ru_ids)) + first + len(name_ids)
+            if len(name_ids):
+                ru_entries = np.where(name_ids[order[found]] == ru_ids, order[found] + first, ru_entries)
+            primary += [np.arange(len(name_ids)) + first, ru_entries]
+        self.source_codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int8)
+        self.row_ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        self.fields = np.concatenate(fields) if fields else np.empty(0, dtype=np.int8)
+        self.primary = np.concatenate(primary).astype(np.int64) if primary else np.empty(0, dtype=np.int64)
+
+        # Original names as one UTF-8 buffer
+        encoded = [name.encode() for name in names]
+        self.name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=self.name_offsets[1:])
+        self.name_buffer = b"".join(encoded)
+
+        # Folded names padded with one space on each side, so word starts and ends form trigrams
+        padded = [f" {fold_name(name)} " for name in names]
+        lengths = np.array([len(p) for p in padded], dtype=np.int64)
+        chars = _codepoints("".join(padded))
+        owners, trigrams = _trigram_codes(chars, np.cumsum(lengths) - lengths, lengths)
+        order = np.lexsort((owners, trigrams))
+        owners, trigrams = owners[order], trigrams[order]
+        unique = np.ones(len(trigrams), dtype=bool)
+        unique[1:] = (trigrams[1:] != trigrams[:-1]) | (owners[1:] != owners[:-1])
+        owners, trigrams = owners[unique], trigrams[unique]
+        self.grams, starts = np.unique(trigrams, return_index=True)
+        self.offsets = np.append(starts, len(trigrams)).astype(np.int64)
+        self.postings = owners.astype(np.int32)
+        self.gram_counts = np.bincount(owners, minlength=len(names)).astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def name(self, entry: int) -> str:
+        return self.name_buffer[self.name_offsets[entry]:self.name_offsets[entry + 1]].decode()
+
+    @classmethod
+    async def from_sources(cls, db: AsyncSession) -> "FuzzyNameIndex":
+        """Load names of metabolites and enzymes (through the session) and of every sidecar database"""
+        sources = {}
+        for source, model in (("metabolites", Metabolite), ("enzymes", Enzyme)):
+            rows = (await db.execute(select(model.id, model.name, model.name_ru))).all()
+            sources[source] = (
+                np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+                [row[1] for row in rows],
+                [row[2] for row in rows],
+            )
+        for source, path in compound_index.SIDECAR_SOURCES.items():
+            sources[source] = await asyncio.to_thread(_read_sidecar_names, path, source)
+        return cls(sources)
+
+    def search(
+        self,
+        query: str,
+        max_edits: Optional[int] = None,
+        sources: Optional[Sequence[str]] = None,
+        max_candidates: int = FUZZY_MAX_CANDIDATES
+    ) -> FuzzyMatches:
+        """Names within max_edits of the query or of a part of it
+
+        Candidates come from the trigram postings: an edit changes at most three trigrams, so a name
+        within k edits shares at least (query trigrams - 3k) of them. The max_candidates candidates
+        with the highest trigram similarity are then checked by edit distance.
+        """
+        folded = fold_name(query)
+        empty = FuzzyMatches(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0))
+        if not folded or len(self) == 0:
+            return empty
+        max_edits = auto_max_edits(folded) if max_edits is None else max_edits
+
+        padded = f" {folded} "
+        _, query_grams = _trigram_codes(_codepoints(padded), np.zeros(1, dtype=np.int64), np.array([len(padded)]))
+        query_grams = np.unique(query_grams)
+        position = np.minimum(np.searchsorted(self.grams, query_grams), len(self.grams) - 1)
+        found = position[self.grams[position] == query_grams]
+        if len(found) == 0:
+            return empty
+        hits = np.concatenate([
+            self.postings[start:end] for start, end in zip(self.offsets[found].tolist(), self.offsets[found + 1].tolist())
+        ])
+        shared = np.bincount(hits, minlength=len(self))
+
+        candidates = np.flatnonzero(shared >= max(1, len(query_grams) - 3 * max_edits))
+        if sources is not None:
+            codes = [self.source_names.index(s) for s in sources if s in self.source_names]
+            candidates = candidates[np.isin(self.source_codes[candidates], codes)]
+        similarity = shared[candidates] / (len(query_grams) + self.gram_counts[candidates] - shared[candidates])
+        if len(candidates) > max_candidates:
+            top = np.argpartition(-similarity, max_candidates - 1)[:max_candidates]
+            candidates, similarity = candidates[top], similarity[top]
+
+        texts = [fold_name(self.name(entry)) for entry in candidates.tolist()]
+        distance = substring_edit_distance(folded, texts)
+        keep = distance <= max_edits
+        candidates, distance, similarity = candidates[keep], distance[keep], similarity[keep]
+
+        # Best name per record: fewest edits, then most similar
+        order = np.lexsort((-similarity, distance))
+        candidates, distance, similarity = candidates[order], distance[order], similarity[order]
+        records = self.source_codes[candidates].astype(np.int64) << 56 | self.row_ids[candidates]
+        _, first = np.unique(records, return_index=True)
+        first.sort()
+        return FuzzyMatches(candidates[first], distance[first], similarity[first])
+
+
+def _read_sidecar_names(path: str, table: str) -> Tuple[np.ndarray, List[str], List[Optional[str]]]:
+    if not os.path.exists(path):
+        return np.empty(0, dtype=np.int64), [], []
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(f"SELECT id, name, name_ru FROM {table}").fetchall()
+    finally:
+        conn.close()
+    return (
+        np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+        [row[1] for row in rows],
+        [row[2] for row in rows],
+    )
+
+
+async def names_version(db: AsyncSession) -> Hashable:
+    """Fingerprint of every table whose names are indexed, including edits of name and name_ru
+    (change counters of metabolites and enzymes, modification times of the sidecar databases)"""
+    return (
+        await compounds_version(db),
+        await change_counter(db, "metabolites"),
+        await enzymes_content_version(db)
+    )
+
+
+_fuzzy_index = VersionedIndex(FuzzyNameIndex.from_sources, names_version)
+
+
+async def get_fuzzy_index(db: AsyncSession) -> FuzzyNameIndex:
+    """Shared fuzzy name index, rebuilt when any indexed table changes"""
+    return await _fuzzy_index.get(db)
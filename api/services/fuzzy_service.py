@@ -0,0 +1,54 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Sequence, Union
+from api.schemas import FuzzyMatch, FuzzySearchResponse
+from api.services.fuzzy_index import NAME_FIELDS, auto_max_edits, fold_name, get_fuzzy_index, resolve_fuzzy_sources
+
+# Largest edit distance a fuzzy search accepts
+FUZZY_MAX_EDITS = 3
+
+class FuzzySearchService:
+
+    @staticmethod
+    async def search(
+        db: AsyncSession,
+        q: str,
+        sources: Optional[Union[str, Sequence[str]]] = None,
+        max_edits: Optional[int] = None,
+        limit: int = 20
+    ) -> FuzzySearchResponse:
+        """Typo-tolerant name search over metabolites, enzymes, lipids and carbohydrates
+        (raises ValueError for unknown sources or max_edits out of range)
+
+        English and Russian names are matched; Cyrillic letters typed in place of Latin ones and
+        vice versa are folded together, so "глюкозa" with a Latin "a" still finds glucose.
+        """
+
+        selected = resolve_fuzzy_sources(sources)
+        if max_edits is not None and not 0 <= max_edits <= FUZZY_MAX_EDITS:
+            raise ValueError(f"max_edits must be between 0 and {FUZZY_MAX_EDITS}")
+        normalized = fold_name(q)
+        edits = auto_max_edits(normalized) if max_edits is None else max_edits
+
+        index = await get_fuzzy_index(db)
+        hits = index.search(q, edits, selected)
+        matches = [
+            FuzzyMatch(
+                source=index.source_names[index.source_codes[entry]],
+                id=int(index.row_ids[entry]),
+                name=index.name(int(index.primary[entry])),
+                matched_name=index.name(entry),
+                field=NAME_FIELDS[index.fields[entry]],
+                distance=int(distance),
+                similarity=round(float(similarity), 3)
+            )
+            for entry, distance, similarity in zip(
+                hits.entries[:limit].tolist(), hits.distance[:limit].tolist(), hits.similarity[:limit].tolist()
+            )
+        ]
+        return FuzzySearchResponse(
+            query=q,
+            normalized_query=normalized,
+            max_edits=edits,
+            matches=matches,
+            total_names=len(index)
+        )
@@ -0,0 +1,74 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Sequence, Union
+import asyncio
+import numpy as np
+from api.schemas import GlycanComposition, GlycanItem, GlycanSearchResponse
+from api.services.adducts import resolve_adducts
+from api.services.annotation_service import AnnotationService
+from api.services.compound_index import compounds_version, read_sidecar_formulas
+from api.services.data_version import VersionedIndex
+from api.services.glycans import GLYCAN_MAX_DP, get_glycan_table
+from api.services.mass_index import MassIndex
+
+# Database carbohydrates by canonical formula, reloaded with the sidecar databases
+_carbohydrate_formulas = VersionedIndex(
+    lambda db: asyncio.to_thread(read_sidecar_formulas, "carbohydrates"), compounds_version
+)
+
+_mass_indexes: Dict[int, MassIndex] = {}
+
+class GlycanService:
+
+    @staticmethod
+    async def search_compositions(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 10.0,
+        max_results: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        max_dp: int = GLYCAN_MAX_DP
+    ) -> GlycanSearchResponse:
+        """Hex/HexNAc/dHex/NeuAc/Pent compositions of free glycans matching every m/z value
+        (raises ValueError for unknown adducts); without adducts the values are neutral masses"""
+
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        adduct_list = resolve_adducts(adducts, ion_mode)
+        table = get_glycan_table(max_dp)
+        if max_dp not in _mass_indexes:
+            _mass_indexes[max_dp] = MassIndex.from_sorted(table.masses, np.arange(len(table), dtype=np.int64))
+
+        matches = await AnnotationService._search_candidates(
+            db, mz_array, tol_ppm, max_results, adduct_list, index=_mass_indexes[max_dp]
+        )
+        known = await _carbohydrate_formulas.get(db)
+
+        bounds = np.searchsorted(matches.query_index, np.arange(len(mz_array) + 1))
+        rows = matches.ids.tolist()
+        dp = table.degree(matches.ids).tolist()
+        adduct_names = matches.adducts.tolist() if matches.adducts is not None else [None] * len(rows)
+
+        items = []
+        for peak, mz in enumerate(mz_array.tolist()):
+            compositions = []
+            for j in range(bounds[peak], bounds[peak + 1]):
+                formula = table.formula(rows[j])
+                compositions.append(GlycanComposition(
+                    composition=table.name(rows[j]),
+                    residues=table.composition(rows[j]),
+                    formula=formula,
+                    neutral_mass=round(float(matches.masses[j]), 6),
+                    dp=dp[j],
+                    mass_error_ppm=round(float(matches.error_ppm[j]), 2),
+                    mass_error_da=round(float(matches.error_da[j]), 6),
+                    adduct=adduct_names[j],
+                    database_matches=known.get(formula, [])[:10]
+                ))
+            items.append(GlycanItem(mz=round(mz, 6), compositions=compositions))
+
+        return GlycanSearchResponse(
+            items=items,
+            total_peaks=len(items),
+            matched_peaks=sum(1 for item in items if item.compositions),
+            max_dp=max_dp
+        )
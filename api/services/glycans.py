@@ -0,0 +1,143 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from api.services.formula import MONOISOTOPIC_MASSES, hill_formula, parse_formula
+
+# Largest number of monosaccharide residues enumerated by the composition table
+GLYCAN_MAX_DP = int(os.getenv("GLYCAN_MAX_DP", "12"))
+
+# Monosaccharide residues as they occur in a chain (free monosaccharide minus H2O)
+GLYCAN_RESIDUES: Dict[str, str] = {
+    "Hex": "C6H10O5",
+    "HexNAc": "C8H13NO5",
+    "dHex": "C6H10O4",
+    "NeuAc": "C11H17NO8",
+    "Pent": "C5H8O4",
+}
+
+# A free reducing glycan carries one extra water
+REDUCING_END = "H2O"
+
+
+@dataclass
+class GlycanMatches:
+    """Flat composition hits sorted by query, then absolute error"""
+    query_index: np.ndarray
+    rows: np.ndarray
+    masses: np.ndarray
+    error_da: np.ndarray
+    error_ppm: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def _element_counts(formula: str, elements: List[str]) -> np.ndarray:
+    counts = parse_formula(formula)
+    return np.array([counts.get(e, 0) for e in elements], dtype=np.int64)
+
+
+class GlycanCompositionTable:
+    """Every residue combination up to max_dp residues, sorted by mass for binary search
+
+    Compositions are built residue by residue (each row is extended with 0..remaining copies of the
+    next residue), so the table holds exactly the combinations with at most max_dp residues.
+    """
+
+    def __init__(self, max_dp: int = GLYCAN_MAX_DP, residues: Optional[Dict[str, str]] = None):
+        residues = residues or GLYCAN_RESIDUES
+        self.max_dp = max_dp
+        self.residue_names = list(residues)
+
+        counts = np.zeros((1, 0), dtype=np.int16)
+        for _ in self.residue_names:
+            room = max_dp - counts.sum(axis=1).astype(np.int64) + 1
+            rows = np.repeat(np.arange(len(counts)), room)
+            values = np.arange(room.sum()) - np.repeat(np.cumsum(room) - room, room)
+            counts = np.column_stack([counts[rows], values]).astype(np.int16)
+        counts = counts[counts.sum(axis=1) > 0]
+
+        self._elements = sorted({e for f in residues.values() for e in parse_formula(f)} | set(parse_formula(REDUCING_END)))
+        residue_elements = np.array([_element_counts(residues[name], self._elements) for name in self.residue_names])
+        end_elements = _element_counts(REDUCING_END, self._elements)
+        element_masses = np.array([MONOISOTOPIC_MASSES[e] for e in self._elements])
+
+        elements = counts.astype(np.int64) @ residue_elements + end_elements
+        masses = elements @ element_masses
+        order = np.argsort(masses, kind="stable")
+        self.counts = counts[order]
+        self.masses = masses[order]
+        self._element_table = elements[order]
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+    def search(self, masses: np.ndarray, tol_ppm: float, max_results: Optional[int] = 20) -> GlycanMatches:
+        """Compositions within tol_ppm of every neutral mass, closest first"""
+        masses = np.atleast_1d(np.asarray(masses, dtype=np.float64))
+        delta = masses * tol_ppm / 1e6
+        left = np.searchsorted(self.masses, masses - delta, side="left")
+        right = np.searchsorted(self.masses, masses + delta, side="right")
+        sizes = np.where(np.isfinite(masses), right - left, 0)
+
+        query = np.repeat(np.arange(len(masses)), sizes)
+        rows = np.repeat(left, sizes) + (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+        error = self.masses[rows] - masses[query]
+        order = np.lexsort((np.abs(error), query))
+        query, rows, error = query[order], rows[order], error[order]
+        if max_results is not None:
+            keep = np.arange(len(query)) - np.searchsorted(query, query, side="left") < max_results
+            query, rows, error = query[keep], rows[keep], error[keep]
+        return GlycanMatches(
+            query_index=query,
+            rows=rows,
+            masses=self.masses[rows],
+            error_da=error,
+            error_ppm=error / masses[query] * 1e6
+        )
+
+    def name(self, row: int) -> str:
+        """Composition shorthand, e.g. Hex5HexNAc4"""
+        return "".join(
+            name if count == 1 else f"{name}{count}"
+            for name, count in zip(self.residue_names, self.counts[row].tolist()) if count
+        )
+
+    def formula(self, row: int) -> str:
+        return hill_formula(dict(zip(self._elements, self._element_table[row].tolist())))
+
+    def composition(self, row: int) -> Dict[str, int]:
+        return {name: count for name, count in zip(self.residue_names, self.counts[row].tolist()) if count}
+
+    def degree(self, rows: np.ndarray) -> np.ndarray:
+        """Number of residues (degree of polymerization) of each composition"""
+        return self.counts[rows].sum(axis=1)
+
+
+_tables: Dict[int, GlycanCompositionTable] = {}
+
+
+def get_glycan_table(max_dp: int = GLYCAN_MAX_DP) -> GlycanCompositionTable:
+    """Shared composition table per degree of polymerization, built on first use"""
+    if max_dp not in _tables:
+        _tables[max_dp] = GlycanCompositionTable(max_dp)
+    return _tables[max_dp]
+
+
+def search_glycan_compositions(mass: float, tol_ppm: float = 10.0, limit: int = 20) -> List[Dict[str, object]]:
+    """Glycan compositions matching one neutral mass as plain dicts (used by the UI search)"""
+    table = get_glycan_table()
+    matches = table.search(np.array([mass]), tol_ppm, limit)
+    return [
+        {
+            "name": table.name(row),
+            "formula": table.formula(row),
+            "exact_mass": round(float(m), 6),
+            "mass_error_ppm": round(float(ppm), 2),
+            "dp": int(dp),
+        }
+        for row, m, ppm, dp in zip(
+            matches.rows.tolist(), matches.masses, matches.error_ppm, table.degree(matches.rows)
+        )
+    ]
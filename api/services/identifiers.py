@@ -0,0 +1,80 @@
+import re
+from dataclasses import dataclass
+from typing import List
+from sqlalchemy import and_, or_
+from api.models import Metabolite
+
+# External identifier columns, each backed by a unique index on metabolites
+IDENTIFIER_COLUMNS = ("hmdb_id", "kegg_id", "chebi_id", "pubchem_cid")
+
+# Current HMDB accessions have seven digits, legacy ones (HMDB00122) five
+HMDB_DIGITS = 7
+HMDB_LEGACY_DIGITS = 5
+
+_HMDB = re.compile(r"^HMDB(\d+)$", re.IGNORECASE)
+_KEGG = re.compile(r"^(?:KEGG:|CPD:)?(C\d{5})$", re.IGNORECASE)
+_CHEBI = re.compile(r"^CHEBI:\s*(\d+)$", re.IGNORECASE)
+_PUBCHEM = re.compile(r"^(?:CID|PUBCHEM)[:\s]*(\d+)$", re.IGNORECASE)
+_NUMBER = re.compile(r"^\d+$")
+
+
+@dataclass(frozen=True)
+class Identifier:
+    """An identifier lookup: equality on a column, or a prefix range for partial accessions"""
+    column: str
+    value: str
+    prefix: bool = False
+
+
+def _chebi(number: str) -> List[Identifier]:
+    # The HMDB and ChEBI importers store bare numbers, other sources the CHEBI: prefixed form
+    return [Identifier("chebi_id", f"CHEBI:{int(number)}"), Identifier("chebi_id", str(int(number)))]
+
+
+def parse_identifier(query: str) -> List[Identifier]:
+    """Lookups for an HMDB, KEGG, ChEBI or PubChem identifier; empty if the query is not one
+
+    Values are normalized to the stored form (HMDB0000122, C00031, CHEBI:4167, 5793); ChEBI
+    accessions are looked up both with and without the CHEBI: prefix. A bare number is tried both
+    as a PubChem CID and as a ChEBI accession.
+    """
+    query = query.strip()
+    match = _HMDB.match(query)
+    if match:
+        digits = match.group(1)
+        if len(digits) == HMDB_LEGACY_DIGITS:
+            digits = digits.zfill(HMDB_DIGITS)
+        return [Identifier("hmdb_id", "HMDB" + digits, prefix=len(digits) < HMDB_DIGITS)]
+    match = _KEGG.match(query)
+    if match:
+        return [Identifier("kegg_id", match.group(1).upper())]
+    match = _CHEBI.match(query)
+    if match:
+        return _chebi(match.group(1))
+    match = _PUBCHEM.match(query)
+    if match:
+        return [Identifier("pubchem_cid", str(int(match.group(1))))]
+    if _NUMBER.match(query):
+        return [Identifier("pubchem_cid", str(int(query)))] + _chebi(query)
+    return []
+
+
+def is_bare_number(query: str) -> bool:
+    """Whether the query is only digits: it may be an accession but also part of a name or formula"""
+    return bool(_NUMBER.match(query.strip()))
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def identifier_condition(identifiers: List[Identifier]):
+    """Index-friendly predicate: equality, or a [prefix, next prefix) range instead of LIKE"""
+    clauses = []
+    for identifier in identifiers:
+        column = getattr(Metabolite, identifier.column)
+        if identifier.prefix:
+            clauses.append(and_(column >= identifier.value, column < _prefix_upper_bound(identifier.value)))
+        else:
+            clauses.append(column == identifier.value)
+    return or_(*clauses)
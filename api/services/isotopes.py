@@ -0,0 +1,125 @@
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models import Metabolite
+from api.services.data_version import VersionedIndex
+from api.services.formula import parse_formula
+
+# Natural abundance of the +1 and +2 Da isotopes relative to the monoisotopic one (IUPAC)
+ISOTOPE_RATIOS: Dict[str, Tuple[float, float]] = {
+    "C": (0.0107 / 0.9893, 0.0),
+    "H": (0.000115 / 0.999885, 0.0),
+    "N": (0.00364 / 0.99636, 0.0),
+    "O": (0.00038 / 0.99757, 0.00205 / 0.99757),
+    "S": (0.0075 / 0.9499, 0.0425 / 0.9499),
+    "Si": (0.04685 / 0.92223, 0.03092 / 0.92223),
+    "Cl": (0.0, 0.2424 / 0.7576),
+    "Br": (0.0, 0.4931 / 0.5069),
+    "K": (0.000117 / 0.932581, 0.067302 / 0.932581),
+    "Mg": (0.1000 / 0.7899, 0.1101 / 0.7899),
+    "Ca": (0.0, 0.00647 / 0.96941),
+    "Fe": (0.02119 / 0.91754, 0.00282 / 0.91754),
+    "Se": (0.0, 0.2377 / 0.4961),
+}
+
+# Relative tolerance and absolute floor used when comparing observed and theoretical ratios
+ISOTOPE_RELATIVE_ERROR = 0.1
+ISOTOPE_ABSOLUTE_ERROR = 0.01
+
+_ELEMENTS = list(ISOTOPE_RATIOS)
+_R1 = np.array([ISOTOPE_RATIOS[e][0] for e in _ELEMENTS])
+_R2 = np.array([ISOTOPE_RATIOS[e][1] for e in _ELEMENTS])
+
+
+def envelope_terms(formulas: Iterable[Optional[str]]) -> np.ndarray:
+    """Per-formula sums (S1, Q1, S2) that are linear in element counts (NaN for unparsable formulas)
+
+    S1 = sum n*r1, Q1 = sum n*r1^2 and S2 = sum n*r2, so the terms of 2M or M plus an adduct
+    are plain linear combinations of the terms of M.
+    """
+    formulas = list(formulas)
+    counts = np.zeros((len(formulas), len(_ELEMENTS)))
+    valid = np.zeros(len(formulas), dtype=bool)
+    column = {element: j for j, element in enumerate(_ELEMENTS)}
+    for i, formula in enumerate(formulas):
+        parsed = parse_formula(formula)
+        if parsed is None:
+            continue
+        valid[i] = True
+        for element, count in parsed.items():
+            j = column.get(element)
+            if j is not None:
+                counts[i, j] = count
+
+    terms = np.column_stack([counts @ _R1, counts @ (_R1 ** 2), counts @ _R2])
+    terms[~valid] = np.nan
+    return terms
+
+
+def envelope_from_terms(terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """M+1/M0 and M+2/M0 intensity ratios
+
+    The M+2 ratio adds single +2 isotopes and pairs of +1 isotopes on different atoms,
+    which is exact for the first two coefficients of the isotope polynomial.
+    """
+    s1, q1, s2 = terms[..., 0], terms[..., 1], terms[..., 2]
+    return s1, s2 + (s1 ** 2 - q1) / 2
+
+
+def theoretical_envelope(formula: str) -> Tuple[float, float]:
+    """M+1/M0 and M+2/M0 ratios of a single formula"""
+    m1, m2 = envelope_from_terms(envelope_terms([formula])[0])
+    return float(m1), float(m2)
+
+
+def isotope_scores(observed: np.ndarray, m1: np.ndarray, m2: np.ndarray) -> np.ndarray:
+    """Gaussian similarity in [0, 1] of observed (M+1/M0, M+2/M0) ratios to the theoretical ones
+
+    Missing observations are skipped; rows without any observation or formula score NaN.
+    """
+    theoretical = np.column_stack([m1, m2])
+    sigma = ISOTOPE_RELATIVE_ERROR * theoretical + ISOTOPE_ABSOLUTE_ERROR
+    z = (observed - theoretical) / sigma
+    present = np.isfinite(z)
+    chi2 = np.where(present, z ** 2, 0.0).sum(axis=1)
+    return np.where(present.any(axis=1), np.exp(-0.5 * chi2), np.nan)
+
+
+class IsotopeEnvelopeIndex:
+    """Envelope terms computed once per unique formula and looked up by metabolite id"""
+
+    def __init__(self, ids: np.ndarray, formulas: Sequence[Optional[str]]):
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids)
+        self.ids = ids[order]
+        keys = np.array([f or "" for f in formulas], dtype=object)[order]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        self.formula_count = len(unique)
+        self._formula_row = inverse.astype(np.int64)
+        self._terms = envelope_terms(unique.tolist())
+
+    @classmethod
+    async def from_database(cls, db: AsyncSession) -> "IsotopeEnvelopeIndex":
+        result = await db.execute(select(Metabolite.id, Metabolite.formula))
+        rows = result.all()
+        return cls([row[0] for row in rows], [row[1] for row in rows])
+
+    def terms(self, ids: np.ndarray) -> np.ndarray:
+        """(S1, Q1, S2) terms for the given metabolite ids (NaN for unknown ids)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        terms = np.full((len(ids), 3), np.nan)
+        if len(self.ids) == 0:
+            return terms
+        pos = np.clip(np.searchsorted(self.ids, ids), 0, len(self.ids) - 1)
+        found = self.ids[pos] == ids
+        terms[found] = self._terms[self._formula_row[pos[found]]]
+        return terms
+
+
+_isotope_index = VersionedIndex(IsotopeEnvelopeIndex.from_database)
+
+
+async def get_isotope_index(db: AsyncSession) -> IsotopeEnvelopeIndex:
+    """Shared envelope table, rebuilt only when the metabolites table changes"""
+    return await _isotope_index.get(db)
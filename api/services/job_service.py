@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from api.database.base import AsyncSessionLocal
+from api.schemas import AnnotationJob, AnnotationItem
+from api.services.annotation_service import AnnotationService, STREAM_CSV_COLUMNS
+
+# Where job inputs, status and results are persisted
+ANNOTATION_JOBS_DIR = os.getenv("ANNOTATION_JOBS_DIR", "data/jobs")
+
+# Number of jobs processed concurrently
+ANNOTATION_JOB_WORKERS = int(os.getenv("ANNOTATION_JOB_WORKERS", "2"))
+
+# Peaks annotated (and persisted) per progress step
+ANNOTATION_JOB_CHUNK_SIZE = int(os.getenv("ANNOTATION_JOB_CHUNK_SIZE", "5000"))
+
+# Seconds a finished job and its files are kept before being pruned (0 = keep forever)
+ANNOTATION_JOB_TTL = float(os.getenv("ANNOTATION_JOB_TTL", "86400"))
+
+# Seconds between scans of the jobs directory for expired jobs
+ANNOTATION_JOB_PRUNE_INTERVAL = 60
+
+FINISHED_STATUSES = ("completed", "failed", "interrupted")
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class AnnotationJobManager:
+    """In-process annotation job queue with a fixed pool of asyncio workers and on-disk results"""
+
+    def __init__(
+        self,
+        jobs_dir: str = ANNOTATION_JOBS_DIR,
+        workers: int = ANNOTATION_JOB_WORKERS,
+        session_factory=AsyncSessionLocal,
+        chunk_size: int = ANNOTATION_JOB_CHUNK_SIZE,
+        ttl: float = ANNOTATION_JOB_TTL
+    ):
+        self.jobs_dir = Path(jobs_dir)
+        self.workers = workers
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self._pruned_at: Optional[float] = None
+        self._jobs: Dict[str, AnnotationJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._loop = None
+
+    # Submission
+
+    async def submit_mz_list(self, mz_values: List[float], **params) -> AnnotationJob:
+        """Queue annotation of an m/z list"""
+        job = self._create_job("mz-list", len(mz_values), params)
+        np.save(self._job_dir(job.job_id) / "input.npy", np.asarray(mz_values, dtype=np.float64))
+        return await self._enqueue(job)
+
+    async def submit_csv(self, source: BinaryIO, mz_column: str = "mz", **params) -> AnnotationJob:
+        """Queue annotation of a CSV file (copied to the job directory first)"""
+        params["mz_column"] = mz_column
+        job = self._create_job("csv", 0, params)
+        path = self._job_dir(job.job_id) / "input.csv"
+        with open(path, "wb") as target:
+            await asyncio.to_thread(shutil.copyfileobj, source, target)
+
+        try:
+            # Validate the column before accepting the job
+            with open(path, "rb") as f:
+                AnnotationService.open_csv_chunks(f, mz_column, self.chunk_size).close()
+        except Exception:
+            shutil.rmtree(self._job_dir(job.job_id), ignore_errors=True)
+            self._jobs.pop(job.job_id, None)
+            raise
+
+        job.total_peaks = await asyncio.to_thread(self._count_csv_rows, path, mz_column, self.chunk_size)
+        self._save(job)
+        return await self._enqueue(job)
+
+    # Status and results
+
+    def get_job(self, job_id: str) -> Optional[AnnotationJob]:
+        """Current job status, from memory or from disk after a restart"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        if job_id in self._jobs:
+            return self._jobs[job_id]
+
+        status_path = self.jobs_dir / job_id / "status.json"
+        if not status_path.exists():
+            return None
+        job = AnnotationJob(**json.loads(status_path.read_text(encoding="utf-8")))
+        if job.status in ("queued", "running"):
+            # The process that owned this job is gone
+            job.status = "interrupted"
+        return job
+
+    async def read_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[AnnotationItem]:
+        """A page of annotated peaks from the persisted NDJSON results (read off the event loop)"""
+        return await asyncio.to_thread(self._read_page, job_id, offset, limit)
+
+    def _read_page(self, job_id: str, offset: int, limit: int) -> List[AnnotationItem]:
+        path = self.result_path(job_id, "ndjson")
+        if path is None or not path.exists():
+            return []
+
+        # Seek to the chunk holding the first requested row instead of scanning from byte 0
+        index = self._load_offsets(job_id)
+        chunk = max(int(np.searchsorted(index[:, 0], offset, side="right")) - 1, 0)
+        row, position = (int(v) for v in index[chunk])
+        end = min(offset + limit, int(index[-1, 0])) if len(index) > 1 else offset + limit
+
+        items = []
+        with open(path, "rb") as f:
+            f.seek(position)
+            while row < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                if row >= offset:
+                    payload = json.loads(line)
+                    payload.pop("row", None)
+                    if payload.get("mz") is None:
+                        payload["mz"] = float("nan")
+                    items.append(AnnotationItem(**payload))
+                row += 1
+        return items
+
+    def _load_offsets(self, job_id: str) -> np.ndarray:
+        """(first row, byte offset) of every persisted chunk, plus the end of the written results"""
+        path = self._job_dir(job_id) / "results.offsets.npy"
+        if not path.exists():
+            return np.zeros((1, 2), dtype=np.int64)
+        return np.load(path)
+
+    def result_path(self, job_id: str, output_format: str = "ndjson") -> Optional[Path]:
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        return self.jobs_dir / job_id / f"results.{output_format}"
+
+    def delete_job(self, job_id: str) -> bool:
+        """Remove a queued or finished job and its files (raises ValueError while it is running)"""
+        job = self.get_job(job_id)
+        if job is None:
+            return False
+        if job.status == "running":
+            raise ValueError("Job is running")
+        self._jobs.pop(job_id, None)
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        return True
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Remove jobs finished more than ttl seconds ago, in memory and on disk; returns how many"""
+        if self.ttl <= 0 or not self.jobs_dir.exists():
+            return 0
+        now = time.time() if now is None else now
+        removed = 0
+        for job_dir in self.jobs_dir.iterdir():
+            job_id = job_dir.name
+            status_path = job_dir / "status.json"
+            if not JOB_ID_PATTERN.match(job_id) or not status_path.exists():
+                continue
+            job = self.get_job(job_id)
+            if job is None or job.status not in FINISHED_STATUSES:
+                continue
+            # Jobs interrupted by a restart have no finish time; their status file dates them
+            finished = status_path.stat().st_mtime
+            if job.finished_at:
+                finished = datetime.fromisoformat(job.finished_at).replace(tzinfo=timezone.utc).timestamp()
+            if now - finished > self.ttl:
+                self._jobs.pop(job_id, None)
+                shutil.rmtree(job_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+    async def shutdown(self) -> None:
+        """Stop the worker tasks (queued jobs are reported as interrupted after restart)"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+        self._loop = None
+
+    # Internals
+
+    def _create_job(self, source: str, total_peaks: int, params: Dict[str, Any]) -> AnnotationJob:
+        if self._pruned_at is None or time.monotonic() - self._pruned_at > ANNOTATION_JOB_PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            self.prune()
+        job = AnnotationJob(
+            job_id=uuid.uuid4().hex,
+            status="queued",
+            source=source,
+            total_peaks=total_peaks,
+            params=params,
+            created_at=datetime.utcnow().isoformat()
+        )
+        self._job_dir(job.job_id).mkdir(parents=True, exist_ok=True)
+        self._jobs[job.job_id] = job
+        self._save(job)
+        return job
+
+    async def _enqueue(self, job: AnnotationJob) -> AnnotationJob:
+        self._ensure_workers()
+        await self._queue.put(job.job_id)
+        return job
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._queue is not None:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                # Jobs deleted while queued are skipped
+                if job_id in self._jobs:
+                    await self._run(self._jobs[job_id])
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: AnnotationJob) -> None:
+        job.status = "running"
+        job.started_at = datetime.utcnow().isoformat()
+        self._save(job)
+
+        params = dict(job.params)
+        mz_column = params.pop("mz_column", "mz")
+        job_dir = self._job_dir(job.job_id)
+        try:
+            async with self.session_factory() as session:
+                with open(job_dir / "results.ndjson", "wb") as ndjson_file, \
+                        open(job_dir / "results.csv", "wb") as csv_file:
+                    csv_file.write((",".join(STREAM_CSV_COLUMNS) + "\n").encode("utf-8"))
+                    offsets = [(0, 0)]
+                    chunks = self._iter_input(job, mz_column)
+                    while True:
+                        mz_values = await asyncio.to_thread(next, chunks, None)
+                        if mz_values is None:
+                            break
+                        response = await AnnotationService.annotate_mz_list(session, mz_values, **params)
+                        ndjson_file.write(AnnotationService._items_to_ndjson(response.items, job.processed_peaks))
+                        csv_file.write(AnnotationService._items_to_csv(response.items, job.processed_peaks))
+                        ndjson_file.flush()
+                        csv_file.flush()
+
+                        job.processed_peaks += response.total_peaks
+                        offsets.append((job.processed_peaks, ndjson_file.tell()))
+                        self._save_offsets(job.job_id, offsets)
+                        job.annotated_peaks += response.annotated_peaks
+                        job.total_peaks = max(job.total_peaks, job.processed_peaks)
+                        job.progress = round(job.processed_peaks / job.total_peaks, 4) if job.total_peaks else 0.0
+                        self._save(job)
+
+            job.status = "completed"
+            job.progress = 1.0
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow().isoformat()
+            self._save(job)
+
+    def _iter_input(self, job: AnnotationJob, mz_column: str) -> Iterator[np.ndarray]:
+        job_dir = self._job_dir(job.job_id)
+        if job.source == "mz-list":
+            mz_values = np.load(job_dir / "input.npy")
+            for start in range(0, len(mz_values), self.chunk_size):
+                yield mz_values[start:start + self.chunk_size]
+        else:
+            with open(job_dir / "input.csv", "rb") as f:
+                for df in AnnotationService.open_csv_chunks(f, mz_column, self.chunk_size):
+                    yield pd.to_numeric(df[mz_column], errors="coerce").to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _count_csv_rows(path: Path, mz_column: str, chunk_size: int) -> int:
+        """Number of data rows, as parsed by the same chunked reader the job uses"""
+        with open(path, "rb") as f:
+            return sum(len(df) for df in AnnotationService.open_csv_chunks(f, mz_column, chunk_size))
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir / job_id
+
+    def _save_offsets(self, job_id: str, offsets: List[tuple]) -> None:
+        path = self._job_dir(job_id) / "results.offsets.npy"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.int64))
+        os.replace(tmp, path)
+
+    def _save(self, job: AnnotationJob) -> None:
+        path = self._job_dir(job.job_id) / "status.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(job.model_dump_json(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+job_manager = AnnotationJobManager()
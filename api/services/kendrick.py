@@ -0,0 +1,132 @@
+import weakref
+from typing import Dict, Tuple
+import numpy as np
+from api.services.compound_index import CompoundIndex
+from api.services.formula import monoisotopic_mass
+
+# Repeat units: CH2 for chain-length homologs, H2 for double-bond series
+KENDRICK_BASES = ("CH2", "H2", "C2H4O", "CH2O")
+
+# Default KMD window (Da) for grouping peaks and matching candidates into one series
+KMD_TOLERANCE = 0.002
+
+
+def kendrick_mass(masses: np.ndarray, base: str = "CH2") -> np.ndarray:
+    """Masses rescaled so that the repeat unit has an integer mass"""
+    exact = monoisotopic_mass(base)
+    if exact is None or base not in KENDRICK_BASES:
+        raise ValueError(f"Unknown Kendrick base: {base}. Available: {', '.join(KENDRICK_BASES)}")
+    return np.asarray(masses, dtype=np.float64) * (round(exact) / exact)
+
+
+def kendrick_coordinates(masses: np.ndarray, base: str = "CH2") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Kendrick mass, mass defect and residue class of every mass
+
+    Homologs differ by whole repeat units, so they share the KMD and the nominal Kendrick mass
+    modulo the nominal mass of the unit (the residue class).
+    """
+    km = kendrick_mass(masses, base)
+    nominal = np.round(km)
+    residue = np.mod(nominal, round(monoisotopic_mass(base))).astype(np.int64)
+    return km, nominal - km, residue
+
+
+def series_labels(kmd: np.ndarray, residue: np.ndarray, tolerance: float = KMD_TOLERANCE) -> np.ndarray:
+    """Series number per entry: same residue class and a chain of KMD gaps within tolerance"""
+    if len(kmd) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort((kmd, residue))
+    sorted_kmd, sorted_residue = kmd[order], residue[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (sorted_residue[1:] != sorted_residue[:-1]) | (np.diff(sorted_kmd) > tolerance)
+    labels = np.empty(len(order), dtype=np.int64)
+    labels[order] = np.cumsum(starts) - 1
+    return labels
+
+
+def series_support(
+    groups: np.ndarray,
+    peaks: np.ndarray,
+    kmd: np.ndarray,
+    residue: np.ndarray,
+    tolerance: float = KMD_TOLERANCE
+) -> np.ndarray:
+    """Number of distinct peaks of the same group whose candidates lie in the candidate's KMD window
+
+    A candidate whose homologs explain other peaks of its peak series gets support > 1; an isobar
+    that only fits one peak keeps support 1. Windows are found by binary search on a composite
+    (group, residue, KMD) key, so the whole candidate table is processed at once.
+    """
+    n = len(groups)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    # KMD lies in [-0.5, 0.5], so a stride of 2 keeps every (group, residue) block separate
+    block = np.unique(np.column_stack([groups, residue]), axis=0, return_inverse=True)[1].ravel()
+    key = block * 2.0 + kmd
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    left = np.searchsorted(sorted_key, key - tolerance, side="left")
+    right = np.searchsorted(sorted_key, key + tolerance, side="right")
+
+    sizes = right - left
+    owner = np.repeat(np.arange(n), sizes)
+    neighbour = order[np.repeat(left, sizes) + (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))]
+    pairs = np.unique(np.column_stack([owner, peaks[neighbour]]), axis=0)
+    return np.bincount(pairs[:, 0], minlength=n)
+
+
+class KendrickIndex:
+    """Kendrick coordinates of every lipid, aligned with the lipid entries of the merged compound index"""
+
+    def __init__(self, masses: np.ndarray, entries: np.ndarray):
+        self.masses = np.asarray(masses, dtype=np.float64)
+        self.entries = np.asarray(entries, dtype=np.int64)
+        self._entry_order = np.argsort(self.entries, kind="stable")
+        self._coordinates: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._by_series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def from_compounds(cls, compounds: CompoundIndex) -> "KendrickIndex":
+        index = compounds.mass_index_for(["lipids"])
+        return cls(index.masses, index.ids)
+
+    def coordinates(self, base: str = "CH2") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(Kendrick mass, KMD, residue class) per lipid, computed once per base"""
+        if base not in self._coordinates:
+            self._coordinates[base] = kendrick_coordinates(self.masses, base)
+        return self._coordinates[base]
+
+    def lookup(self, entries: np.ndarray, base: str = "CH2") -> Tuple[np.ndarray, np.ndarray]:
+        """KMD and residue class of merged-index entries (entries must be lipids)"""
+        positions = self._entry_order[np.searchsorted(self.entries, entries, sorter=self._entry_order)]
+        _, kmd, residue = self.coordinates(base)
+        return kmd[positions], residue[positions]
+
+    def homologs(self, mass: float, base: str = "CH2", tolerance: float = KMD_TOLERANCE) -> np.ndarray:
+        """Positions of lipids in the homologous series of a mass, ordered by mass"""
+        if base not in self._by_series:
+            _, kmd, residue = self.coordinates(base)
+            key = residue * 2.0 + kmd
+            order = np.argsort(key, kind="stable")
+            self._by_series[base] = (key[order], order)
+        sorted_key, order = self._by_series[base]
+        _, kmd, residue = kendrick_coordinates(np.array([mass]), base)
+        key = residue[0] * 2.0 + kmd[0]
+        left = np.searchsorted(sorted_key, key - tolerance, side="left")
+        right = np.searchsorted(sorted_key, key + tolerance, side="right")
+        found = order[left:right]
+        return found[np.argsort(self.masses[found], kind="stable")]
+
+
+# One Kendrick index per merged compound index, so entry ids always agree with it
+_kendrick_indexes: "weakref.WeakKeyDictionary[CompoundIndex, KendrickIndex]" = weakref.WeakKeyDictionary()
+
+
+def kendrick_index_for(compounds: CompoundIndex) -> KendrickIndex:
+    """Lipid Kendrick index of a merged compound index, built once per index version"""
+    if compounds not in _kendrick_indexes:
+        _kendrick_indexes[compounds] = KendrickIndex.from_compounds(compounds)
+    return _kendrick_indexes[compounds]
@@ -0,0 +1,126 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence, Union
+import os
+import numpy as np
+from api.schemas import (
+    CompoundOut, SeriesCandidate, SeriesPeak, KendrickSeries, KendrickSeriesResponse, LipidHomologsResponse
+)
+from api.services.adducts import resolve_adducts
+from api.services.annotation_service import AnnotationService
+from api.services.compound_index import get_compound_index, load_compound_records
+from api.services.kendrick import (
+    KMD_TOLERANCE, kendrick_coordinates, kendrick_index_for, series_labels, series_support
+)
+
+# Lipid candidates searched per peak (x max_candidates) before series filtering
+LIPID_SERIES_CANDIDATE_FACTOR = int(os.getenv("LIPID_SERIES_CANDIDATE_FACTOR", "5"))
+
+class LipidService:
+
+    @staticmethod
+    async def annotate_series(
+        db: AsyncSession,
+        mz_values: Union[np.ndarray, List[float]],
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        base: str = "CH2",
+        kmd_tolerance: float = KMD_TOLERANCE,
+        min_support: int = 2
+    ) -> KendrickSeriesResponse:
+        """Group peaks into Kendrick homologous series and keep lipid candidates consistent with them
+        (raises ValueError for unknown adducts or bases)
+
+        Within a series of at least min_support peaks, a candidate is kept only if lipids in its KMD
+        window explain at least min_support peaks of the series. Peaks outside a series keep all candidates.
+        """
+
+        mz_array = np.asarray(mz_values, dtype=np.float64)
+        adduct_list = resolve_adducts(adducts, ion_mode)
+        km, kmd, residue = kendrick_coordinates(mz_array, base)
+        labels = series_labels(kmd, residue, kmd_tolerance)
+        series_size = np.bincount(labels, minlength=int(labels.max()) + 1 if len(labels) else 0)
+
+        compounds = await get_compound_index(db)
+        kendrick = kendrick_index_for(compounds)
+        matches = await AnnotationService._search_candidates(
+            db, mz_array, tol_ppm, max_candidates * LIPID_SERIES_CANDIDATE_FACTOR, adduct_list,
+            index=compounds.mass_index_for(["lipids"])
+        )
+
+        peak = matches.query_index
+        candidate_kmd, candidate_residue = kendrick.lookup(matches.ids, base)
+        support = series_support(labels[peak], peak, candidate_kmd, candidate_residue, kmd_tolerance)
+        in_series = series_size[labels[peak]] >= min_support
+        keep = ~in_series | (support >= min_support)
+
+        # Best supported candidates first, then by mass error
+        order = np.flatnonzero(keep)
+        order = order[np.lexsort((np.abs(matches.error_ppm[order]), -support[order], peak[order]))]
+        rank = np.arange(len(order)) - np.searchsorted(peak[order], peak[order], side="left")
+        order = order[rank < max_candidates]
+
+        source_names, local_ids = compounds.decode(matches.ids[order])
+        records = await load_compound_records(db, source_names, local_ids.tolist())
+        adduct_names = matches.adducts if matches.adducts is not None else np.full(len(matches), None, dtype=object)
+
+        items = [
+            SeriesPeak(
+                mz=round(mz, 6), kendrick_mass=round(k, 6), kmd=round(d, 6), series=label, candidates=[]
+            )
+            for mz, k, d, label in zip(mz_array.tolist(), km.tolist(), kmd.tolist(), labels.tolist())
+        ]
+        for j, local_id in zip(order.tolist(), local_ids.tolist()):
+            record = records.get(("lipids", local_id))
+            if record is None:
+                continue
+            items[peak[j]].candidates.append(SeriesCandidate(
+                compound=CompoundOut(source="lipids", **record),
+                mass_error_ppm=round(float(matches.error_ppm[j]), 2),
+                mass_error_da=round(float(matches.error_da[j]), 6),
+                adduct=adduct_names[j],
+                series_support=int(support[j])
+            ))
+
+        series = []
+        by_label = np.argsort(labels, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(series_size)])
+        for label in np.flatnonzero(series_size >= 2).tolist():
+            members = by_label[bounds[label]:bounds[label + 1]]
+            series.append(KendrickSeries(
+                series=label,
+                kmd=round(float(kmd[members].mean()), 6),
+                residue=int(residue[members[0]]),
+                peaks=members.tolist()
+            ))
+
+        return KendrickSeriesResponse(
+            base=base,
+            items=items,
+            series=series,
+            total_peaks=len(items),
+            annotated_peaks=sum(1 for item in items if item.candidates)
+        )
+
+    @staticmethod
+    async def get_homologs(
+        db: AsyncSession,
+        mass: float,
+        base: str = "CH2",
+        kmd_tolerance: float = KMD_TOLERANCE,
+        limit: int = 100
+    ) -> LipidHomologsResponse:
+        """Lipids of the homologous series that a neutral mass belongs to, ordered by mass"""
+
+        compounds = await get_compound_index(db)
+        kendrick = kendrick_index_for(compounds)
+        _, kmd, _ = kendrick_coordinates(np.array([mass]), base)
+        positions = kendrick.homologs(mass, base, kmd_tolerance)[:limit]
+        source_names, local_ids = compounds.decode(kendrick.entries[positions])
+        records = await load_compound_records(db, source_names, local_ids.tolist())
+        lipids = [
+            CompoundOut(source="lipids", **records[("lipids", i)])
+            for i in local_ids.tolist() if ("lipids", i) in records
+        ]
+        return LipidHomologsResponse(mass=mass, base=base, kmd=round(float(kmd[0]), 6), lipids=lipids)
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import shutil
+import tempfile
+import weakref
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from api.models import Metabolite
+from api.services.data_version import VersionedIndex
+
+
+@dataclass
+class MassMatches:
+    """Flat, columnar result of a mass index lookup (sorted by query, then rank)"""
+    query_index: np.ndarray
+    ids: np.ndarray
+    masses: np.ndarray
+    error_da: np.ndarray
+    error_ppm: np.ndarray
+    rank: np.ndarray
+    adducts: Optional[np.ndarray] = None
+    isotope_score: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def empty(cls) -> "MassMatches":
+        return cls(
+            query_index=np.empty(0, dtype=np.int64),
+            ids=np.empty(0, dtype=np.int64),
+            masses=np.empty(0, dtype=np.float64),
+            error_da=np.empty(0, dtype=np.float64),
+            error_ppm=np.empty(0, dtype=np.float64),
+            rank=np.empty(0, dtype=np.int64)
+        )
+
+
+class MassIndex:
+    """Sorted in-memory array of exact masses for vectorized ppm window lookups"""
+
+    def __init__(self, masses: np.ndarray, ids: np.ndarray):
+        masses = np.asarray(masses, dtype=np.float64)
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.lexsort((ids, masses))
+        self.masses = masses[order]
+        self.ids = ids[order]
+        self._mmap_dir = None
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+    @classmethod
+    def from_sorted(cls, masses: np.ndarray, ids: np.ndarray) -> "MassIndex":
+        """Wrap arrays that are already sorted by (mass, id) without copying them"""
+        index = cls.__new__(cls)
+        index.masses = masses
+        index.ids = ids
+        index._mmap_dir = None
+        return index
+
+    def to_mmap(self) -> str:
+        """Write the arrays to .npy files once so other processes can memory-map them"""
+        if getattr(self, "_mmap_dir", None) is None:
+            directory = tempfile.mkdtemp(prefix="mass_index_")
+            np.save(Path(directory) / "masses.npy", self.masses)
+            np.save(Path(directory) / "ids.npy", self.ids)
+            # Files live as long as this index does
+            weakref.finalize(self, shutil.rmtree, directory, True)
+            self._mmap_dir = directory
+        return self._mmap_dir
+
+    @classmethod
+    def from_mmap(cls, directory: str) -> "MassIndex":
+        """Attach to an index written by to_mmap (pages are shared, not copied)"""
+        return cls.from_sorted(
+            np.load(Path(directory) / "masses.npy", mmap_mode="r"),
+            np.load(Path(directory) / "ids.npy", mmap_mode="r")
+        )
+
+    @classmethod
+    async def from_database(cls, db: AsyncSession) -> "MassIndex":
+        """Load metabolite ids and exact masses into a new index"""
+        stmt = select(Metabolite.id, Metabolite.exact_mass).where(Metabolite.exact_mass.isnot(None))
+        result = await db.execute(stmt)
+        rows = result.all()
+        if not rows:
+            return cls(np.empty(0), np.empty(0))
+        ids, masses = zip(*rows)
+        return cls(np.fromiter(masses, dtype=np.float64), np.fromiter(ids, dtype=np.int64))
+
+    def search(
+        self,
+        mz_values: np.ndarray,
+        tol_ppm: float,
+        max_candidates: Optional[int] = 10
+    ) -> MassMatches:
+        """Find the closest entries within tol_ppm of every m/z value in one pass"""
+        mz_values = np.asarray(mz_values, dtype=np.float64)
+        delta = mz_values * tol_ppm / 1e6
+        return self.search_windows(mz_values, mz_values - delta, mz_values + delta, max_candidates)
+
+    def search_windows(
+        self,
+        centers: np.ndarray,
+        low: np.ndarray,
+        high: np.ndarray,
+        max_candidates: Optional[int] = 10
+    ) -> MassMatches:
+        """Top-k entries closest to each center inside its [low, high] window"""
+        centers = np.asarray(centers, dtype=np.float64)
+        if len(centers) == 0 or len(self.masses) == 0:
+            return MassMatches.empty()
+
+        left = np.searchsorted(self.masses, low, side="left")
+        right = np.searchsorted(self.masses, high, side="right")
+        if max_candidates is not None:
+            # The k closest masses always lie within k positions of the insertion point
+            pos = np.searchsorted(self.masses, centers)
+            left = np.maximum(left, pos - max_candidates)
+            right = np.minimum(right, pos + max_candidates)
+        counts = np.clip(right - left, 0, None)
+        total = int(counts.sum())
+        if total == 0:
+            return MassMatches.empty()
+
+        starts = np.cumsum(counts) - counts
+        query_index = np.repeat(np.arange(len(centers)), counts)
+        positions = np.repeat(left, counts) + (np.arange(total) - np.repeat(starts, counts))
+        error_da = self.masses[positions] - centers[query_index]
+
+        order = np.lexsort((np.abs(error_da), query_index))
+        query_index = query_index[order]
+        positions = positions[order]
+        error_da = error_da[order]
+        rank = np.arange(total) - np.repeat(starts, counts)
+
+        if max_candidates is not None:
+            keep = rank < max_candidates
+            query_index, positions, error_da, rank = (
+                query_index[keep], positions[keep], error_da[keep], rank[keep]
+            )
+
+        return MassMatches(
+            query_index=query_index,
+            ids=self.ids[positions],
+            masses=self.masses[positions],
+            error_da=error_da,
+            error_ppm=error_da / centers[query_index] * 1e6,
+            rank=rank
+        )
+
+
+_mass_index = VersionedIndex(MassIndex.from_database)
+
+
+async def get_mass_index(db: AsyncSession) -> MassIndex:
+    """Shared metabolite mass index, reloaded when the metabolites table changes"""
+    return await _mass_index.get(db)
@@ -1,8 +1,16 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_, func
-from typing import List, Optional
-from api.models import Metabolite, Class, Pathway, Enzyme
-from api.schemas import MetaboliteOut
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+from api.models import Metabolite, Class, Pathway, Enzyme, metabolite_pathway, metabolite_enzyme
+from api.schemas import MetaboliteOut, MetaboliteLookupItem, MetaboliteLookupResponse
+from api.services.identifiers import IDENTIFIER_COLUMNS, parse_identifier
+
+# Maximum number of bound parameters per IN (...) lookup
+ID_CHUNK_SIZE = 500
+
+# Maximum number of identifiers resolved by one /metabolites/lookup request
+LOOKUP_MAX_IDENTIFIERS = int(os.getenv("LOOKUP_MAX_IDENTIFIERS", "10000"))
 
 class MetaboliteService:
     
@@ -92,46 +100,130 @@ class MetaboliteService:
         result = await db.execute(stmt)
         return result.scalar()
     
+    @staticmethod
+    async def get_metabolites_by_ids(db: AsyncSession, ids: Sequence[int]) -> List[Metabolite]:
+        """Fetch metabolites by id in a few IN (...) queries"""
+        
+        ids = list(ids)
+        metabolites = []
+        for start in range(0, len(ids), ID_CHUNK_SIZE):
+            stmt = select(Metabolite).where(Metabolite.id.in_(ids[start:start + ID_CHUNK_SIZE]))
+            result = await db.execute(stmt)
+            metabolites.extend(result.scalars().all())
+        return metabolites
+    
     @staticmethod
     async def convert_to_schema(db: AsyncSession, metabolite: Metabolite) -> MetaboliteOut:
         """Convert SQLAlchemy model to Pydantic schema with relationships"""
         
-        # Get class name
-        class_name = None
-        if metabolite.class_id:
-            class_stmt = select(Class.name).where(Class.id == metabolite.class_id)
-            class_result = await db.execute(class_stmt)
-            class_name = class_result.scalar()
-        
-        # Get pathways
-        pathway_stmt = (
-            select(Pathway.name)
-            .join(Metabolite.pathways)
-            .where(Metabolite.id == metabolite.id)
-        )
-        pathway_result = await db.execute(pathway_stmt)
-        pathways = [row[0] for row in pathway_result.fetchall()]
-        
-        # Get enzymes
-        enzyme_stmt = (
-            select(Enzyme.name)
-            .join(Metabolite.enzymes)
-            .where(Metabolite.id == metabolite.id)
-        )
-        enzyme_result = await db.execute(enzyme_stmt)
-        enzymes = [row[0] for row in enzyme_result.fetchall()]
-        
-        return MetaboliteOut(
-            id=metabolite.id,
-            name=metabolite.name,
-            formula=metabolite.formula,
-            exact_mass=metabolite.exact_mass,
-            hmdb_id=metabolite.hmdb_id,
-            chebi_id=metabolite.chebi_id,
-            kegg_id=metabolite.kegg_id,
-            pubchem_cid=metabolite.pubchem_cid,
-            class_id=metabolite.class_id,
-            class_name=class_name,
-            pathways=pathways,
-            enzymes=enzymes
+        converted = await MetaboliteService.convert_many(db, [metabolite])
+        return converted[0]
+    
+    @staticmethod
+    async def convert_many(db: AsyncSession, metabolites: Sequence[Metabolite]) -> List[MetaboliteOut]:
+        """Convert many models at once, with one grouped query per relationship"""
+        
+        metabolite_ids = [m.id for m in metabolites]
+        class_ids = list({m.class_id for m in metabolites if m.class_id})
+        
+        # Get class names
+        class_names: Dict[int, str] = {}
+        for chunk in MetaboliteService._chunks(class_ids):
+            result = await db.execute(select(Class.id, Class.name).where(Class.id.in_(chunk)))
+            class_names.update(result.all())
+        
+        # Get pathways and enzymes grouped by metabolite
+        pathways: Dict[int, List[str]] = {}
+        enzymes: Dict[int, List[str]] = {}
+        for chunk in MetaboliteService._chunks(metabolite_ids):
+            pathway_stmt = (
+                select(metabolite_pathway.c.metabolite_id, Pathway.name)
+                .join(Pathway, Pathway.id == metabolite_pathway.c.pathway_id)
+                .where(metabolite_pathway.c.metabolite_id.in_(chunk))
+            )
+            for metabolite_id, name in (await db.execute(pathway_stmt)).all():
+                pathways.setdefault(metabolite_id, []).append(name)
+            
+            enzyme_stmt = (
+                select(metabolite_enzyme.c.metabolite_id, Enzyme.name)
+                .join(Enzyme, Enzyme.id == metabolite_enzyme.c.enzyme_id)
+                .where(metabolite_enzyme.c.metabolite_id.in_(chunk))
+            )
+            for metabolite_id, name in (await db.execute(enzyme_stmt)).all():
+                enzymes.setdefault(metabolite_id, []).append(name)
+        
+        return [
+            MetaboliteOut(
+                id=metabolite.id,
+                name=metabolite.name,
+                name_ru=metabolite.name_ru,
+                formula=metabolite.formula,
+                exact_mass=metabolite.exact_mass,
+                hmdb_id=metabolite.hmdb_id,
+                chebi_id=metabolite.chebi_id,
+                kegg_id=metabolite.kegg_id,
+                pubchem_cid=metabolite.pubchem_cid,
+                class_id=metabolite.class_id,
+                class_name=class_names.get(metabolite.class_id),
+                pathways=pathways.get(metabolite.id, []),
+                enzymes=enzymes.get(metabolite.id, [])
+            )
+            for metabolite in metabolites
+        ]
+    
+    @staticmethod
+    async def lookup_identifiers(db: AsyncSession, identifiers: Sequence[str]) -> MetaboliteLookupResponse:
+        """Resolve HMDB, KEGG, ChEBI and PubChem identifiers with batched IN queries over their unique indexes
+        (raises ValueError for more than LOOKUP_MAX_IDENTIFIERS identifiers)
+
+        Partial accessions are not resolved; a bare number is tried as a PubChem CID first, then
+        as a ChEBI accession.
+        """
+
+        if len(identifiers) > LOOKUP_MAX_IDENTIFIERS:
+            raise ValueError(f"At most {LOOKUP_MAX_IDENTIFIERS} identifiers per request")
+
+        parsed = [
+            [i for i in parse_identifier(identifier) if not i.prefix] for identifier in identifiers
+        ]
+        values: Dict[str, set] = {column: set() for column in IDENTIFIER_COLUMNS}
+        for lookups in parsed:
+            for lookup in lookups:
+                values[lookup.column].add(lookup.value)
+
+        # One IN list per column, batched so large requests stay under the bind parameter limit
+        found: Dict[Tuple[str, str], Metabolite] = {}
+        for column, column_values in values.items():
+            for chunk in MetaboliteService._chunks(sorted(column_values)):
+                result = await db.execute(select(Metabolite).where(getattr(Metabolite, column).in_(chunk)))
+                for metabolite in result.scalars().all():
+                    found[(column, getattr(metabolite, column))] = metabolite
+
+        resolved = []
+        for lookups in parsed:
+            hit = None
+            for lookup in lookups:
+                metabolite = found.get((lookup.column, lookup.value))
+                if metabolite is not None:
+                    hit = (lookup.column, metabolite)
+                    break
+            resolved.append(hit)
+        converted = await MetaboliteService.convert_many(db, list({m.id: m for m in found.values()}.values()))
+        by_id = {metabolite.id: metabolite for metabolite in converted}
+
+        items = [
+            MetaboliteLookupItem(identifier=identifier)
+            if hit is None else
+            MetaboliteLookupItem(identifier=identifier, matched_by=hit[0], metabolite=by_id[hit[1].id])
+            for identifier, hit in zip(identifiers, resolved)
+        ]
+        return MetaboliteLookupResponse(
+            items=items,
+            total_identifiers=len(items),
+            resolved=sum(1 for item in items if item.metabolite is not None)
         )
+    
+    @staticmethod
+    def _chunks(values: List):
+        for start in range(0, len(values), ID_CHUNK_SIZE):
+            yield values[start:start + ID_CHUNK_SIZE]
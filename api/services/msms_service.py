@@ -0,0 +1,71 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import numpy as np
+from api.schemas import MsmsSpectrumIn, MsmsMatch, MsmsAnnotationItem, MsmsAnnotationResponse
+from api.services.spectral_library import SpectralLibraryUnavailable, get_spectral_library
+
+class MsmsService:
+
+    @staticmethod
+    async def annotate(
+        db: AsyncSession,
+        spectra: List[MsmsSpectrumIn],
+        precursor_tol_ppm: float = 10.0,
+        fragment_tol: float = 0.02,
+        modified: bool = False,
+        min_score: float = 0.6,
+        min_matched_peaks: int = 3,
+        max_results: int = 5,
+        ion_mode: Optional[str] = None
+    ) -> MsmsAnnotationResponse:
+        """Match MS/MS spectra against the spectral library by (modified) cosine similarity
+        (raises ValueError for mismatched peak lists, SpectralLibraryUnavailable if no library is loaded)"""
+
+        for spectrum in spectra:
+            if len(spectrum.mz) != len(spectrum.intensities):
+                raise ValueError(f"Spectrum {spectrum.id or spectrum.precursor_mz}: mz and intensities differ in length")
+
+        library = await get_spectral_library(db)
+        if len(library) == 0:
+            raise SpectralLibraryUnavailable("Spectral library is empty: put MSP/MGF files into SPECTRAL_LIBRARY_DIR")
+
+        precursor_mz = np.array([s.precursor_mz for s in spectra], dtype=np.float64)
+        matches = library.search(
+            precursor_mz,
+            [(np.asarray(s.mz, dtype=np.float64), np.asarray(s.intensities, dtype=np.float64)) for s in spectra],
+            precursor_tol_ppm, fragment_tol, modified, ion_mode
+        )
+
+        keep = np.flatnonzero((matches.scores >= min_score) & (matches.matched_peaks >= min_matched_peaks))
+        keep = keep[np.lexsort((-matches.scores[keep], matches.query_index[keep]))]
+        query = matches.query_index[keep]
+        rank = np.arange(len(keep)) - np.searchsorted(query, query, side="left")
+        keep = keep[rank < max_results]
+
+        items = [
+            MsmsAnnotationItem(id=s.id, precursor_mz=s.precursor_mz, matches=[]) for s in spectra
+        ]
+        metadata = library.metadata
+        for j in keep.tolist():
+            spectrum = int(matches.spectra[j])
+            items[matches.query_index[j]].matches.append(MsmsMatch(
+                name=metadata["name"][spectrum],
+                formula=metadata["formula"][spectrum],
+                inchikey=metadata["inchikey"][spectrum],
+                precursor_type=metadata["precursor_type"][spectrum],
+                library=metadata["library"][spectrum],
+                precursor_mz=round(float(library.precursor_mz[spectrum]), 6),
+                precursor_error_ppm=round(float(matches.precursor_error_ppm[j]), 2),
+                score=round(float(matches.scores[j]), 4),
+                matched_peaks=int(matches.matched_peaks[j])
+            ))
+        for item in items:
+            item.best_match = item.matches[0] if item.matches else None
+
+        return MsmsAnnotationResponse(
+            items=items,
+            total_spectra=len(items),
+            annotated_spectra=sum(1 for item in items if item.matches),
+            library_size=len(library),
+            modified_cosine=modified
+        )
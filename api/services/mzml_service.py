@@ -0,0 +1,325 @@
+import asyncio
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, Optional, Sequence, Tuple, Union
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.services.annotation_service import AnnotationService
+
+# Features handed to the annotator at once
+MZML_FEATURE_BATCH_SIZE = int(os.getenv("MZML_FEATURE_BATCH_SIZE", "5000"))
+
+# Columns of the flat CSV produced by mzML annotation
+MZML_CSV_COLUMNS = [
+    "feature", "mz", "rt_min", "rt_max", "rt_apex", "intensity", "n_scans", "rank",
+    "metabolite_id", "name", "formula", "exact_mass", "adduct", "mass_error_ppm", "mass_error_da"
+]
+
+
+def _require_pymzml():
+    try:
+        import pymzml
+    except ImportError as e:
+        raise RuntimeError("mzML support requires the pymzml package") from e
+    return pymzml
+
+
+def iter_spectra(source: str, ms_level: int = 1) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+    """(retention time in minutes, m/z, intensity) for every spectrum of the given MS level"""
+    pymzml = _require_pymzml()
+    run = pymzml.run.Reader(source)
+    try:
+        for spectrum in run:
+            if spectrum.ms_level != ms_level:
+                continue
+            mz = np.asarray(spectrum.mz, dtype=np.float64)
+            intensity = np.asarray(spectrum.i, dtype=np.float64)
+            if len(mz) == 0:
+                continue
+            yield float(spectrum.scan_time_in_minutes()), mz, intensity
+    finally:
+        run.close()
+
+
+def is_profile(mz: np.ndarray, intensity: np.ndarray) -> bool:
+    """Profile data sample each peak with several points, so local maxima are sparse"""
+    if len(mz) < 5:
+        return False
+    apex = (intensity[1:-1] > intensity[:-2]) & (intensity[1:-1] >= intensity[2:])
+    return apex.mean() < 0.25
+
+
+def pick_peaks(
+    mz: np.ndarray,
+    intensity: np.ndarray,
+    min_intensity: float = 0.0,
+    mode: str = "auto"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Centroid a spectrum: local maxima refined by a three-point parabola (profile) or an intensity filter (centroid)"""
+    order = np.argsort(mz, kind="stable")
+    mz, intensity = mz[order], intensity[order]
+
+    if mode == "auto":
+        mode = "profile" if is_profile(mz, intensity) else "centroid"
+    if mode == "centroid":
+        keep = intensity > min_intensity
+        return mz[keep], intensity[keep]
+    if mode != "profile":
+        raise ValueError(f"Unknown peak picking mode: {mode}")
+
+    left, center, right = intensity[:-2], intensity[1:-1], intensity[2:]
+    apex = np.flatnonzero((center > left) & (center >= right) & (center > min_intensity)) + 1
+    if len(apex) == 0:
+        return np.empty(0), np.empty(0)
+
+    # Vertex of the parabola through the apex and its neighbours
+    y0, y1, y2 = intensity[apex - 1], intensity[apex], intensity[apex + 1]
+    x0, x1, x2 = mz[apex - 1], mz[apex], mz[apex + 1]
+    denominator = y0 - 2 * y1 + y2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(denominator != 0, 0.5 * (y0 - y2) / denominator, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+    step = np.where(offset < 0, x1 - x0, x2 - x1)
+    return x1 + offset * step, y1
+
+
+@dataclass
+class Features:
+    """Flat feature table: one row per m/z trace"""
+    mz: np.ndarray
+    rt_min: np.ndarray
+    rt_max: np.ndarray
+    rt_apex: np.ndarray
+    intensity: np.ndarray
+    n_scans: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.mz)
+
+    def take(self, index) -> "Features":
+        return Features(*(getattr(self, name)[index] for name in self.__dataclass_fields__))
+
+    @classmethod
+    def concat(cls, parts: Sequence["Features"]) -> "Features":
+        return cls(*(np.concatenate([getattr(p, name) for p in parts]) for name in cls.__dataclass_fields__))
+
+
+class FeatureMerger:
+    """Merges centroids across scans into features within tol_ppm
+
+    Features not seen for more than max_gap_scans are closed and emitted, so memory is
+    bounded by the number of traces eluting at the same time, not by the file size.
+    """
+
+    def __init__(self, tol_ppm: float = 10.0, max_gap_scans: int = 5, min_scans: int = 1):
+        self.tol_ppm = tol_ppm
+        self.max_gap_scans = max_gap_scans
+        self.min_scans = min_scans
+        self._mz = np.empty(0)
+        self._weighted_mz = np.empty(0)
+        self._weight = np.empty(0)
+        self._rt_min = np.empty(0)
+        self._rt_max = np.empty(0)
+        self._rt_apex = np.empty(0)
+        self._intensity = np.empty(0)
+        self._n_scans = np.empty(0, dtype=np.int64)
+        self._last_scan = np.empty(0, dtype=np.int64)
+        self._scan = -1
+
+    @property
+    def open_features(self) -> int:
+        return len(self._mz)
+
+    def add_scan(self, rt: float, mz: np.ndarray, intensity: np.ndarray) -> Features:
+        """Add one centroided scan and return the features closed by it"""
+        self._scan += 1
+        if len(mz):
+            self._merge(rt, mz, intensity)
+        return self._close(self._scan - self._last_scan > self.max_gap_scans)
+
+    def finish(self) -> Features:
+        """Close all remaining features"""
+        return self._close(np.ones(len(self._mz), dtype=bool))
+
+    def _merge(self, rt: float, mz: np.ndarray, intensity: np.ndarray) -> None:
+        matched = np.full(len(mz), -1, dtype=np.int64)
+        if len(self._mz):
+            pos = np.searchsorted(self._mz, mz)
+            left = np.clip(pos - 1, 0, len(self._mz) - 1)
+            right = np.clip(pos, 0, len(self._mz) - 1)
+            nearest = np.where(np.abs(self._mz[left] - mz) <= np.abs(self._mz[right] - mz), left, right)
+            within = np.abs(self._mz[nearest] - mz) <= mz * self.tol_ppm / 1e6
+            matched[within] = nearest[within]
+
+        hit = matched >= 0
+        if hit.any():
+            index, peak_mz, peak_intensity = matched[hit], mz[hit], intensity[hit]
+            np.add.at(self._weighted_mz, index, peak_mz * peak_intensity)
+            np.add.at(self._weight, index, peak_intensity)
+            # Several centroids of one scan may fall into the same feature
+            best = np.zeros(len(self._mz))
+            np.maximum.at(best, index, peak_intensity)
+            touched = np.unique(index)
+            new_apex = best[touched] > self._intensity[touched]
+            self._rt_apex[touched[new_apex]] = rt
+            self._intensity[touched] = np.maximum(self._intensity[touched], best[touched])
+            self._rt_max[touched] = rt
+            self._n_scans[touched] += 1
+            self._last_scan[touched] = self._scan
+            with np.errstate(invalid="ignore"):
+                updated = self._weighted_mz[touched] / self._weight[touched]
+            self._mz[touched] = np.where(self._weight[touched] > 0, updated, self._mz[touched])
+
+        new_mz, new_intensity = mz[~hit], intensity[~hit]
+        if len(new_mz):
+            n = len(new_mz)
+            self._mz = np.concatenate([self._mz, new_mz])
+            self._weighted_mz = np.concatenate([self._weighted_mz, new_mz * new_intensity])
+            self._weight = np.concatenate([self._weight, new_intensity])
+            self._rt_min = np.concatenate([self._rt_min, np.full(n, rt)])
+            self._rt_max = np.concatenate([self._rt_max, np.full(n, rt)])
+            self._rt_apex = np.concatenate([self._rt_apex, np.full(n, rt)])
+            self._intensity = np.concatenate([self._intensity, new_intensity])
+            self._n_scans = np.concatenate([self._n_scans, np.ones(n, dtype=np.int64)])
+            self._last_scan = np.concatenate([self._last_scan, np.full(n, self._scan, dtype=np.int64)])
+
+        # Weighted centers drift slightly, keep the table sorted for searchsorted
+        self._reorder(np.argsort(self._mz, kind="stable"))
+
+    def _reorder(self, index: np.ndarray) -> None:
+        for name in ("_mz", "_weighted_mz", "_weight", "_rt_min", "_rt_max", "_rt_apex",
+                     "_intensity", "_n_scans", "_last_scan"):
+            setattr(self, name, getattr(self, name)[index])
+
+    def _close(self, mask: np.ndarray) -> Features:
+        closed = Features(
+            mz=self._mz[mask],
+            rt_min=self._rt_min[mask],
+            rt_max=self._rt_max[mask],
+            rt_apex=self._rt_apex[mask],
+            intensity=self._intensity[mask],
+            n_scans=self._n_scans[mask],
+        )
+        if mask.any():
+            self._reorder(np.flatnonzero(~mask))
+        return closed.take(closed.n_scans >= self.min_scans)
+
+
+def iter_features(
+    spectra,
+    tol_ppm: float = 10.0,
+    min_intensity: float = 0.0,
+    max_gap_scans: int = 5,
+    min_scans: int = 1,
+    mode: str = "auto",
+    batch_size: int = MZML_FEATURE_BATCH_SIZE
+) -> Iterator[Features]:
+    """Pick peaks scan by scan and yield closed features in batches of about batch_size"""
+    merger = FeatureMerger(tol_ppm, max_gap_scans, min_scans)
+    pending, pending_count = [], 0
+
+    for rt, mz, intensity in spectra:
+        peak_mz, peak_intensity = pick_peaks(mz, intensity, min_intensity, mode)
+        closed = merger.add_scan(rt, peak_mz, peak_intensity)
+        if len(closed):
+            pending.append(closed)
+            pending_count += len(closed)
+        if pending_count >= batch_size:
+            yield Features.concat(pending)
+            pending, pending_count = [], 0
+
+    closed = merger.finish()
+    if len(closed):
+        pending.append(closed)
+    if pending:
+        yield Features.concat(pending)
+
+
+class MzmlService:
+
+    @staticmethod
+    def check_available() -> None:
+        """Raise RuntimeError early if pymzml is not installed"""
+        _require_pymzml()
+
+    @staticmethod
+    async def stream_mzml_annotations(
+        db: AsyncSession,
+        source: Union[str, os.PathLike, Iterable[Tuple[float, np.ndarray, np.ndarray]]],
+        tol_ppm: float = 10.0,
+        max_candidates: int = 10,
+        adducts: Optional[Union[str, Sequence[str]]] = None,
+        ion_mode: Optional[str] = None,
+        min_intensity: float = 0.0,
+        max_gap_scans: int = 5,
+        min_scans: int = 1,
+        mode: str = "auto",
+        output_format: str = "ndjson"
+    ) -> AsyncIterator[bytes]:
+        """Read an mzML file spectrum by spectrum and yield annotated features as NDJSON or CSV
+
+        source may also be an iterable of (rt, mz, intensity) spectra that are already decoded.
+        """
+
+        spectra = iter_spectra(source) if isinstance(source, (str, os.PathLike)) else source
+        batches = iter_features(spectra, tol_ppm, min_intensity, max_gap_scans, min_scans, mode)
+        feature_offset = 0
+
+        if output_format == "csv":
+            yield (",".join(MZML_CSV_COLUMNS) + "\n").encode("utf-8")
+
+        while True:
+            # Parsing and peak picking are blocking, keep them off the event loop
+            features = await asyncio.to_thread(next, batches, None)
+            if features is None:
+                break
+
+            response = await AnnotationService.annotate_mz_list(
+                db, features.mz, tol_ppm, max_candidates, adducts, ion_mode
+            )
+            if output_format == "csv":
+                yield MzmlService._features_to_csv(features, response.items, feature_offset)
+            else:
+                yield MzmlService._features_to_ndjson(features, response.items, feature_offset)
+            feature_offset += len(features)
+
+    @staticmethod
+    def _feature_fields(features: Features, i: int, feature_id: int) -> dict:
+        return {
+            "feature": feature_id,
+            "mz": round(float(features.mz[i]), 6),
+            "rt_min": round(float(features.rt_min[i]), 4),
+            "rt_max": round(float(features.rt_max[i]), 4),
+            "rt_apex": round(float(features.rt_apex[i]), 4),
+            "intensity": float(features.intensity[i]),
+            "n_scans": int(features.n_scans[i]),
+        }
+
+    @staticmethod
+    def _features_to_ndjson(features: Features, items, feature_offset: int) -> bytes:
+        lines = []
+        for i, item in enumerate(items):
+            payload = MzmlService._feature_fields(features, i, feature_offset + i)
+            payload["candidates"] = [c.model_dump() for c in item.candidates]
+            lines.append(json.dumps(payload, ensure_ascii=False, default=str))
+        return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+    @staticmethod
+    def _features_to_csv(features: Features, items, feature_offset: int) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for i, item in enumerate(items):
+            fields = MzmlService._feature_fields(features, i, feature_offset + i)
+            base = [fields[name] for name in MZML_CSV_COLUMNS[:7]]
+            if not item.candidates:
+                writer.writerow(base + [""] * (len(MZML_CSV_COLUMNS) - 7))
+            for rank, candidate in enumerate(item.candidates):
+                metabolite = candidate.metabolite
+                writer.writerow(base + [
+                    rank, metabolite.id, metabolite.name, metabolite.formula, metabolite.exact_mass,
+                    candidate.adduct or "", candidate.mass_error_ppm, candidate.mass_error_da
+                ])
+        return buffer.getvalue().encode("utf-8")
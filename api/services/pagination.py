@@ -0,0 +1,75 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_cursor(sort: str, value: Any, row_id: int) -> str:
+    """Opaque cursor holding the sort key of the last row of a page"""
+    payload = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """Sort value and id stored in a cursor (raises ValueError for malformed or foreign cursors)"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(payload)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise ValueError("Cursor belongs to a different sort order")
+    return value, row_id
+
+
+async def fetch_page(
+    db: AsyncSession,
+    query,
+    model,
+    attribute: str,
+    page_size: int,
+    cursor: Optional[str] = None,
+    offset: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of query results in (attribute, id) order and the cursor of the next page
+    (raises ValueError for an invalid cursor)
+
+    With a cursor the page is an index range seek past the last row instead of an OFFSET scan.
+    Rows with a NULL sort value come after all others, ordered by id.
+    """
+    key = model.id
+    column = getattr(model, attribute)
+    value, last_id = decode_cursor(cursor, attribute) if cursor is not None else (None, None)
+    if cursor is not None:
+        offset = 0
+
+    async def scalars(statement) -> List[Any]:
+        return list((await db.execute(statement)).scalars().all())
+
+    if attribute == "id":
+        seek = query if cursor is None else query.where(key > last_id)
+        rows = await scalars(seek.order_by(key).offset(offset).limit(page_size + 1))
+    else:
+        # Rows with a sort value first (a seek on the column index), then the NULL block by id
+        rows = []
+        if cursor is None or value is not None:
+            seek = query.where(column.isnot(None))
+            if cursor is not None:
+                seek = seek.where(column >= value, or_(column > value, key > last_id))
+            rows = await scalars(seek.order_by(column, key).offset(offset).limit(page_size + 1))
+        if len(rows) <= page_size:
+            nulls = query.where(column.is_(None))
+            if cursor is not None and value is None:
+                nulls = nulls.where(key > last_id)
+            null_offset = 0
+            if offset and not rows:
+                valued = await db.execute(select(func.count()).select_from(query.where(column.isnot(None)).subquery()))
+                null_offset = max(offset - valued.scalar(), 0)
+            rows.extend(await scalars(nulls.order_by(key).offset(null_offset).limit(page_size + 1 - len(rows))))
+
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(attribute, getattr(last, attribute), last.id)
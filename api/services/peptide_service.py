@@ -0,0 +1,94 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+import numpy as np
+from api.models import Enzyme
+from api.schemas import PeptideMatch, ProteinIdentification, PeptideMassFingerprintResponse
+from api.services.adducts import PROTON_MASS
+from api.services.metabolite_service import ID_CHUNK_SIZE
+from api.services.peptides import get_peptide_index
+
+MASS_TYPES = ("mh", "neutral")
+
+class PeptideService:
+
+    @staticmethod
+    async def fingerprint(
+        db: AsyncSession,
+        masses: Union[np.ndarray, List[float]],
+        tol_ppm: float = 20.0,
+        missed_cleavages: Optional[int] = None,
+        mass_type: str = "mh",
+        max_results: int = 20,
+        min_hits: int = 2
+    ) -> PeptideMassFingerprintResponse:
+        """Rank enzymes by tryptic peptides matching a peptide mass list
+        (raises ValueError for an unknown mass type or too many missed cleavages)
+
+        mass_type "mh" means singly protonated [M+H]+ masses (MALDI), "neutral" means neutral masses.
+        """
+
+        if mass_type not in MASS_TYPES:
+            raise ValueError(f"Unknown mass type: {mass_type}. Available: {', '.join(MASS_TYPES)}")
+        mass_array = np.asarray(masses, dtype=np.float64)
+        neutral = mass_array - PROTON_MASS if mass_type == "mh" else mass_array
+
+        index = await get_peptide_index(db)
+        if missed_cleavages is not None and missed_cleavages > index.max_missed_cleavages:
+            raise ValueError(f"At most {index.max_missed_cleavages} missed cleavages are indexed")
+        scores = index.score(neutral, tol_ppm, missed_cleavages, min_hits)
+
+        shown = min(max_results, len(scores.proteins))
+        enzyme_ids = index.enzyme_ids[scores.proteins[:shown]].tolist()
+        enzymes = {}
+        for start in range(0, len(enzyme_ids), ID_CHUNK_SIZE):
+            result = await db.execute(
+                select(Enzyme.id, Enzyme.name, Enzyme.uniprot_id, Enzyme.ec_number, Enzyme.organism)
+                .where(Enzyme.id.in_(enzyme_ids[start:start + ID_CHUNK_SIZE]))
+            )
+            enzymes.update({row[0]: row for row in result.all()})
+
+        identifications = []
+        for i, enzyme_id in enumerate(enzyme_ids):
+            row = enzymes.get(enzyme_id)
+            if row is None:
+                continue
+            protein = int(scores.proteins[i])
+            query, entries, error_ppm = scores.peptide_matches[i]
+            offset = int(index.offsets[protein])
+            peptides = [
+                PeptideMatch(
+                    peak=q,
+                    mz=round(float(mass_array[q]), 6),
+                    peptide=index.peptide(entry),
+                    start=int(index.digest.start[entry]) - offset + 1,
+                    end=int(index.digest.end[entry]) - offset,
+                    missed_cleavages=int(index.digest.missed_cleavages[entry]),
+                    mass=round(float(index.digest.masses[entry]), 6),
+                    mass_error_ppm=round(ppm, 2)
+                )
+                for q, entry, ppm in zip(query.tolist(), entries.tolist(), error_ppm.tolist())
+            ]
+            identifications.append(ProteinIdentification(
+                enzyme_id=enzyme_id,
+                name=row[1],
+                uniprot_id=row[2],
+                ec_number=row[3],
+                organism=row[4],
+                score=round(float(scores.scores[i]), 2),
+                matched_peaks=int(scores.hits[i]),
+                expected_random_matches=round(float(scores.expected_hits[i]), 4),
+                sequence_coverage=round(float(scores.coverage[i]), 4),
+                peptides=peptides
+            ))
+
+        matched = set()
+        for query, _, _ in scores.peptide_matches:
+            matched.update(query.tolist())
+        return PeptideMassFingerprintResponse(
+            identifications=identifications,
+            total_peaks=len(mass_array),
+            matched_peaks=len(matched),
+            proteins_searched=len(index.enzyme_ids),
+            peptides_searched=len(index)
+        )
@@ -0,0 +1,251 @@
+import os
+from dataclasses import dataclass
+from typing import Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import inspect, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models import Enzyme
+from api.services.data_version import VersionedIndex
+from api.services.formula import monoisotopic_mass
+from api.services.mass_index import MassIndex
+
+# Largest number of missed cleavages kept in the peptide index (requests may ask for fewer)
+PMF_MAX_MISSED_CLEAVAGES = int(os.getenv("PMF_MAX_MISSED_CLEAVAGES", "2"))
+
+# Peptide length range (residues) kept in the peptide index
+PMF_MIN_PEPTIDE_LENGTH = int(os.getenv("PMF_MIN_PEPTIDE_LENGTH", "5"))
+PMF_MAX_PEPTIDE_LENGTH = int(os.getenv("PMF_MAX_PEPTIDE_LENGTH", "50"))
+
+# Amino acid residues (free amino acid minus H2O); cysteine is carbamidomethylated (fixed modification)
+RESIDUE_FORMULAS = {
+    "G": "C2H3NO", "A": "C3H5NO", "S": "C3H5NO2", "P": "C5H7NO", "V": "C5H9NO",
+    "T": "C4H7NO2", "C": "C5H8N2O2S", "L": "C6H11NO", "I": "C6H11NO", "N": "C4H6N2O2",
+    "D": "C4H5NO3", "Q": "C5H8N2O2", "K": "C6H12N2O", "E": "C5H7NO3", "M": "C5H9NOS",
+    "H": "C6H7N3O", "F": "C9H9NO", "R": "C6H12N4O", "Y": "C9H9NO2", "W": "C11H10N2O",
+    "U": "C3H5NOSe", "O": "C12H19N3O2",
+}
+
+WATER_MASS = monoisotopic_mass("H2O")
+
+# Byte -> residue mass lookup; letters without a defined mass (X, B, Z) are flagged as unknown
+_RESIDUE_MASSES = np.zeros(256)
+_UNKNOWN = np.ones(256, dtype=bool)
+for _letter, _formula in RESIDUE_FORMULAS.items():
+    _RESIDUE_MASSES[ord(_letter)] = monoisotopic_mass(_formula)
+    _UNKNOWN[ord(_letter)] = False
+
+
+@dataclass
+class Digest:
+    """Tryptic peptides of several proteins as offsets into the concatenated sequence"""
+    protein: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    missed_cleavages: np.ndarray
+    masses: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+
+def tryptic_digest(
+    sequences: Sequence[str],
+    max_missed_cleavages: int = PMF_MAX_MISSED_CLEAVAGES,
+    min_length: int = PMF_MIN_PEPTIDE_LENGTH,
+    max_length: int = PMF_MAX_PEPTIDE_LENGTH
+) -> Digest:
+    """Cleave after K/R (not before P) and return neutral monoisotopic peptide masses
+
+    All proteins are processed at once: residue masses are summed with one cumulative sum over the
+    concatenated sequence, and a peptide with m missed cleavages spans m + 1 consecutive fragments.
+    """
+    text = "".join(sequences).upper().encode("ascii", "replace")
+    residues = np.frombuffer(text, dtype=np.uint8)
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    protein_end = np.cumsum(lengths)
+    protein_start = protein_end - lengths
+
+    cumulative = np.concatenate([[0.0], np.cumsum(_RESIDUE_MASSES[residues])])
+    unknown = np.concatenate([[0], np.cumsum(_UNKNOWN[residues])])
+
+    # Fragment boundaries: protein starts/ends plus every position after K/R not followed by P
+    after = np.arange(1, len(residues) + 1)
+    cleave = np.isin(residues, (ord("K"), ord("R")))
+    cleave[:-1] &= residues[1:] != ord("P")
+    bounds = np.unique(np.concatenate([protein_start, protein_end, after[cleave]]))
+    bounds_protein = np.searchsorted(protein_end, bounds, side="right")
+
+    protein, start, end, missed = [], [], [], []
+    for m in range(max_missed_cleavages + 1):
+        if len(bounds) <= m + 1:
+            break
+        first, last = bounds[:-m - 1], bounds[m + 1:]
+        # Both ends inside the same protein (an end boundary belongs to the protein before it)
+        keep = bounds_protein[:-m - 1] == np.searchsorted(protein_end, last - 1, side="right")
+        protein.append(bounds_protein[:-m - 1][keep])
+        start.append(first[keep])
+        end.append(last[keep])
+        missed.append(np.full(int(keep.sum()), m, dtype=np.int64))
+
+    if not protein:
+        empty = np.empty(0, dtype=np.int64)
+        return Digest(empty, empty, empty, empty, np.empty(0))
+    protein, start, end, missed = (np.concatenate(a) for a in (protein, start, end, missed))
+    size = end - start
+    keep = (size >= min_length) & (size <= max_length) & (unknown[end] == unknown[start])
+    protein, start, end, missed = protein[keep], start[keep], end[keep], missed[keep]
+    return Digest(protein, start, end, missed, cumulative[end] - cumulative[start] + WATER_MASS)
+
+
+@dataclass
+class ProteinScores:
+    """Proteins with at least one matched peak, best score first"""
+    proteins: np.ndarray
+    hits: np.ndarray
+    coverage: np.ndarray
+    expected_hits: np.ndarray
+    scores: np.ndarray
+    peptide_matches: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+def _poisson_tail(k: np.ndarray, lam: np.ndarray) -> np.ndarray:
+    """P(X >= k) for X ~ Poisson(lam), element-wise"""
+    below = np.zeros(len(k))
+    term = np.exp(-lam)
+    for i in range(int(k.max()) if len(k) else 0):
+        below += np.where(i < k, term, 0.0)
+        term = term * lam / (i + 1)
+    return np.clip(1.0 - below, 1e-300, 1.0)
+
+
+class PeptideIndex:
+    """Sorted tryptic peptide masses of every enzyme with a sequence"""
+
+    def __init__(
+        self,
+        enzyme_ids: np.ndarray,
+        sequences: List[str],
+        max_missed_cleavages: int = PMF_MAX_MISSED_CLEAVAGES
+    ):
+        self.enzyme_ids = np.asarray(enzyme_ids, dtype=np.int64)
+        self.max_missed_cleavages = max_missed_cleavages
+        self._text = "".join(sequences).upper()
+        self.lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+        self.offsets = np.cumsum(self.lengths) - self.lengths
+        self.digest = tryptic_digest(sequences, max_missed_cleavages)
+        self.mass_index = MassIndex(self.digest.masses, np.arange(len(self.digest), dtype=np.int64))
+        self.peptide_counts = np.bincount(self.digest.protein, minlength=len(self.enzyme_ids))
+
+    def __len__(self) -> int:
+        return len(self.digest)
+
+    @classmethod
+    async def from_database(cls, db: AsyncSession) -> "PeptideIndex":
+        """Digest every enzyme sequence stored in the database"""
+        result = await db.execute(
+            select(Enzyme.id, Enzyme.sequence).where(Enzyme.sequence.isnot(None)).order_by(Enzyme.id)
+        )
+        rows = [row for row in result.all() if row[1]]
+        return cls(np.array([row[0] for row in rows], dtype=np.int64), [row[1] for row in rows])
+
+    def peptide(self, entry: int) -> str:
+        return self._text[self.digest.start[entry]:self.digest.end[entry]]
+
+    def score(
+        self,
+        masses: np.ndarray,
+        tol_ppm: float = 20.0,
+        missed_cleavages: Optional[int] = None,
+        min_hits: int = 1
+    ) -> ProteinScores:
+        """Count matched peaks per protein and score them against chance matches
+
+        A peak counts once per protein however many of its peptides fall in the window. Random
+        hits are expected in proportion to the number of peptides of the protein, so the score
+        -10*log10(P(hits or more by chance)) does not simply favour long proteins.
+        """
+        masses = np.asarray(masses, dtype=np.float64)
+        n_proteins = len(self.enzyme_ids)
+        matches = self.mass_index.search(masses, tol_ppm, None)
+        query, entries, error_ppm = matches.query_index, matches.ids, matches.error_ppm
+        if missed_cleavages is not None:
+            keep = self.digest.missed_cleavages[entries] <= missed_cleavages
+            query, entries, error_ppm = query[keep], entries[keep], error_ppm[keep]
+        protein = self.digest.protein[entries]
+
+        pairs = np.unique(np.column_stack([protein, query]), axis=0)
+        hits = np.bincount(pairs[:, 0], minlength=n_proteins)
+
+        # Chance of a random peptide in a peak window: window width over the indexed mass span
+        if missed_cleavages is None:
+            counts = self.peptide_counts
+        else:
+            allowed = self.digest.missed_cleavages <= missed_cleavages
+            counts = np.bincount(self.digest.protein[allowed], minlength=n_proteins)
+        span = float(self.mass_index.masses[-1] - self.mass_index.masses[0]) if len(self) > 1 else 1.0
+        window = float(np.sum(2 * masses[np.isfinite(masses)] * tol_ppm / 1e6))
+        expected = counts * window / max(span, 1e-9)
+
+        found = np.flatnonzero(hits >= max(min_hits, 1))
+        scores = -10 * np.log10(_poisson_tail(hits[found], expected[found]))
+
+        # Residues covered by matched peptides (a +1/-1 sweep over the concatenated sequence)
+        coverage = np.zeros(len(found))
+        if len(found):
+            unique_peptides = np.unique(entries)
+            sweep = np.zeros(len(self._text) + 1, dtype=np.int64)
+            np.add.at(sweep, self.digest.start[unique_peptides], 1)
+            np.add.at(sweep, self.digest.end[unique_peptides], -1)
+            covered = np.cumsum(sweep[:-1]) > 0
+            residue_protein = np.repeat(np.arange(n_proteins), self.lengths)
+            covered_counts = np.bincount(residue_protein[covered], minlength=n_proteins)
+            coverage = covered_counts[found] / np.maximum(self.lengths[found], 1)
+
+        order = np.lexsort((-coverage, -hits[found], -scores))
+        found, scores, coverage = found[order], scores[order], coverage[order]
+
+        by_protein = np.argsort(protein, kind="stable")
+        sorted_protein = protein[by_protein]
+        left = np.searchsorted(sorted_protein, found, side="left")
+        right = np.searchsorted(sorted_protein, found, side="right")
+        peptide_matches = []
+        for lo, hi in zip(left.tolist(), right.tolist()):
+            rows = by_protein[lo:hi]
+            rows = rows[np.lexsort((np.abs(error_ppm[rows]), query[rows]))]
+            peptide_matches.append((query[rows], entries[rows], error_ppm[rows]))
+
+        return ProteinScores(
+            proteins=found,
+            hits=hits[found],
+            coverage=coverage,
+            expected_hits=expected[found],
+            scores=scores,
+            peptide_matches=peptide_matches
+        )
+
+
+async def enzymes_version(db: AsyncSession) -> Hashable:
+    """Fingerprint of the stored enzyme sequences"""
+    result = await db.execute(
+        select(func.count(Enzyme.id), func.max(Enzyme.id), func.sum(func.length(Enzyme.sequence)))
+    )
+    return tuple(result.one())
+
+
+_peptide_index = VersionedIndex(PeptideIndex.from_database, enzymes_version)
+
+
+async def has_sequence_column(db: AsyncSession) -> bool:
+    """Whether the enzymes table has the sequence column (older imports created it without one)"""
+    columns = await db.run_sync(lambda session: inspect(session.connection()).get_columns("enzymes"))
+    return any(column["name"] == "sequence" for column in columns)
+
+
+async def get_peptide_index(db: AsyncSession) -> PeptideIndex:
+    """Shared peptide index, rebuilt when enzyme sequences change
+    (raises ValueError if the database stores no enzyme sequences)"""
+    if not await has_sequence_column(db):
+        raise ValueError(
+            "The enzymes table has no sequence column; run python data/add_enzyme_sequences.py to add sequences"
+        )
+    return await _peptide_index.get(db)
@@ -0,0 +1,162 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.services.data_version import VersionedIndex, enzymes_content_version, metabolites_content_version
+
+# Totals reported by paginated searches: exact (cached per filter), estimate, or none (has_more only)
+COUNT_MODES = ("exact", "estimate", "none")
+
+# Maximum number of cached search totals
+SEARCH_COUNT_CACHE_SIZE = int(os.getenv("SEARCH_COUNT_CACHE_SIZE", "10000"))
+
+# Leading ids counted by an SQLite estimate of a full-table-scan search before extrapolating
+SEARCH_COUNT_ESTIMATE_ROWS = int(os.getenv("SEARCH_COUNT_ESTIMATE_ROWS", "20000"))
+
+
+def normalize_filters(**filters: Any) -> Hashable:
+    """Cache key of a search: empty filters dropped, text lowercased (every text filter compares lower())
+
+    Whitespace is kept: "ab " and "ab" are different LIKE patterns.
+    """
+    return tuple(sorted(
+        (name, value.lower() if isinstance(value, str) else value)
+        for name, value in filters.items()
+        if value is not None and value != ""
+    ))
+
+
+def sqlite_file_version(path: str) -> Hashable:
+    """Version of an SQLite file for callers without a session (changes when an importer writes it)"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class CountCache:
+    """LRU cache of search totals per scope; a scope is emptied when its data version changes"""
+
+    def __init__(self, max_entries: int = SEARCH_COUNT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Hashable, Hashable], int]" = OrderedDict()
+        self._versions: Dict[Hashable, Hashable] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self, scope: Hashable, version: Hashable) -> None:
+        if scope in self._versions and self._versions[scope] != version:
+            for entry in [entry for entry in self._entries if entry[0] == scope]:
+                del self._entries[entry]
+        self._versions[scope] = version
+
+    def get(self, scope: Hashable, version: Hashable, key: Hashable) -> Optional[int]:
+        self._sync(scope, version)
+        total = self._entries.get((scope, key))
+        if total is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((scope, key))
+        self.hits += 1
+        return total
+
+    def put(self, scope: Hashable, version: Hashable, key: Hashable, total: int) -> None:
+        if self.max_entries <= 0:
+            return
+        self._sync(scope, version)
+        self._entries[(scope, key)] = total
+        self._entries.move_to_end((scope, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+count_cache = CountCache()
+
+
+async def _new_generation(db: AsyncSession) -> object:
+    return object()
+
+
+_generations = {
+    "metabolites": VersionedIndex(_new_generation, metabolites_content_version),
+    "enzymes": VersionedIndex(_new_generation, enzymes_content_version),
+}
+
+
+async def exact_count(db: AsyncSession, query) -> int:
+    result = await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))
+    return result.scalar()
+
+
+async def _explain(db: AsyncSession, prefix: str, statement):
+    """Run EXPLAIN on a statement with its values as bound parameters (never rendered into the SQL)"""
+    compiled = statement.compile(dialect=db.bind.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    connection = await db.connection()
+    return await connection.exec_driver_sql(f"{prefix} {compiled}", params)
+
+
+async def _scans_table(db: AsyncSession, statement, table_name: str) -> bool:
+    """Whether SQLite's plan for the statement reads the whole table rather than an index range"""
+    plan = (await _explain(db, "EXPLAIN QUERY PLAN", statement)).fetchall()
+    return any(re.match(rf"SCAN (TABLE )?{table_name}\b", row[-1]) for row in plan)
+
+
+async def estimate_count(db: AsyncSession, query) -> Tuple[int, bool]:
+    """Row estimate of a search query without a full count: (total, estimated)
+
+    PostgreSQL reports the planner's row estimate from its table and index statistics. SQLite
+    keeps no per-query estimates: filters its planner serves from an index range are counted
+    exactly, and a query that would scan the whole table is counted over the first
+    SEARCH_COUNT_ESTIMATE_ROWS ids and extrapolated over the id range.
+    """
+    subquery = query.order_by(None).subquery()
+    if db.bind.dialect.name == "postgresql":
+        plan = (await _explain(db, "EXPLAIN (FORMAT JSON)", select(subquery.c.id))).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]["Plan"]["Plan Rows"]), True
+
+    table = query.get_final_froms()[0]
+    count_statement = select(func.count()).select_from(subquery)
+    if not await _scans_table(db, count_statement, table.name):
+        return (await db.execute(count_statement)).scalar(), False
+
+    # Separate statements: SQLite answers a lone min() or max() from the primary key, both together scan
+    first_id = (await db.execute(select(func.min(table.c.id)))).scalar()
+    max_id = (await db.execute(select(func.max(table.c.id)))).scalar()
+    if first_id is None:
+        return 0, False
+    window = query.where(table.c.id < first_id + SEARCH_COUNT_ESTIMATE_ROWS).order_by(None).subquery()
+    matched = (await db.execute(select(func.count()).select_from(window))).scalar()
+    span = max_id - first_id + 1
+    if span <= SEARCH_COUNT_ESTIMATE_ROWS:
+        return matched, False
+    return int(round(matched * span / SEARCH_COUNT_ESTIMATE_ROWS)), True
+
+
+async def search_total(db: AsyncSession, query, mode: str, scope: str, key: Hashable) -> Tuple[Optional[int], bool]:
+    """Total of a search for the requested count mode: (total or None, estimated)
+    (raises ValueError for an unknown mode)"""
+    if mode not in COUNT_MODES:
+        raise ValueError(f"Unknown count mode '{mode}'. Use one of: {', '.join(COUNT_MODES)}")
+    if mode == "none":
+        return None, False
+    if mode == "estimate":
+        return await estimate_count(db, query)
+
+    generation = await _generations[scope].get(db)
+    total = count_cache.get(scope, generation, key)
+    if total is None:
+        total = await exact_count(db, query)
+        count_cache.put(scope, generation, key, total)
+    return total, False
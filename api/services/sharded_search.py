@@ -0,0 +1,95 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+import numpy as np
+from api.services.mass_index import MassIndex, MassMatches
+
+# Worker processes for sharded annotation (0 or 1 disables the process pool)
+ANNOTATION_PROCESSES = int(os.getenv("ANNOTATION_PROCESSES", "0"))
+
+# Smaller peak lists are searched in-process, where the pool overhead would dominate
+ANNOTATION_PROCESS_MIN_PEAKS = int(os.getenv("ANNOTATION_PROCESS_MIN_PEAKS", "50000"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_size = 0
+
+# Per worker process: memory-mapped indexes by directory
+_attached: Dict[str, MassIndex] = {}
+
+
+def _search_shard(
+    directory: str,
+    centers: np.ndarray,
+    low: np.ndarray,
+    high: np.ndarray,
+    max_candidates: Optional[int]
+) -> MassMatches:
+    """Runs in a worker process against the memory-mapped index"""
+    index = _attached.get(directory)
+    if index is None:
+        _attached.clear()
+        index = _attached[directory] = MassIndex.from_mmap(directory)
+    return index.search_windows(centers, low, high, max_candidates)
+
+
+def _get_executor(processes: int) -> ProcessPoolExecutor:
+    global _executor, _executor_size
+    if _executor is None or _executor_size != processes:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = ProcessPoolExecutor(max_workers=processes)
+        _executor_size = processes
+    return _executor
+
+
+def use_process_pool(n_queries: int, processes: Optional[int] = None) -> bool:
+    processes = ANNOTATION_PROCESSES if processes is None else processes
+    return processes > 1 and n_queries >= ANNOTATION_PROCESS_MIN_PEAKS
+
+
+async def search_sharded(
+    index: MassIndex,
+    centers: np.ndarray,
+    low: np.ndarray,
+    high: np.ndarray,
+    max_candidates: Optional[int],
+    processes: Optional[int] = None
+) -> MassMatches:
+    """Split the query windows into one shard per core and merge the matches in query order"""
+    processes = ANNOTATION_PROCESSES if processes is None else processes
+    directory = index.to_mmap()
+    executor = _get_executor(processes)
+    loop = asyncio.get_running_loop()
+
+    bounds = np.linspace(0, len(centers), processes + 1).astype(np.int64)
+    futures = [
+        loop.run_in_executor(
+            executor, _search_shard, directory,
+            centers[start:stop], low[start:stop], high[start:stop], max_candidates
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+    shards = await asyncio.gather(*futures)
+
+    starts = [start for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+    shards = [(start, shard) for start, shard in zip(starts, shards) if len(shard)]
+    if not shards:
+        return MassMatches.empty()
+    return MassMatches(
+        query_index=np.concatenate([shard.query_index + start for start, shard in shards]),
+        ids=np.concatenate([shard.ids for _, shard in shards]),
+        masses=np.concatenate([shard.masses for _, shard in shards]),
+        error_da=np.concatenate([shard.error_da for _, shard in shards]),
+        error_ppm=np.concatenate([shard.error_ppm for _, shard in shards]),
+        rank=np.concatenate([shard.rank for _, shard in shards])
+    )
+
+
+def shutdown_pool() -> None:
+    global _executor, _executor_size
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _executor_size = 0
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from api.services.data_version import VersionedIndex
+from api.services.mass_index import MassIndex
+
+logger = logging.getLogger(__name__)
+
+# Directory scanned for MSP/MGF spectral libraries
+SPECTRAL_LIBRARY_DIR = os.getenv("SPECTRAL_LIBRARY_DIR", "data/spectra")
+
+# Most intense fragment peaks kept per library spectrum
+SPECTRAL_MAX_PEAKS = int(os.getenv("SPECTRAL_MAX_PEAKS", "100"))
+
+# Fragment peaks below this fraction of the base peak are dropped
+SPECTRAL_MIN_RELATIVE_INTENSITY = float(os.getenv("SPECTRAL_MIN_RELATIVE_INTENSITY", "0.01"))
+
+LIBRARY_SUFFIXES = (".msp", ".mgf")
+
+# Offset between queries in the composite (query, m/z) key; larger than any fragment m/z
+_KEY_STRIDE = 1e5
+
+# Metadata kept per library spectrum (MSP keys and MGF keys are mapped onto these names)
+SPECTRUM_FIELDS = ("name", "precursor_type", "formula", "inchikey", "ion_mode", "library")
+
+_MSP_KEYS = {
+    "name": "name", "precursormz": "precursor_mz", "precursor_mz": "precursor_mz",
+    "precursor_type": "precursor_type", "precursortype": "precursor_type", "adduct": "precursor_type",
+    "formula": "formula", "inchikey": "inchikey", "ion_mode": "ion_mode", "ionmode": "ion_mode",
+}
+_MGF_KEYS = {
+    "title": "name", "name": "name", "compound_name": "name", "pepmass": "precursor_mz",
+    "adduct": "precursor_type", "formula": "formula", "inchikey": "inchikey", "ionmode": "ion_mode",
+}
+_NUMBER_PAIR = re.compile(r"([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)[\s,:]+([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)")
+
+
+class SpectralLibraryUnavailable(Exception):
+    """No spectra are loaded (the library directory is missing or has no MSP/MGF files)"""
+
+
+def _normalize_ion_mode(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value.startswith("p") or value == "+":
+        return "positive"
+    if value.startswith("n") or value == "-":
+        return "negative"
+    return None
+
+
+def _parse_precursor(value: str) -> Optional[float]:
+    try:
+        return float(value.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def _read_msp(path: Path) -> Iterator[Tuple[dict, List[Tuple[float, float]]]]:
+    """(metadata, peaks) per MSP record; records are separated by blank lines"""
+    meta: dict = {}
+    peaks: List[Tuple[float, float]] = []
+    in_peaks = False
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                if meta or peaks:
+                    yield meta, peaks
+                meta, peaks, in_peaks = {}, [], False
+                continue
+            if in_peaks or line[0].isdigit():
+                peaks.extend((float(a), float(b)) for a, b in _NUMBER_PAIR.findall(line))
+                continue
+            key, _, value = line.partition(":")
+            key = key.strip().lower().replace(" ", "_")
+            if key == "num_peaks":
+                in_peaks = True
+            elif key in _MSP_KEYS:
+                meta[_MSP_KEYS[key]] = value.strip()
+    if meta or peaks:
+        yield meta, peaks
+
+
+def _read_mgf(path: Path) -> Iterator[Tuple[dict, List[Tuple[float, float]]]]:
+    """(metadata, peaks) per BEGIN IONS ... END IONS block"""
+    meta: dict = {}
+    peaks: List[Tuple[float, float]] = []
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            line = line.strip()
+            if line == "BEGIN IONS":
+                meta, peaks = {}, []
+            elif line == "END IONS":
+                yield meta, peaks
+            elif "=" in line and not line[0].isdigit():
+                key, _, value = line.partition("=")
+                key = key.strip().lower()
+                if key in _MGF_KEYS:
+                    meta[_MGF_KEYS[key]] = value.strip()
+            elif line and line[0].isdigit():
+                peaks.extend((float(a), float(b)) for a, b in _NUMBER_PAIR.findall(line)[:1])
+
+
+def clean_peaks(
+    mz: np.ndarray,
+    intensities: np.ndarray,
+    max_peaks: int = SPECTRAL_MAX_PEAKS,
+    min_relative_intensity: float = SPECTRAL_MIN_RELATIVE_INTENSITY
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the strongest peaks, sorted by m/z, with sqrt-scaled unit-norm intensities"""
+    mz = np.asarray(mz, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    keep = np.isfinite(mz) & np.isfinite(intensities) & (intensities > 0)
+    mz, intensities = mz[keep], intensities[keep]
+    if len(intensities):
+        keep = intensities >= intensities.max() * min_relative_intensity
+        mz, intensities = mz[keep], intensities[keep]
+    if len(intensities) > max_peaks:
+        top = np.argsort(intensities, kind="stable")[-max_peaks:]
+        mz, intensities = mz[top], intensities[top]
+    order = np.argsort(mz, kind="stable")
+    weights = np.sqrt(intensities[order])
+    norm = np.linalg.norm(weights)
+    return mz[order], weights / norm if norm > 0 else weights
+
+
+@dataclass
+class SpectralMatches:
+    """Flat query x library pairs that passed the precursor window, with similarity scores"""
+    query_index: np.ndarray
+    spectra: np.ndarray
+    scores: np.ndarray
+    matched_peaks: np.ndarray
+    precursor_error_ppm: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.spectra)
+
+
+class SpectralLibrary:
+    """Library spectra as one compact peak store (CSR: offsets into float32 m/z and intensity arrays)
+    with a sorted precursor m/z index for window lookups
+    """
+
+    def __init__(
+        self,
+        precursor_mz: np.ndarray,
+        offsets: np.ndarray,
+        mz: np.ndarray,
+        intensities: np.ndarray,
+        metadata: Dict[str, List[Optional[str]]]
+    ):
+        self.precursor_mz = np.asarray(precursor_mz, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.mz = np.asarray(mz, dtype=np.float32)
+        self.intensities = np.asarray(intensities, dtype=np.float32)
+        self.metadata = metadata
+        self.precursor_index = MassIndex(self.precursor_mz, np.arange(len(self.precursor_mz), dtype=np.int64))
+        modes = metadata.get("ion_mode") or [None] * len(self.precursor_mz)
+        self.ion_modes = np.array([{"positive": 1, "negative": -1}.get(m, 0) for m in modes], dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.precursor_mz)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Sequence[Tuple[dict, List[Tuple[float, float]]]],
+        library: str = ""
+    ) -> "SpectralLibrary":
+        """Clean and pack parsed (metadata, peaks) records; spectra without precursor m/z are skipped"""
+        precursors, sizes, mz_parts, intensity_parts = [], [], [], []
+        metadata: Dict[str, List[Optional[str]]] = {field: [] for field in SPECTRUM_FIELDS}
+        skipped = 0
+        for meta, peaks in records:
+            precursor = _parse_precursor(meta.get("precursor_mz", ""))
+            if precursor is None or not peaks:
+                skipped += 1
+                continue
+            peak_array = np.asarray(peaks, dtype=np.float64)
+            mz, intensities = clean_peaks(peak_array[:, 0], peak_array[:, 1])
+            precursors.append(precursor)
+            sizes.append(len(mz))
+            mz_parts.append(mz)
+            intensity_parts.append(intensities)
+            for field in SPECTRUM_FIELDS:
+                metadata[field].append(meta.get(field) or None)
+            metadata["ion_mode"][-1] = _normalize_ion_mode(meta.get("ion_mode"))
+            metadata["library"][-1] = library
+        if skipped:
+            logger.warning(f"Spectral library {library}: skipped {skipped} spectra without precursor m/z or peaks")
+        offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        return cls(
+            np.array(precursors, dtype=np.float64),
+            offsets,
+            np.concatenate(mz_parts) if mz_parts else np.empty(0),
+            np.concatenate(intensity_parts) if intensity_parts else np.empty(0),
+            metadata
+        )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "SpectralLibrary":
+        """Parse an MSP or MGF file, reusing its compact .npz store when it is newer than the file"""
+        store = path.with_name(path.name + ".npz")
+        if store.exists() and store.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            try:
+                return cls.load(store)
+            except Exception as e:
+                logger.warning(f"Spectral store {store} could not be read: {e}")
+        reader = _read_mgf if path.suffix.lower() == ".mgf" else _read_msp
+        library = cls.from_records(list(reader(path)), path.name)
+        try:
+            library.save(store)
+        except OSError as e:
+            logger.warning(f"Spectral store {store} could not be written: {e}")
+        return library
+
+    @classmethod
+    def merge(cls, libraries: Sequence["SpectralLibrary"]) -> "SpectralLibrary":
+        if not libraries:
+            empty = np.empty(0)
+            return cls(empty, np.zeros(1, dtype=np.int64), empty, empty, {f: [] for f in SPECTRUM_FIELDS})
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for library in libraries:
+            offsets.append(library.offsets[1:] + base)
+            base += int(library.offsets[-1])
+        return cls(
+            np.concatenate([lib.precursor_mz for lib in libraries]),
+            np.concatenate(offsets),
+            np.concatenate([lib.mz for lib in libraries]),
+            np.concatenate([lib.intensities for lib in libraries]),
+            {field: [v for lib in libraries for v in lib.metadata[field]] for field in SPECTRUM_FIELDS}
+        )
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as handle:
+            np.savez(
+                handle,
+                precursor_mz=self.precursor_mz,
+                offsets=self.offsets,
+                mz=self.mz,
+                intensities=self.intensities,
+                metadata=np.array(json.dumps(self.metadata))
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "SpectralLibrary":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["precursor_mz"], data["offsets"], data["mz"], data["intensities"],
+                json.loads(str(data["metadata"]))
+            )
+
+    def spectrum(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.mz[self.offsets[i]:self.offsets[i + 1]], self.intensities[self.offsets[i]:self.offsets[i + 1]]
+
+    def search(
+        self,
+        precursor_mz: np.ndarray,
+        spectra: Sequence[Tuple[np.ndarray, np.ndarray]],
+        precursor_tol_ppm: float = 10.0,
+        fragment_tol: float = 0.02,
+        modified: bool = False,
+        ion_mode: Optional[str] = None
+    ) -> SpectralMatches:
+        """Cosine similarity of every query spectrum to the library spectra in its precursor window
+
+        All (query, candidate) pairs are scored at once: library peaks of every candidate are
+        gathered into one flat array and looked up among the query peaks by binary search on a
+        (query, m/z) composite key. Each library peak matches its nearest query peak within
+        fragment_tol and each query peak is used at most once per pair (highest product kept).
+        The modified cosine also matches library peaks shifted by the precursor mass difference.
+        """
+        precursor_mz = np.asarray(precursor_mz, dtype=np.float64)
+        window = self.precursor_index.search(precursor_mz, precursor_tol_ppm, None)
+        pair_query, pair_spectrum = window.query_index, window.ids
+        if ion_mode is not None:
+            keep = self.ion_modes[pair_spectrum] != {"positive": -1, "negative": 1}[ion_mode]
+            pair_query, pair_spectrum = pair_query[keep], pair_spectrum[keep]
+        n_pairs = len(pair_spectrum)
+
+        # Query peaks sorted by (query, m/z) under one composite key
+        query_peaks = [clean_peaks(mz, intensities) for mz, intensities in spectra]
+        query_sizes = np.array([len(mz) for mz, _ in query_peaks], dtype=np.int64)
+        query_owner = np.repeat(np.arange(len(query_peaks)), query_sizes)
+        query_mz = np.concatenate([mz for mz, _ in query_peaks] + [np.empty(0)])
+        query_weights = np.concatenate([w for _, w in query_peaks] + [np.empty(0)])
+        query_key = query_owner * _KEY_STRIDE + query_mz
+        last = len(query_key) - 1
+
+        # Library peaks of every pair, flattened
+        sizes = self.offsets[pair_spectrum + 1] - self.offsets[pair_spectrum]
+        pair_of_peak = np.repeat(np.arange(n_pairs), sizes)
+        peak = np.repeat(self.offsets[pair_spectrum], sizes) + (
+            np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        )
+        library_mz = self.mz[peak].astype(np.float64)
+        library_weight = self.intensities[peak].astype(np.float64)
+
+        shifts = [np.zeros(n_pairs)]
+        if modified:
+            shifts.append(precursor_mz[pair_query] - self.precursor_mz[pair_spectrum])
+        library_peak, query_peak, product = [], [], []
+        for shift in shifts:
+            if last < 0:
+                break
+            key = pair_query[pair_of_peak] * _KEY_STRIDE + library_mz + shift[pair_of_peak]
+            pos = np.searchsorted(query_key, key)
+            below, above = np.clip(pos - 1, 0, last), np.clip(pos, 0, last)
+            nearest = np.where(np.abs(query_key[below] - key) <= np.abs(query_key[above] - key), below, above)
+            found = np.flatnonzero(np.abs(query_key[nearest] - key) <= fragment_tol)
+            library_peak.append(found)
+            query_peak.append(nearest[found])
+            product.append(library_weight[found] * query_weights[nearest[found]])
+
+        library_peak = np.concatenate(library_peak + [np.empty(0, dtype=np.int64)])
+        query_peak = np.concatenate(query_peak + [np.empty(0, dtype=np.int64)])
+        product = np.concatenate(product + [np.empty(0)])
+        # Greedy one-to-one assignment: best products first, each library and query peak used once per pair
+        order = np.argsort(-product, kind="stable")
+        library_peak, query_peak, product = library_peak[order], query_peak[order], product[order]
+        first = np.sort(np.unique(library_peak, return_index=True)[1])
+        library_peak, query_peak, product = library_peak[first], query_peak[first], product[first]
+        pair = pair_of_peak[library_peak]
+        used = np.unique(np.column_stack([pair, query_peak]), axis=0, return_index=True)[1]
+
+        scores = np.bincount(pair[used], weights=product[used], minlength=n_pairs)
+        matched = np.bincount(pair[used], minlength=n_pairs)
+        return SpectralMatches(
+            query_index=pair_query,
+            spectra=pair_spectrum,
+            scores=np.minimum(scores, 1.0),
+            matched_peaks=matched,
+            precursor_error_ppm=(self.precursor_mz[pair_spectrum] - precursor_mz[pair_query])
+            / precursor_mz[pair_query] * 1e6
+        )
+
+
+def library_files(directory: str = None) -> List[Path]:
+    directory = Path(directory or SPECTRAL_LIBRARY_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if p.suffix.lower() in LIBRARY_SUFFIXES)
+
+
+def load_spectral_library(directory: str = None) -> SpectralLibrary:
+    """All MSP/MGF libraries of the library directory merged into one store"""
+    return SpectralLibrary.merge([SpectralLibrary.from_file(path) for path in library_files(directory)])
+
+
+async def spectral_library_version(db=None) -> Hashable:
+    """Name, modification time and size of every library file"""
+    files = []
+    for path in library_files():
+        stat = path.stat()
+        files.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(files)
+
+
+_spectral_library = VersionedIndex(lambda db: asyncio.to_thread(load_spectral_library), spectral_library_version)
+
+
+async def get_spectral_library(db) -> SpectralLibrary:
+    """Shared spectral library, reloaded when a library file is added or changed"""
+    return await _spectral_library.get(db)
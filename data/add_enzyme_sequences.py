@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Загрузка аминокислотных последовательностей ферментов из UniProt
+Добавляет колонку sequence в существующую базу без повторного импорта (нужна для /enzymes/pmf)
+"""
+
+import sqlite3
+import time
+import argparse
+import logging
+from typing import Dict, List
+import requests
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+UNIPROT_SEARCH_URL = "https://rest.uniprot.org/uniprotkb/search"
+
+
+def ensure_sequence_column(conn: sqlite3.Connection) -> None:
+    """Добавляет колонку sequence в таблицу enzymes, если ее нет"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(enzymes)")}
+    if "sequence" not in columns:
+        conn.execute("ALTER TABLE enzymes ADD COLUMN sequence TEXT")
+        conn.commit()
+        logger.info("Добавлена колонка enzymes.sequence")
+
+
+def fetch_sequences(session: requests.Session, accessions: List[str]) -> Dict[str, str]:
+    """Последовательности пачки UniProt accession одним запросом"""
+    params = {
+        'query': " OR ".join(f"accession:{acc}" for acc in accessions),
+        'format': 'tsv',
+        'fields': 'accession,sequence',
+        'size': len(accessions)
+    }
+    response = session.get(UNIPROT_SEARCH_URL, params=params, timeout=60)
+    response.raise_for_status()
+    sequences = {}
+    for line in response.text.splitlines()[1:]:
+        parts = line.split("\t")
+        if len(parts) == 2 and parts[1]:
+            sequences[parts[0]] = parts[1]
+    return sequences
+
+
+def add_enzyme_sequences(db_path: str, batch_size: int = 100, dry_run: bool = False) -> int:
+    """Заполняет пустые последовательности ферментов с UniProt ID, возвращает число обновленных строк"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_sequence_column(conn)
+        rows = conn.execute(
+            "SELECT id, uniprot_id FROM enzymes WHERE uniprot_id IS NOT NULL AND uniprot_id != '' AND sequence IS NULL"
+        ).fetchall()
+        logger.info(f"Ферментов без последовательности: {len(rows)}")
+        if dry_run or not rows:
+            return 0
+
+        session = requests.Session()
+        updated = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                sequences = fetch_sequences(session, [acc for _, acc in batch])
+            except Exception as e:
+                logger.error(f"Ошибка запроса к UniProt: {str(e)}")
+                continue
+            values = [(sequences[acc], enzyme_id) for enzyme_id, acc in batch if acc in sequences]
+            conn.executemany("UPDATE enzymes SET sequence = ? WHERE id = ?", values)
+            conn.commit()
+            updated += len(values)
+            logger.info(f"Обработано {min(start + batch_size, len(rows))}/{len(rows)}, обновлено {updated}")
+            time.sleep(1)  # Уважительное отношение к API
+        return updated
+    finally:
+        conn.close()
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Загрузка последовательностей ферментов из UniProt")
+    parser.add_argument("--db", default="data/metabolome.db", help="Путь к базе SQLite")
+    parser.add_argument("--batch-size", type=int, default=100, help="Accession в одном запросе к UniProt")
+    parser.add_argument("--dry-run", action="store_true", help="Только добавить колонку и показать статистику")
+    args = parser.parse_args()
+    add_enzyme_sequences(args.db, args.batch_size, args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Аннотация файла mzML из командной строки
+Потоково читает спектры через pymzml, объединяет пики в признаки и пишет NDJSON или CSV
+"""
+
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.database.base import AsyncSessionLocal, async_engine
+from api.services.mzml_service import MzmlService
+
+
+async def annotate(args) -> None:
+    """Записывает аннотированные признаки в выходной файл по мере их получения"""
+    output_path = args.output or str(Path(args.mzml).with_suffix("")) + f".features.{args.format}"
+    with open(output_path, "wb") as output:
+        async with AsyncSessionLocal() as session:
+            async for block in MzmlService.stream_mzml_annotations(
+                session,
+                args.mzml,
+                tol_ppm=args.tol_ppm,
+                max_candidates=args.max_candidates,
+                adducts=args.adducts,
+                ion_mode=args.ion_mode,
+                min_intensity=args.min_intensity,
+                max_gap_scans=args.max_gap_scans,
+                min_scans=args.min_scans,
+                mode=args.mode,
+                output_format=args.format,
+            ):
+                output.write(block)
+    await async_engine.dispose()
+    print(f"Результаты сохранены в {output_path}")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Аннотация файла mzML по базе метаболитов")
+    parser.add_argument("mzml", help="Путь к файлу .mzML или .mzML.gz")
+    parser.add_argument("-o", "--output", help="Файл результатов (по умолчанию <mzml>.features.<format>)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="csv")
+    parser.add_argument("--tol-ppm", type=float, default=10.0)
+    parser.add_argument("--max-candidates", type=int, default=10)
+    parser.add_argument("--adducts", help="Аддукты через запятую, например [M+H]+,[M+Na]+")
+    parser.add_argument("--ion-mode", choices=["positive", "negative"])
+    parser.add_argument("--min-intensity", type=float, default=0.0)
+    parser.add_argument("--max-gap-scans", type=int, default=5)
+    parser.add_argument("--min-scans", type=int, default=1)
+    parser.add_argument("--mode", choices=["auto", "profile", "centroid"], default="auto")
+    asyncio.run(annotate(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
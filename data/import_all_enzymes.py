@@ -3,12 +3,20 @@
 Скрипт для импорта ВСЕХ известных ферментов
 Включает тысячи ферментов из различных организмов с полной информацией
 """
+import sys
 import sqlite3
 import logging
 import random
 from pathlib import Path
 from typing import Dict, List, Any
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -803,6 +811,8 @@ class AllEnzymesImporter:
         cursor.execute("SELECT COUNT(*) FROM metabolites")
         metabolite_count = cursor.fetchone()[0]
         
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         
         logger.info(f"База данных создана!")
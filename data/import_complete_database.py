@@ -3,12 +3,21 @@
 Скрипт для создания ПОЛНОЙ базы данных с ВСЕМИ известными ферментами и метаболитами
 Включает тысячи ферментов и метаболитов с русскими названиями
 """
+import sys
 import sqlite3
 import logging
 import random
 from pathlib import Path
 from typing import Dict, List, Any
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.formula import monoisotopic_mass
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -100,6 +109,8 @@ class CompleteMetabolomeImporter:
         cursor.execute("SELECT COUNT(*) FROM metabolite_pathway")
         pathway_connections = cursor.fetchone()[0]
         
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         
         logger.info("🎉 ПОЛНАЯ база данных создана!")
@@ -768,32 +779,30 @@ class CompleteMetabolomeImporter:
     def _generate_molecular_formula(self):
         """Генерация молекулярной формулы и массы"""
         elements = {
-            'C': (1, 40, 12.011),
-            'H': (1, 80, 1.008),
-            'O': (0, 25, 15.999),
-            'N': (0, 10, 14.007),
-            'P': (0, 4, 30.974),
-            'S': (0, 3, 32.06),
-            'Cl': (0, 2, 35.45),
-            'Mg': (0, 1, 24.305),
-            'K': (0, 1, 39.098),
-            'Na': (0, 1, 22.990)
+            'C': (1, 40),
+            'H': (1, 80),
+            'O': (0, 25),
+            'N': (0, 10),
+            'P': (0, 4),
+            'S': (0, 3),
+            'Cl': (0, 2),
+            'Mg': (0, 1),
+            'K': (0, 1),
+            'Na': (0, 1)
         }
         
         formula_parts = []
-        total_mass = 0
         
-        for element, (min_count, max_count, atomic_mass) in elements.items():
+        for element, (min_count, max_count) in elements.items():
             count = random.randint(min_count, max_count)
             if count > 0:
                 if count == 1:
                     formula_parts.append(element)
                 else:
                     formula_parts.append(f"{element}{count}")
-                total_mass += count * atomic_mass
         
         formula = ''.join(formula_parts)
-        exact_mass = round(total_mass, 6)
+        exact_mass = round(monoisotopic_mass(formula), 6)
         
         return formula, exact_mass
 
@@ -3,6 +3,7 @@
 Скрипт для создания полной базы данных с растительными ферментами и метаболитами
 Объединяет данные из разных источников для создания комплексной базы
 """
+import sys
 import sqlite3
 import pandas as pd
 import numpy as np
@@ -11,6 +12,14 @@ import logging
 from typing import List, Dict, Any, Optional
 import random
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.formula import monoisotopic_mass
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -149,7 +158,6 @@ class ComprehensiveDatabaseImporter:
             
             # Генерируем химическую формулу
             formula_parts = []
-            total_mass = 0
             
             for element, (min_count, max_count) in base_elements.items():
                 count_elem = random.randint(min_count, max_count)
@@ -158,13 +166,9 @@ class ComprehensiveDatabaseImporter:
                         formula_parts.append(element)
                     else:
                         formula_parts.append(f"{element}{count_elem}")
-                    
-                    # Примерные атомные массы
-                    atomic_masses = {'C': 12.01, 'H': 1.008, 'O': 15.999, 'N': 14.007, 'P': 30.974, 'S': 32.06}
-                    total_mass += count_elem * atomic_masses.get(element, 12)
             
             formula = ''.join(formula_parts)
-            exact_mass = round(total_mass, 6)
+            exact_mass = round(monoisotopic_mass(formula), 6)
             
             # Определяем класс
             class_name = self._determine_metabolite_class(base_name, formula)
@@ -338,6 +342,8 @@ class ComprehensiveDatabaseImporter:
         cursor.execute("SELECT COUNT(*) FROM classes")
         class_count = cursor.fetchone()[0]
         
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         
         logger.info(f"Импорт завершен!")
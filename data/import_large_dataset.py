@@ -4,6 +4,7 @@
 Создает полную базу данных для учебных целей
 """
 
+import sys
 import sqlite3
 import pandas as pd
 import numpy as np
@@ -12,6 +13,14 @@ import logging
 from typing import List, Dict, Any, Optional
 import random
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.formula import monoisotopic_masses
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -119,11 +128,6 @@ class LargeDatasetImporter:
                 
                 formula = "".join(formula_parts)
             
-            # Генерируем массу (примерно на основе формулы)
-            exact_mass = self._estimate_mass_from_formula(formula)
-            if exact_mass is None:
-                exact_mass = random.uniform(50.0, 1000.0)
-            
             # Генерируем внешние ID
             hmdb_id = f"HMDB{random.randint(1000000, 9999999):07d}" if random.random() < 0.7 else None
             chebi_id = f"CHEBI:{random.randint(100000, 999999)}" if random.random() < 0.8 else None
@@ -140,7 +144,7 @@ class LargeDatasetImporter:
             metabolite = {
                 'name': name,
                 'formula': formula,
-                'exact_mass': round(exact_mass, 6),
+                'exact_mass': None,
                 'hmdb_id': hmdb_id,
                 'chebi_id': chebi_id,
                 'kegg_id': kegg_id,
@@ -155,47 +159,16 @@ class LargeDatasetImporter:
             if (i + 1) % 1000 == 0:
                 logger.info(f"Сгенерировано {i + 1} метаболитов...")
         
+        # Точные моноизотопные массы считаем сразу для всего столбца формул
+        masses = monoisotopic_masses([m['formula'] for m in metabolites])
+        for metabolite, mass in zip(metabolites, masses.tolist()):
+            if np.isnan(mass):
+                mass = random.uniform(50.0, 1000.0)
+            metabolite['exact_mass'] = round(mass, 6)
+        
         logger.info(f"Генерация завершена: {len(metabolites)} метаболитов")
         return metabolites
     
-    def _estimate_mass_from_formula(self, formula: str) -> Optional[float]:
-        """Примерная оценка массы по формуле"""
-        try:
-            # Простая оценка на основе атомных масс
-            atomic_masses = {
-                'C': 12.011, 'H': 1.008, 'O': 15.999, 'N': 14.007,
-                'P': 30.974, 'S': 32.065, 'Na': 22.990, 'K': 39.098,
-                'Ca': 40.078, 'Cl': 35.453
-            }
-            
-            total_mass = 0.0
-            current_element = ""
-            current_count = ""
-            
-            for char in formula:
-                if char.isupper():
-                    # Обрабатываем предыдущий элемент
-                    if current_element and current_element in atomic_masses:
-                        count = int(current_count) if current_count else 1
-                        total_mass += atomic_masses[current_element] * count
-                    
-                    current_element = char
-                    current_count = ""
-                elif char.islower():
-                    current_element += char
-                elif char.isdigit():
-                    current_count += char
-            
-            # Обрабатываем последний элемент
-            if current_element and current_element in atomic_masses:
-                count = int(current_count) if current_count else 1
-                total_mass += atomic_masses[current_element] * count
-            
-            return total_mass if total_mass > 0 else None
-            
-        except:
-            return None
-    
     def create_database_tables(self):
         """Создание таблиц в базе данных"""
         conn = sqlite3.connect(self.db_path)
@@ -366,6 +339,8 @@ class LargeDatasetImporter:
         
         # Финальное сохранение
         conn.commit()
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         
         logger.info(f"Импорт завершен!")
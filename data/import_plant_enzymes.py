@@ -4,6 +4,7 @@
 Использует UniProt API, BRENDA и KEGG для получения полной информации о ферментах
 """
 import requests
+import sys
 import sqlite3
 import time
 import json
@@ -12,6 +13,13 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 import logging
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -59,7 +67,7 @@ class PlantEnzymeImporter:
                 'query': query,
                 'format': 'json',
                 'size': min(batch_size, limit - len(enzymes)),
-                'fields': 'accession,id,protein_name,gene_names,organism_name,ec,mass,ph_dependence,temperature_dependence,function_cc,subcellular_location,tissue_specificity'
+                'fields': 'accession,id,protein_name,gene_names,organism_name,ec,mass,ph_dependence,temperature_dependence,function_cc,subcellular_location,tissue_specificity,sequence'
             }
             
             try:
@@ -120,6 +128,7 @@ class PlantEnzymeImporter:
             molecular_weight = sequence.get('molWeight', None)
             if molecular_weight:
                 molecular_weight = molecular_weight / 1000  # Перевод в kDa
+            amino_acids = sequence.get('value') or None  # Для триптического гидролиза (PMF)
             
             # Функция
             function_comments = entry.get('comments', [])
@@ -193,7 +202,8 @@ class PlantEnzymeImporter:
                 'protein_name': full_name,
                 'gene_name': gene_name,
                 'tissue_specificity': tissue_specificity,
-                'subcellular_location': subcellular_location
+                'subcellular_location': subcellular_location,
+                'sequence': amino_acids
             }
             
         except Exception as e:
@@ -375,7 +385,8 @@ class PlantEnzymeImporter:
                 protein_name VARCHAR(500),
                 gene_name VARCHAR(100),
                 tissue_specificity TEXT,
-                subcellular_location VARCHAR(255)
+                subcellular_location VARCHAR(255),
+                sequence TEXT
             );
         """)
         
@@ -429,6 +440,8 @@ class PlantEnzymeImporter:
         """)
         
         conn.commit()
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         logger.info("Таблицы базы данных созданы")
 
@@ -479,8 +492,8 @@ class PlantEnzymeImporter:
                         name, uniprot_id, ec_number, organism, organism_type,
                         family, description, molecular_weight, optimal_ph,
                         optimal_temperature, protein_name, gene_name,
-                        tissue_specificity, subcellular_location
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        tissue_specificity, subcellular_location, sequence
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     enzyme['name'],
                     enzyme.get('uniprot_id'),
@@ -495,7 +508,8 @@ class PlantEnzymeImporter:
                     enzyme.get('protein_name'),
                     enzyme.get('gene_name'),
                     enzyme.get('tissue_specificity'),
-                    enzyme.get('subcellular_location')
+                    enzyme.get('subcellular_location'),
+                    enzyme.get('sequence')
                 ))
                 
                 imported_count += 1
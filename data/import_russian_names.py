@@ -3,12 +3,21 @@
 Скрипт для создания полной базы данных с русскими названиями
 Включает метаболиты, ферменты, классы и пути с русской локализацией
 """
+import sys
 import sqlite3
 import logging
 import random
 from pathlib import Path
 from typing import Dict, List, Any
 
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.formula import monoisotopic_mass
+from api.services.fulltext import update_fulltext_index
+from api.services.data_version import update_change_tracking
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -602,6 +611,8 @@ class RussianNamesImporter:
         cursor.execute("SELECT COUNT(*) FROM metabolites")
         metabolite_count = cursor.fetchone()[0]
         
+        update_fulltext_index(conn)
+        update_change_tracking(conn)
         conn.close()
         
         logger.info("Импорт завершен!")
@@ -733,7 +744,6 @@ class RussianNamesImporter:
             
             # Генерируем формулу
             formula_parts = []
-            total_mass = 0
             
             elements = {'C': (1, 30), 'H': (1, 60), 'O': (0, 20), 'N': (0, 8), 'P': (0, 3), 'S': (0, 2)}
             for element, (min_count, max_count) in elements.items():
@@ -743,12 +753,9 @@ class RussianNamesImporter:
                         formula_parts.append(element)
                     else:
                         formula_parts.append(f"{element}{count}")
-                    
-                    atomic_masses = {'C': 12.01, 'H': 1.008, 'O': 15.999, 'N': 14.007, 'P': 30.974, 'S': 32.06}
-                    total_mass += count * atomic_masses.get(element, 12)
             
             formula = ''.join(formula_parts)
-            exact_mass = round(total_mass, 6)
+            exact_mass = round(monoisotopic_mass(formula), 6)
             
             # Определяем класс
             class_name = self._determine_class_from_name(ru_name)
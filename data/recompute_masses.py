@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Пересчет exact_mass по формулам (точные моноизотопные массы)
+Исправляет массы, ранее оцененные по средним атомным массам
+"""
+
+import sys
+import sqlite3
+import argparse
+import logging
+from pathlib import Path
+import numpy as np
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.services.formula import monoisotopic_masses
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def recompute_masses(db_path: str, table: str = "metabolites", min_delta: float = 1e-4, dry_run: bool = False) -> int:
+    """Пересчитывает массы всех строк с разбираемой формулой, возвращает число исправленных строк"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, formula, exact_mass FROM {table}")
+        rows = cursor.fetchall()
+        if not rows:
+            logger.info("Таблица пуста")
+            return 0
+
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        old = np.array([row[2] if row[2] is not None else np.nan for row in rows], dtype=np.float64)
+        new = monoisotopic_masses([row[1] for row in rows])
+
+        # Обновляем только строки с разобранной формулой и заметным расхождением
+        changed = np.isfinite(new) & ~(np.abs(new - old) <= min_delta)
+        unparsed = int(np.isnan(new).sum())
+        logger.info(f"Строк: {len(rows)}, формулы не разобраны: {unparsed}, к исправлению: {int(changed.sum())}")
+        if changed.any():
+            delta = np.abs(new[changed] - old[changed])
+            delta = delta[np.isfinite(delta)]
+            if len(delta):
+                logger.info(f"Медианное расхождение: {np.median(delta) * 1000:.2f} mDa, максимальное: {delta.max() * 1000:.2f} mDa")
+
+        if dry_run or not changed.any():
+            return int(changed.sum())
+
+        cursor.executemany(
+            f"UPDATE {table} SET exact_mass = ? WHERE id = ?",
+            zip(np.round(new[changed], 6).tolist(), ids[changed].tolist())
+        )
+        conn.commit()
+        logger.info(f"Обновлено {int(changed.sum())} строк")
+        return int(changed.sum())
+    finally:
+        conn.close()
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Пересчет точных моноизотопных масс по формулам")
+    parser.add_argument("--db", default="data/metabolome.db", help="Путь к базе SQLite")
+    parser.add_argument("--table", default="metabolites", choices=["metabolites", "lipids", "carbohydrates"])
+    parser.add_argument("--min-delta", type=float, default=1e-4, help="Минимальное расхождение (Da) для обновления")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать статистику")
+    args = parser.parse_args()
+    recompute_masses(args.db, args.table, args.min_delta, args.dry_run)
+
+if __name__ == "__main__":
+    main()
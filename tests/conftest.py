@@ -0,0 +1,49 @@
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import StaticPool
+
+from api.database.base import Base
+from api.models import Metabolite, Class, Pathway, Enzyme
+from api.services.mass_index import _mass_index
+from api.services.annotation_cache import annotation_cache
+from api.services.formula_index import _formula_index
+
+TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+@pytest_asyncio.fixture(scope="function")
+async def async_db():
+    """Create async test database with a few metabolites"""
+    engine = create_async_engine(
+        TEST_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as session:
+        test_class = Class(name="Test Class")
+        session.add(test_class)
+        await session.flush()
+        glucose = Metabolite(name="Glucose", formula="C6H12O6", exact_mass=180.063388,
+                             hmdb_id="HMDB0000122", class_id=test_class.id)
+        glucose.pathways.append(Pathway(name="Glycolysis"))
+        glucose.enzymes.append(Enzyme(name="Hexokinase", uniprot_id="P19367"))
+        session.add_all([
+            glucose,
+            Metabolite(name="Fructose", formula="C6H12O6", exact_mass=180.063388,
+                       hmdb_id="HMDB0000660", class_id=test_class.id),
+            Metabolite(name="Pyruvate", formula="C3H4O3", exact_mass=88.016043,
+                       hmdb_id="HMDB0000243", class_id=test_class.id),
+        ])
+        await session.commit()
+        _mass_index.invalidate()
+        _formula_index.invalidate()
+        annotation_cache.clear()
+        yield session
+
+    _mass_index.invalidate()
+    _formula_index.invalidate()
+    annotation_cache.clear()
+    await engine.dispose()
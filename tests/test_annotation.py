@@ -0,0 +1,754 @@
+import io
+import json
+import pytest
+import numpy as np
+
+from api.models import Metabolite, Enzyme
+from api.services import AnnotationService
+from api.services.mass_index import MassIndex, _mass_index
+from api.services.annotation_cache import AnnotationCache, annotation_cache
+from api.services.formula_index import FormulaIndex, _formula_index
+
+def test_mass_index_top_k():
+    """Closest candidates are returned per query, limited to max_candidates"""
+    index = MassIndex(
+        masses=np.array([100.0, 100.0005, 99.9995, 100.002, 200.0]),
+        ids=np.array([1, 2, 3, 4, 5])
+    )
+    matches = index.search(np.array([100.0, 150.0, 200.0]), tol_ppm=10, max_candidates=2)
+
+    assert matches.query_index.tolist() == [0, 0, 2]
+    assert matches.ids.tolist()[0] == 1
+    assert set(matches.ids.tolist()[:2]) <= {1, 2, 3}
+    assert matches.rank.tolist() == [0, 1, 0]
+    assert np.all(np.abs(matches.error_ppm) <= 10)
+
+def test_mass_index_matches_brute_force():
+    """Vectorized search agrees with a per-peak scan"""
+    rng = np.random.default_rng(0)
+    masses = rng.uniform(50, 1000, 5000)
+    index = MassIndex(masses, np.arange(5000))
+    queries = rng.uniform(50, 1000, 300)
+    matches = index.search(queries, tol_ppm=50, max_candidates=3)
+
+    for q, mz in enumerate(queries):
+        errors = np.abs(masses - mz)
+        expected = np.argsort(errors)[:3]
+        expected = [i for i in expected if errors[i] <= mz * 50 / 1e6]
+        assert matches.ids[matches.query_index == q].tolist() == expected
+
+@pytest.mark.asyncio
+async def test_annotate_mz_list_uses_index(async_db):
+    """Annotation resolves all peaks and reports candidates with errors"""
+    response = await AnnotationService.annotate_mz_list(async_db, [180.0634, 88.016, 500.0])
+
+    assert response.total_peaks == 3
+    assert response.annotated_peaks == 2
+    names = [c.metabolite.name for c in response.items[0].candidates]
+    assert sorted(names) == ["Fructose", "Glucose"]
+    assert response.items[0].candidates[0].metabolite.class_name == "Test Class"
+    assert response.items[2].candidates == []
+
+@pytest.mark.asyncio
+async def test_convert_many_resolves_relationships(async_db):
+    """Bulk conversion fills class, pathways and enzymes for every metabolite"""
+    from api.services import MetaboliteService
+
+    metabolites = await MetaboliteService.get_metabolites_by_ids(async_db, [1, 2, 3])
+    converted = {m.name: m for m in await MetaboliteService.convert_many(async_db, metabolites)}
+
+    assert converted["Glucose"].pathways == ["Glycolysis"]
+    assert converted["Glucose"].enzymes == ["Hexokinase"]
+    assert converted["Fructose"].pathways == []
+    assert converted["Pyruvate"].class_name == "Test Class"
+
+@pytest.mark.asyncio
+async def test_mass_index_reloads_on_data_change(async_db):
+    """New metabolites become visible once the data version changes"""
+    _mass_index.ttl = 0
+    annotation_cache.ttl = 0
+    try:
+        response = await AnnotationService.annotate_mz_list(async_db, [146.0215])
+        assert response.annotated_peaks == 0
+
+        async_db.add(Metabolite(name="Oxoglutarate", formula="C5H6O5", exact_mass=146.021523))
+        await async_db.commit()
+
+        response = await AnnotationService.annotate_mz_list(async_db, [146.0215])
+        assert response.annotated_peaks == 1
+    finally:
+        _mass_index.ttl = 5.0
+        annotation_cache.ttl = 5.0
+
+@pytest.mark.asyncio
+async def test_batched_sql_engine_matches_index(async_db):
+    """Batched SQL ranking returns the same candidates as the mass index"""
+    mz_values = np.array([180.0634, 88.016, 500.0])
+    from_index = await AnnotationService._find_candidates(async_db, mz_values, 10.0, 5, engine="index")
+    from_sql = await AnnotationService._find_candidates(async_db, mz_values, 10.0, 5, engine="sql")
+
+    assert from_sql.query_index.tolist() == from_index.query_index.tolist() == [0, 0, 1]
+    assert from_sql.ids.tolist() == from_index.ids.tolist()
+    assert np.allclose(from_sql.error_ppm, from_index.error_ppm)
+
+@pytest.mark.asyncio
+async def test_stream_csv_annotations(async_db):
+    """Streaming annotation yields one NDJSON line per peak across chunks"""
+    content = b"id,mz\n" + b"".join(b"%d,180.0634\n" % i for i in range(250))
+    chunks = AnnotationService.open_csv_chunks(io.BytesIO(content), "mz", chunk_size=100)
+
+    lines = []
+    async for block in AnnotationService.stream_csv_annotations(async_db, chunks, "mz"):
+        lines.extend(block.decode("utf-8").splitlines())
+
+    assert len(lines) == 250
+    last = json.loads(lines[-1])
+    assert last["row"] == 249
+    assert last["best_match"]["name"] == "Glucose"
+
+def test_resolve_adducts():
+    """Adduct names are normalized and ion mode selects defaults"""
+    from api.services.adducts import resolve_adducts
+
+    assert [a.name for a in resolve_adducts("M+H, [M+Na]+")] == ["[M+H]+", "[M+Na]+"]
+    assert all(a.charge < 0 for a in resolve_adducts(ion_mode="negative"))
+    assert resolve_adducts() == []
+    with pytest.raises(ValueError):
+        resolve_adducts("[M-H]-", ion_mode="positive")
+
+@pytest.mark.asyncio
+async def test_annotate_with_adducts(async_db):
+    """Every peak is matched under all adduct hypotheses and labelled with its adduct"""
+    response = await AnnotationService.annotate_mz_list(
+        async_db, [181.070665, 203.052583, 87.008767], adducts=["[M+H]+", "[M+Na]+", "[M-H]-"]
+    )
+
+    adducts = [item.candidates[0].adduct for item in response.items]
+    assert adducts == ["[M+H]+", "[M+Na]+", "[M-H]-"]
+    assert response.items[2].best_match.name == "Pyruvate"
+    assert abs(response.items[0].candidates[0].mass_error_ppm) < 1
+
+@pytest.mark.asyncio
+async def test_annotation_job_persists_results(async_db, tmp_path):
+    """Background job annotates in chunks, tracks progress and pages results from disk"""
+    from contextlib import asynccontextmanager
+    from api.services.job_service import AnnotationJobManager
+
+    @asynccontextmanager
+    async def session_factory():
+        yield async_db
+
+    manager = AnnotationJobManager(str(tmp_path), workers=1, session_factory=session_factory, chunk_size=10)
+    job = await manager.submit_mz_list([180.0634] * 25 + [500.0])
+    await manager._queue.join()
+    await manager.shutdown()
+
+    status = manager.get_job(job.job_id)
+    assert status.status == "completed"
+    assert (status.processed_peaks, status.annotated_peaks) == (26, 25)
+
+    page = await manager.read_results(job.job_id, offset=24, limit=10)
+    assert len(page) == 2
+    assert page[0].best_match.name in ("Glucose", "Fructose")
+    assert page[1].candidates == []
+    assert [len(await manager.read_results(job.job_id, offset, 10)) for offset in (0, 9, 10, 20, 26)] == [10, 10, 10, 6, 0]
+    assert manager._load_offsets(job.job_id)[:, 0].tolist() == [0, 10, 20, 26]
+    assert manager.result_path(job.job_id, "csv").exists()
+
+@pytest.mark.asyncio
+async def test_annotation_job_counts_csv_rows(tmp_path):
+    """CSV total is counted by the chunked reader (quoted newlines, blank lines and CR endings)"""
+    from api.services.job_service import AnnotationJobManager
+
+    path = tmp_path / "peaks.csv"
+    path.write_bytes(b'mz,comment\r180.0634,"two\r\nlines"\r\r88.016,plain\r')
+    assert AnnotationJobManager._count_csv_rows(path, "mz", 1) == 2
+
+@pytest.mark.asyncio
+async def test_annotation_jobs_pruned_after_ttl(async_db, tmp_path):
+    """Finished jobs are removed from memory and disk once older than the TTL, or on delete"""
+    import time
+    from contextlib import asynccontextmanager
+    from api.services.job_service import AnnotationJobManager
+
+    @asynccontextmanager
+    async def session_factory():
+        yield async_db
+
+    manager = AnnotationJobManager(str(tmp_path), workers=1, session_factory=session_factory, ttl=3600)
+    old = await manager.submit_mz_list([180.0634])
+    other = await manager.submit_mz_list([88.0160])
+    await manager._queue.join()
+    await manager.shutdown()
+
+    assert manager.prune() == 0
+    assert manager.prune(now=time.time() + 7200) == 2
+    assert manager.get_job(old.job_id) is None and not (tmp_path / old.job_id).exists()
+
+    job = await manager.submit_mz_list([180.0634])
+    manager._jobs[job.job_id].status = "running"
+    with pytest.raises(ValueError):
+        manager.delete_job(job.job_id)
+    manager._jobs[job.job_id].status = "queued"
+    assert manager.delete_job(job.job_id) and not manager.delete_job(job.job_id)
+    assert not (tmp_path / job.job_id).exists() and other.job_id not in manager._jobs
+    await manager.shutdown()
+
+@pytest.mark.asyncio
+async def test_sharded_search_matches_single_process():
+    """Process-pool search over the memory-mapped index merges shards in peak order"""
+    from api.services.sharded_search import search_sharded, shutdown_pool
+
+    rng = np.random.default_rng(1)
+    index = MassIndex(rng.uniform(50, 1000, 20000), np.arange(20000))
+    mz_values = rng.uniform(50, 1000, 1000)
+    delta = mz_values * 20 / 1e6
+    try:
+        sharded = await search_sharded(index, mz_values, mz_values - delta, mz_values + delta, 3, processes=2)
+    finally:
+        shutdown_pool()
+    single = index.search(mz_values, 20, 3)
+
+    assert sharded.query_index.tolist() == single.query_index.tolist()
+    assert sharded.ids.tolist() == single.ids.tolist()
+
+@pytest.mark.asyncio
+async def test_annotation_cache_hits_and_matches_uncached(async_db):
+    """Repeated peaks are served from the cache with errors recomputed for the exact m/z"""
+    from api.services.adducts import resolve_adducts
+
+    adducts = "[M+H]+,[M-H]-"
+    stats = annotation_cache.stats()
+    await AnnotationService._find_candidates(async_db, np.array([181.07066, 87.00877]), 10.0, 10, adducts=adducts)
+    mz_values = np.array([181.07067, 87.00877])
+    cached = await AnnotationService._find_candidates(async_db, mz_values, 10.0, 10, adducts=adducts)
+    uncached = await AnnotationService._search_candidates(
+        async_db, mz_values, 10.0, 10, resolve_adducts(adducts)
+    )
+
+    assert annotation_cache.hits - stats["hits"] == 2
+    assert len(cached) == 3
+    assert cached.ids.tolist() == uncached.ids.tolist()
+    assert cached.adducts.tolist() == uncached.adducts.tolist()
+    assert np.allclose(cached.error_ppm, uncached.error_ppm)
+
+@pytest.mark.asyncio
+async def test_annotation_cache_bin_keeps_candidates_of_every_peak(async_db):
+    """A bin filled by one peak still holds candidates inside the tolerance of another peak of the bin"""
+    async_db.add(Metabolite(name="Edge", formula="C5H8O2", exact_mass=100 * (1 + 10.5e-6)))
+    await async_db.commit()
+    annotation_cache.clear()
+    a, b = 100.0, 100 * (1 + 0.75e-6)
+    keys = annotation_cache.keys(np.array([a, b]), "params", 10.0)
+    assert keys[0] == keys[1]
+
+    cold = await AnnotationService._find_candidates(async_db, np.array([b]), 10.0, 10)
+    annotation_cache.clear()
+    await AnnotationService._find_candidates(async_db, np.array([a]), 10.0, 10)
+    hits = annotation_cache.hits
+    warm = await AnnotationService._find_candidates(async_db, np.array([b]), 10.0, 10)
+
+    assert annotation_cache.hits - hits == 1
+    assert len(cold) == 1 and warm.ids.tolist() == cold.ids.tolist()
+    assert np.allclose(warm.error_ppm, cold.error_ppm)
+
+def test_annotation_cache_lru_eviction():
+    """The least recently used entry is evicted once the cache is full"""
+    cache = AnnotationCache(max_entries=2)
+    entry = (np.array([1]), np.array([1.0]), np.array([1.0]), None)
+    cache.put("a", entry)
+    cache.put("b", entry)
+    cache.get("a")
+    cache.put("c", entry)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+@pytest.mark.asyncio
+async def test_binary_request_and_npz_response(async_db):
+    """float64 request bodies and flat columnar responses carry the same matches as JSON"""
+    from api.services.columnar import negotiate_columnar, parse_mz_buffer, serialize_matches, NPZ_MEDIA_TYPE
+
+    body = np.array([180.0634, 88.0160, 5.0], dtype="<f8").tobytes()
+    mz_values = parse_mz_buffer(body, "application/octet-stream")
+    assert mz_values.tolist() == [180.0634, 88.0160, 5.0]
+    with pytest.raises(ValueError):
+        parse_mz_buffer(body[:-1], "application/octet-stream")
+
+    assert negotiate_columnar("application/x-npz") == NPZ_MEDIA_TYPE
+    assert negotiate_columnar("application/json, application/x-npz") is None
+    assert negotiate_columnar(None) is None
+
+    matches = await AnnotationService.annotate_matches(async_db, mz_values)
+    table = np.load(io.BytesIO(serialize_matches(matches, NPZ_MEDIA_TYPE)))
+    assert table["peak"].tolist() == [0, 0, 1]
+    assert table["metabolite_id"].tolist() == matches.ids.tolist()
+    assert "adduct" not in table.files
+
+@pytest.mark.asyncio
+async def test_arrow_file_format_round_trip(async_db):
+    """Arrow file-format bodies are read with the file reader and answered in file format"""
+    from api.services.columnar import negotiate_columnar, parse_mz_buffer, serialize_matches, ARROW_FILE_MEDIA_TYPE
+    assert negotiate_columnar(ARROW_FILE_MEDIA_TYPE) == ARROW_FILE_MEDIA_TYPE
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    sink = pa.BufferOutputStream()
+    table = pa.table({"mz": [180.0634, 88.0160]})
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    mz_values = parse_mz_buffer(sink.getvalue().to_pybytes(), ARROW_FILE_MEDIA_TYPE)
+    assert mz_values.tolist() == [180.0634, 88.0160]
+
+    matches = await AnnotationService.annotate_matches(async_db, mz_values)
+    body = serialize_matches(matches, ARROW_FILE_MEDIA_TYPE)
+    assert body.startswith(b"ARROW1")
+    assert pa.ipc.open_file(pa.py_buffer(body)).read_all().column("peak").to_pylist() == [0, 0, 1]
+
+def test_mzml_peak_picking_and_feature_merging():
+    """Profile peaks are centroided and traces across scans become features with RT ranges"""
+    from api.services.mzml_service import pick_peaks, iter_features
+
+    x = np.linspace(180.0, 182.0, 4001)
+    y = 1000 * np.exp(-((x - 181.0707) / 0.002) ** 2)
+    mz, intensity = pick_peaks(x, y, min_intensity=10)
+    assert len(mz) == 1
+    assert abs(mz[0] - 181.0707) < 1e-4
+
+    spectra = [(0.1 * scan, np.array([181.0707 + 1e-5 * (scan % 2), 300.0]), np.array([10.0 + scan, 5.0]))
+               for scan in range(10)]
+    spectra += [(1.0 + 0.1 * scan, np.array([400.0]), np.array([7.0])) for scan in range(10)]
+    features = list(iter_features(spectra, tol_ppm=10, max_gap_scans=2, mode="centroid"))
+    merged = {round(float(m)): i for i, m in enumerate(features[0].mz)}
+
+    assert sorted(merged) == [181, 300, 400]
+    glucose = merged[181]
+    assert features[0].n_scans[glucose] == 10
+    assert features[0].rt_min[glucose] == 0.0
+    assert abs(features[0].rt_max[glucose] - 0.9) < 1e-9
+    assert abs(features[0].rt_apex[glucose] - 0.9) < 1e-9
+
+@pytest.mark.asyncio
+async def test_stream_mzml_annotations(async_db):
+    """Decoded spectra are merged into features and annotated as NDJSON"""
+    from api.services.mzml_service import MzmlService
+
+    spectra = [(0.1 * scan, np.array([181.0707, 500.0]), np.array([100.0, 50.0])) for scan in range(5)]
+    blocks = [block async for block in MzmlService.stream_mzml_annotations(
+        async_db, spectra, ion_mode="positive", mode="centroid"
+    )]
+    lines = [json.loads(line) for line in b"".join(blocks).decode("utf-8").splitlines()]
+
+    assert [line["feature"] for line in lines] == [0, 1]
+    assert lines[0]["n_scans"] == 5
+    assert lines[0]["rt_max"] == 0.4
+    assert lines[0]["candidates"][0]["adduct"] == "[M+H]+"
+    assert lines[1]["candidates"] == []
+
+def test_theoretical_isotope_envelope():
+    """M+1/M+2 ratios follow carbon count and heavy +2 isotopes"""
+    from api.services.formula import parse_formula
+    from api.services.isotopes import theoretical_envelope
+
+    assert parse_formula("C6H12O6·H2O") == {"C": 6, "H": 14, "O": 7}
+    assert parse_formula("not a formula") is None
+
+    m1, m2 = theoretical_envelope("C6H12O6")
+    assert abs(m1 - 0.0686) < 1e-3
+    assert abs(m2 - 0.0143) < 1e-3
+    assert theoretical_envelope("CH2Cl2")[1] > 0.6
+
+@pytest.mark.asyncio
+async def test_isotope_scoring_reranks_isobaric_candidates(async_db):
+    """Observed isotope ratios push the candidate with the matching envelope to the top"""
+    from api.services.isotopes import _isotope_index
+
+    async_db.add(Metabolite(name="Isobar", formula="C2H8N4S3", exact_mass=180.0633))
+    await async_db.commit()
+    _isotope_index.invalidate()
+    try:
+        plain = await AnnotationService.annotate_mz_list(async_db, [180.0633])
+        assert plain.items[0].candidates[0].metabolite.name == "Isobar"
+
+        isotopes = np.array([[0.0686, 0.0143]])
+        scored = await AnnotationService.annotate_mz_list(async_db, [180.0633], isotopes=isotopes)
+        candidates = scored.items[0].candidates
+        assert [c.metabolite.name for c in candidates][-1] == "Isobar"
+        assert candidates[0].isotope_score > 0.9
+        assert candidates[-1].isotope_score < 0.01
+    finally:
+        _isotope_index.invalidate()
+
+@pytest.mark.asyncio
+async def test_formula_generation_for_unmatched_peaks(async_db):
+    """Matched peaks are skipped and generated formulas are cross-checked against the database"""
+    from api.services.formula_service import FormulaService
+
+    # [M+H]+ of glucose and of an unknown compound (C8H9NO2)
+    response = await FormulaService.generate_for_peaks(
+        async_db, [181.070664, 152.070605], tol_ppm=3, adducts="[M+H]+", unmatched_only=True
+    )
+    assert response.items[0].matched and not response.items[0].candidates
+    assert response.items[1].candidates[0].formula == "C8H9NO2"
+    assert not response.items[1].candidates[0].in_database
+
+    response = await FormulaService.generate_for_peaks(async_db, [181.070664], tol_ppm=3, adducts="[M+H]+")
+    best = response.items[0].candidates[0]
+    assert best.formula == "C6H12O6" and best.adduct == "[M+H]+"
+    assert best.in_database and best.metabolite_count == 2
+    assert abs(best.mass_error_ppm) < 1
+
+    # Above FORMULA_MAX_MASS the peak is flagged rather than silently left without formulas
+    response = await FormulaService.generate_for_peaks(async_db, [180.063388, 1500.0], tol_ppm=3)
+    assert [item.out_of_range for item in response.items] == [False, True]
+    assert response.items[0].candidates and not response.items[1].candidates
+
+def test_formula_index_groups_isomers():
+    """Rows sharing a formula in any notation and the same mass collapse into one group"""
+    index = FormulaIndex(
+        ids=np.array([5, 2, 9, 4, 7]),
+        masses=np.array([180.063388, 180.063388, 88.016043, 180.063388, 150.0]),
+        formulas=["C6H12O6", "C6H12O6", "C3H4O3", "H12C6O6", None]
+    )
+
+    assert len(index) == 3 and index.metabolite_total == 5
+    group = int(index.mass_index.search(np.array([180.0634]), tol_ppm=5).ids[0])
+    assert index.formulas[group] == "C6H12O6"
+    assert index.members(group).tolist() == [2, 4, 5]
+    assert index.isomers("H12O6C6").tolist() == [2, 4, 5]
+    assert index.metabolite_counts == {"C6H12O6": 3, "C3H4O3": 1}
+    assert index.expand(np.array([group, group])).tolist() == [2, 4, 5, 2, 4, 5]
+
+@pytest.mark.asyncio
+async def test_annotate_formulas_collapses_isomers(async_db):
+    """Glucose and fructose come back as one formula hit, expanded only on request"""
+    compact = await AnnotationService.annotate_formulas(async_db, [180.0634, 88.016, 500.0], tol_ppm=10)
+    hexose = compact.items[0].hits
+    assert len(hexose) == 1
+    assert hexose[0].formula == "C6H12O6" and hexose[0].metabolite_count == 2
+    assert hexose[0].metabolite_ids is None
+    assert compact.annotated_peaks == 2 and not compact.items[2].hits
+
+    expanded = await AnnotationService.annotate_formulas(async_db, [180.0634], tol_ppm=10, expand="metabolites")
+    hit = expanded.items[0].hits[0]
+    assert sorted(m.name for m in hit.metabolites) == ["Fructose", "Glucose"]
+    assert hit.metabolite_ids == sorted(m.id for m in hit.metabolites)
+
+    isomers = await AnnotationService.get_isomers(async_db, "C6H12O6")
+    assert [m.name for m in isomers] == ["Glucose", "Fructose"]
+
+@pytest.mark.asyncio
+async def test_annotate_formulas_cache_follows_rebuilt_index(async_db):
+    """Cached formula groups are dropped when the formula index is rebuilt before the cache notices"""
+    from sqlalchemy import update
+
+    first = await AnnotationService.annotate_formulas(async_db, [88.016], tol_ppm=10)
+    assert first.items[0].hits[0].formula == "C3H4O3"
+
+    # Pyruvate moves from group 1 to group 0; only the formula index sees the change
+    await async_db.execute(update(Metabolite).where(Metabolite.formula == "C6H12O6").values(exact_mass=None))
+    await async_db.commit()
+    _formula_index.invalidate()
+    second = await AnnotationService.annotate_formulas(async_db, [88.016], tol_ppm=10)
+    assert [hit.formula for hit in second.items[0].hits] == ["C3H4O3"]
+
+def _use_lipids_db(monkeypatch, tmp_path, rows):
+    """Point the lipids sidecar source at a temporary database with the given rows"""
+    import sqlite3
+    from api.services import compound_index
+
+    path = tmp_path / "lipids.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE lipids (id INTEGER PRIMARY KEY, name TEXT NOT NULL, name_ru TEXT, formula TEXT,
+                    exact_mass REAL, kegg_id TEXT, chebi_id TEXT, hmdb_id TEXT, type TEXT, description TEXT)""")
+    conn.executemany("INSERT INTO lipids (id, name, formula, exact_mass, type) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(compound_index, "SIDECAR_SOURCES", {
+        "lipids": str(path), "carbohydrates": str(tmp_path / "missing.db")
+    })
+
+@pytest.mark.asyncio
+async def test_unified_annotation_merges_sources(async_db, tmp_path, monkeypatch):
+    """Metabolites and sidecar databases are ranked in one list with a source tag per candidate"""
+    from api.services import compound_index
+    from api.services.compound_service import CompoundService
+
+    _use_lipids_db(monkeypatch, tmp_path, [
+        (1, "Hexose lipid", "C6H12O6", 180.0635, "Lipid"),
+        (2, "Generic", "C5H6O5R2", 0.0, "Lipid"),
+        (3, "Glycerol", "C3H8O3", 92.047344, "Lipid"),
+    ])
+    compound_index._compound_index.invalidate()
+    try:
+        response = await CompoundService.annotate(async_db, [180.0634, 92.0473], tol_ppm=10)
+        assert response.sources == {"metabolites": 3, "lipids": 2, "carbohydrates": 0}
+        hexose = [(c.compound.source, c.compound.name) for c in response.items[0].candidates]
+        assert hexose[-1] == ("lipids", "Hexose lipid")
+        assert {name for source, name in hexose[:2]} == {"Glucose", "Fructose"}
+        assert response.items[1].best_match.type == "Lipid"
+
+        lipids_only = await CompoundService.search_mass(async_db, 180.0634, 10, sources="lipids")
+        assert [c.compound.name for c in lipids_only.candidates] == ["Hexose lipid"]
+        with pytest.raises(ValueError):
+            await CompoundService.search_mass(async_db, 180.0634, sources="proteins")
+    finally:
+        compound_index._compound_index.invalidate()
+
+def test_kendrick_series_labels():
+    """CH2 homologs share a series, a double-bond variant only under the H2 base"""
+    from api.services.formula import monoisotopic_mass
+    from api.services.kendrick import kendrick_coordinates, series_labels
+
+    masses = np.array([monoisotopic_mass(f) for f in ["C40H80NO8P", "C42H84NO8P", "C44H88NO8P", "C42H82NO8P"]])
+    _, kmd, residue = kendrick_coordinates(masses, "CH2")
+    labels = series_labels(kmd, residue)
+    assert labels[0] == labels[1] == labels[2] != labels[3]
+
+    _, kmd, residue = kendrick_coordinates(masses, "H2")
+    labels = series_labels(kmd, residue)
+    assert labels[1] == labels[3] != labels[0]
+
+@pytest.mark.asyncio
+async def test_lipid_series_filters_unsupported_candidates(async_db, tmp_path, monkeypatch):
+    """A candidate without homologs among the other series peaks is dropped"""
+    from api.services import compound_index
+    from api.services.formula import monoisotopic_mass
+    from api.services.lipid_service import LipidService
+
+    pc = [monoisotopic_mass(f) for f in ["C40H80NO8P", "C42H84NO8P", "C44H88NO8P"]]
+    _use_lipids_db(monkeypatch, tmp_path, [
+        (1, "PC 32:0", "C40H80NO8P", pc[0], "Glycerophospholipid"),
+        (2, "PC 34:0", "C42H84NO8P", pc[1], "Glycerophospholipid"),
+        (3, "PC 36:0", "C44H88NO8P", pc[2], "Glycerophospholipid"),
+        (4, "Isobar", None, pc[1] * (1 + 12e-6), "Lipid"),
+    ])
+    compound_index._compound_index.invalidate()
+    try:
+        peaks = [m + 1.007276 for m in pc] + [500.0]
+        response = await LipidService.annotate_series(async_db, peaks, tol_ppm=20, adducts="[M+H]+")
+        assert len(response.series) == 1 and response.series[0].peaks == [0, 1, 2]
+        assert response.items[3].series != response.items[0].series
+        assert [c.compound.name for c in response.items[1].candidates] == ["PC 34:0"]
+        assert response.items[1].candidates[0].series_support == 3
+
+        loose = await LipidService.annotate_series(async_db, peaks, tol_ppm=20, adducts="[M+H]+", min_support=1)
+        assert {c.compound.name for c in loose.items[1].candidates} == {"PC 34:0", "Isobar"}
+
+        homologs = await LipidService.get_homologs(async_db, pc[0])
+        assert [l.name for l in homologs.lipids] == ["PC 32:0", "PC 34:0", "PC 36:0"]
+    finally:
+        compound_index._compound_index.invalidate()
+
+def test_glycan_table_enumerates_compositions():
+    """The table holds every composition up to max_dp and finds an N-glycan core by mass"""
+    from api.services.glycans import GlycanCompositionTable
+
+    table = GlycanCompositionTable(max_dp=12)
+    assert len(table) == 6187  # C(12 + 5, 5) - 1 non-empty compositions of five residues
+    assert np.all(np.diff(table.masses) >= 0)
+
+    matches = table.search(np.array([1640.592172]), tol_ppm=5)
+    row = int(matches.rows[0])
+    assert table.name(row) == "Hex5HexNAc4"
+    assert table.formula(row) == "C62H104N4O46"
+    assert int(table.degree(matches.rows[:1])[0]) == 9
+
+@pytest.mark.asyncio
+async def test_glycan_compositions_link_database_carbohydrates(async_db, tmp_path, monkeypatch):
+    """Compositions of adduct ions are matched and linked to carbohydrates with the same formula"""
+    import sqlite3
+    from api.services import compound_index, glycan_service
+    from api.services.glycan_service import GlycanService
+
+    path = tmp_path / "carbohydrates.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE carbohydrates (id INTEGER PRIMARY KEY, name TEXT NOT NULL, formula TEXT, exact_mass REAL)")
+    conn.executemany("INSERT INTO carbohydrates (id, name, formula, exact_mass) VALUES (?, ?, ?, ?)", [
+        (1, "Maltose", "C12H22O11", 342.116212),
+        (2, "Lactose", "C12H22O11", 342.116212),
+    ])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(compound_index, "SIDECAR_SOURCES", {
+        "lipids": str(tmp_path / "missing.db"), "carbohydrates": str(path)
+    })
+    glycan_service._carbohydrate_formulas.invalidate()
+    try:
+        response = await GlycanService.search_compositions(async_db, [365.105434], tol_ppm=5, adducts="[M+Na]+")
+        best = response.items[0].compositions[0]
+        assert (best.composition, best.formula, best.adduct) == ("Hex2", "C12H22O11", "[M+Na]+")
+        assert best.database_matches == ["Maltose", "Lactose"]
+        assert response.matched_peaks == 1
+    finally:
+        glycan_service._carbohydrate_formulas.invalidate()
+
+def test_tryptic_digest_cleaves_after_lysine_and_arginine():
+    """Trypsin skips K/R before proline and missed cleavages join neighbouring fragments"""
+    from api.services.peptides import tryptic_digest
+
+    sequences = ["DLGEEHFKAAAKPRGGGGGR", "XXXKAAAAAR"]
+    digest = tryptic_digest(sequences, max_missed_cleavages=1, min_length=5)
+    text = "".join(sequences)
+    peptides = {(text[s:e], int(m)) for s, e, m in zip(digest.start, digest.end, digest.missed_cleavages)}
+    assert peptides == {
+        ("DLGEEHFK", 0), ("AAAKPR", 0), ("GGGGGR", 0), ("AAAAAR", 0),
+        ("DLGEEHFKAAAKPR", 1), ("AAAKPRGGGGGR", 1)
+    }
+    mass = digest.masses[[text[s:e] for s, e in zip(digest.start, digest.end)].index("DLGEEHFK")]
+    assert mass == pytest.approx(973.450510, abs=1e-5)  # C43H63N11O15
+
+@pytest.mark.asyncio
+async def test_peptide_mass_fingerprint_ranks_matching_enzyme(async_db):
+    """The enzyme whose tryptic peptides explain the peak list is ranked first"""
+    from api.services import peptides
+    from api.services.peptide_service import PeptideService
+
+    async_db.add_all([
+        Enzyme(name="Target", uniprot_id="P00001", sequence="DLGEEHFKGLVLIAFSQYLQQCPFDEHVKLVNELTEFAK"),
+        Enzyme(name="Decoy", uniprot_id="P00002", sequence="MSTNPKPQRKTKRNTNRRPQDVKFPGGGQIVGGVYLLPR"),
+    ])
+    await async_db.commit()
+    peptides._peptide_index.invalidate()
+    try:
+        target = peptides.tryptic_digest(["DLGEEHFKGLVLIAFSQYLQQCPFDEHVKLVNELTEFAK"], 0)
+        peak_list = (target.masses + 1.007276).tolist() + [1500.0]
+        response = await PeptideService.fingerprint(async_db, peak_list, tol_ppm=10)
+        assert [i.name for i in response.identifications] == ["Target"]
+        best = response.identifications[0]
+        assert best.matched_peaks == 3 and best.sequence_coverage == 1.0
+        assert best.peptides[0].peptide == "DLGEEHFK" and best.peptides[0].start == 1
+        assert response.proteins_searched == 2
+
+        with pytest.raises(ValueError):
+            await PeptideService.fingerprint(async_db, peak_list, mass_type="average")
+    finally:
+        peptides._peptide_index.invalidate()
+
+@pytest.mark.asyncio
+async def test_peptide_mass_fingerprint_without_sequence_column(async_db):
+    """Databases imported before sequences were stored get a clear error pointing to the migration"""
+    from sqlalchemy import text
+    from api.services import peptides
+    from api.services.peptide_service import PeptideService
+
+    await async_db.execute(text("ALTER TABLE enzymes DROP COLUMN sequence"))
+    await async_db.commit()
+    peptides._peptide_index.invalidate()
+    try:
+        with pytest.raises(ValueError, match="add_enzyme_sequences.py"):
+            await PeptideService.fingerprint(async_db, [1000.0, 1200.0])
+    finally:
+        peptides._peptide_index.invalidate()
+
+@pytest.mark.asyncio
+async def test_msms_annotation_scores_library_spectra(async_db, tmp_path, monkeypatch):
+    """Precursor window first, then cosine; the modified cosine also matches a shifted analogue"""
+    from api.schemas import MsmsSpectrumIn
+    from api.services import spectral_library
+    from api.services.msms_service import MsmsService
+
+    (tmp_path / "library.msp").write_text(
+        "Name: Caffeine\nPrecursorMZ: 195.0877\nPrecursor_type: [M+H]+\nFormula: C8H10N4O2\nIon_mode: P\n"
+        "Num Peaks: 4\n138.0662 100\n110.0713 20\n83.0604 10; 195.0877 40\n\n"
+        "Name: Isobar\nPrecursorMZ: 195.0880\nNum Peaks: 3\n150.0 100\n120.0 50\n90.0 10\n"
+    )
+    (tmp_path / "analogues.mgf").write_text(
+        "BEGIN IONS\nTITLE=Methylcaffeine\nPEPMASS=209.1033\nIONMODE=Positive\n"
+        "152.0818 100\n124.0869 20\n83.0604 10\n209.1033 40\nEND IONS\n"
+    )
+    monkeypatch.setattr(spectral_library, "SPECTRAL_LIBRARY_DIR", str(tmp_path))
+    spectral_library._spectral_library.invalidate()
+    try:
+        query = MsmsSpectrumIn(
+            id="scan1", precursor_mz=195.0877, mz=[83.0605, 110.0715, 138.066, 195.0877], intensities=[10, 20, 100, 40]
+        )
+        response = await MsmsService.annotate(async_db, [query])
+        assert response.library_size == 3
+        assert [m.name for m in response.items[0].matches] == ["Caffeine"]
+        assert response.items[0].best_match.score > 0.99 and response.items[0].best_match.matched_peaks == 4
+
+        analogues = await MsmsService.annotate(async_db, [query], precursor_tol_ppm=1e5, modified=True)
+        assert {m.name for m in analogues.items[0].matches} == {"Caffeine", "Methylcaffeine"}
+
+        with pytest.raises(ValueError):
+            await MsmsService.annotate(async_db, [MsmsSpectrumIn(precursor_mz=195.0877, mz=[1.0], intensities=[])])
+
+        monkeypatch.setattr(spectral_library, "SPECTRAL_LIBRARY_DIR", str(tmp_path / "missing"))
+        spectral_library._spectral_library.invalidate()
+        with pytest.raises(spectral_library.SpectralLibraryUnavailable):
+            await MsmsService.annotate(async_db, [query])
+    finally:
+        spectral_library._spectral_library.invalidate()
+
+def test_align_peaks_groups_by_mz_and_rt():
+    """Peaks within tol_ppm share a feature unless their retention times are too far apart"""
+    from api.services.alignment import align_peaks
+
+    sample = np.array([0, 0, 1, 1, 2, 2])
+    mz = np.array([100.0, 200.0, 100.0005, 200.001, 100.0003, 100.0004])
+    rt = np.array([1.0, 5.0, 1.1, 5.05, 1.05, 3.0])
+    intensity = np.array([10, 20, 30, 40, 50, 70.0])
+
+    features = align_peaks(sample, mz, intensity, rt, n_samples=3, tol_ppm=10, rt_tol=0.2)
+    assert features.n_samples.tolist() == [3, 1, 2]
+    assert features.peak_feature.tolist() == [0, 2, 0, 2, 0, 1]
+    assert np.isnan(features.matrix[0, 1]) and features.matrix[2, 1] == 70.0
+
+    mz_only = align_peaks(sample, mz, intensity, n_samples=3, tol_ppm=10)
+    assert len(mz_only) == 2 and mz_only.matrix[2, 0] == 70.0
+
+def test_align_peaks_caps_feature_width():
+    """Neighbours within tol_ppm do not chain into one feature wider than tol_ppm"""
+    from api.services.alignment import align_peaks
+
+    mz = 100.0 * (1 + 9e-6) ** np.arange(50)
+    features = align_peaks(np.arange(50) % 3, mz, tol_ppm=10)
+    assert len(features) == 25
+    assert np.all((features.mz_max - features.mz_min) / features.mz_min * 1e6 <= 10)
+    assert features.peak_feature.tolist() == (np.arange(50) // 2).tolist()
+
+@pytest.mark.asyncio
+async def test_feature_table_annotates_each_feature_once(async_db):
+    """Samples are aligned into one feature table and every consensus feature is annotated"""
+    import pandas as pd
+    from api.services.alignment_service import AlignmentService
+
+    samples = AlignmentService.read_samples([
+        ("s1.csv", b"mz,intensity\n181.0707,100\n89.0233,50\n"),
+        ("s2.csv", b"mz,intensity\n181.0709,300\n500.0,10\n"),
+    ])
+    response = await AlignmentService.build_feature_table(async_db, samples, adducts="[M+H]+")
+    assert response.samples == ["s1", "s2"]
+    assert [f.n_samples for f in response.features] == [1, 2, 1]
+    assert response.matrix == [[50.0, 100.0, None], [None, 300.0, 10.0]]
+    assert {c.metabolite.name for c in response.features[1].candidates} == {"Glucose", "Fructose"}
+
+    shared = await AlignmentService.build_feature_table(async_db, samples, adducts="[M+H]+", min_samples=2)
+    assert len(shared.features) == 1 and shared.annotated_features == 1
+
+    with pytest.raises(ValueError):
+        AlignmentService.read_samples([("peaks.txt", b"mz\n100\n")])
+    with pytest.raises(ValueError):
+        await AlignmentService.build_feature_table(async_db, [("s", pd.DataFrame({"mass": [1.0]}))])
+
+def test_read_samples_enforces_upload_limit_while_reading(monkeypatch):
+    """The size limit is charged as files are read and archive members decompressed"""
+    import zipfile
+    from api.services import alignment_service
+    from api.services.alignment_service import AlignmentService
+
+    monkeypatch.setattr(alignment_service, "ALIGNMENT_MAX_UPLOAD_MB", 1)
+    monkeypatch.setattr(alignment_service, "_READ_CHUNK", 4096)
+    peaks = b"mz\n" + b"100.0\n" * 200000
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("bomb.csv", peaks)
+    assert len(archive.getvalue()) < 1024 * 1024 < len(peaks)
+
+    with pytest.raises(ValueError, match="exceed"):
+        AlignmentService.read_samples([("samples.zip", io.BytesIO(archive.getvalue()))])
+    with pytest.raises(ValueError, match="exceed"):
+        AlignmentService.read_samples([("a.csv", peaks[:600000]), ("b.csv", io.BytesIO(peaks[:600000]))])
+    assert len(AlignmentService.read_samples([("a.csv", peaks[:600003])])[0][1]) == 100000
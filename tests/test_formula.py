@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from api.services.formula import (
+    ELECTRON_MASS, canonical_formula, monoisotopic_mass, monoisotopic_masses, parse_formula, parse_formula_with_charge
+)
+from api.services.formula_generator import _VALENCE, get_formula_generator
+
+@pytest.mark.parametrize("formula, expected", [
+    ("C6H12O6", 180.063388),
+    ("CuSO4·5H2O", 248.934150),
+    ("Ca(OH)2", 73.968070),
+    ("CH3(CH2)14COOH", 256.240230),
+    ("[Fe(CN)6]4-", 211.955576),
+])
+def test_monoisotopic_mass(formula, expected):
+    """Exact isotope masses with brackets, hydrates and charges"""
+    assert monoisotopic_mass(formula) == pytest.approx(expected, abs=1e-6)
+
+def test_formula_charge_notation():
+    """Charges may follow the formula or a closing bracket"""
+    assert parse_formula_with_charge("NH4+") == ({"N": 1, "H": 4}, 1)
+    assert parse_formula_with_charge("C6H5O7-3") == ({"C": 6, "H": 5, "O": 7}, -3)
+    assert parse_formula_with_charge("[C6H5O7]3-") == ({"C": 6, "H": 5, "O": 7}, -3)
+    assert monoisotopic_mass("NH4+") == pytest.approx(18.034374 - ELECTRON_MASS, abs=1e-6)
+
+def test_invalid_formulas():
+    """Unknown elements, unbalanced brackets and generic residues have no mass"""
+    for formula in ["C6H12O6)", "(C6H12O6", "C5H6O5R2", "", None]:
+        assert monoisotopic_mass(formula) is None
+
+def test_vectorized_masses_match_scalar():
+    """Column-wise computation agrees with the memoized scalar one"""
+    formulas = ["C6H12O6", None, "C3H4O3", "C6H12O6", "C5H6O5R2", "NH4+"]
+    masses = monoisotopic_masses(formulas)
+
+    assert np.isnan(masses[[1, 4]]).all()
+    for formula, mass in zip(formulas, masses):
+        if monoisotopic_mass(formula) is not None:
+            assert mass == pytest.approx(monoisotopic_mass(formula), abs=1e-9)
+
+def test_formula_generator_finds_glucose():
+    """The closest golden-rule composition for the glucose mass is C6H12O6"""
+    generator = get_formula_generator()
+    matches = generator.generate(np.array([180.063388, 88.016043]), np.array([0.0009, 0.0004]), max_results=5)
+    formulas = generator.formulas(matches)
+
+    first = [formulas[np.flatnonzero(matches.query_index == q)[0]] for q in range(2)]
+    assert first == ["C6H12O6", "C3H4O3"]
+    assert np.all(np.abs(matches.error_da[matches.query_index == 0]) <= 0.0009)
+    assert np.all(matches.rdbe >= 0) and np.all(matches.rdbe == np.round(matches.rdbe))
+
+def test_formula_generator_golden_rules():
+    """Every generated formula obeys LEWIS/SENIOR and recomputes to its reported mass"""
+    generator = get_formula_generator()
+    matches = generator.generate(np.array([301.1, 455.3]), 0.01, max_results=50, halogens=True)
+    assert len(matches)
+
+    for formula, mass in zip(generator.formulas(matches), matches.mass):
+        counts = parse_formula(formula)
+        assert monoisotopic_mass(formula) == pytest.approx(mass, abs=1e-6)
+        valence = sum(count * _VALENCE[element] for element, count in counts.items())
+        assert valence % 2 == 0
+        assert 0.1 * counts["C"] <= counts.get("H", 0)
+
+def test_formula_generator_halogens():
+    """Halogen offsets are only searched on request"""
+    generator = get_formula_generator()
+    mass = monoisotopic_mass("CH2Cl2")
+    assert "CH2Cl2" not in generator.formulas(generator.generate(np.array([mass]), 0.0005))
+    assert generator.formulas(generator.generate(np.array([mass]), 0.0005, halogens=True))[0] == "CH2Cl2"
+    assert canonical_formula("Cl2CH2") == "CH2Cl2"
@@ -0,0 +1,325 @@
+import pytest
+
+from api.models import Metabolite
+from tests.test_annotation import _use_lipids_db
+
+@pytest.mark.asyncio
+async def test_fulltext_search_matches_like_and_follows_updates(async_db):
+    """The FTS5 trigram index finds the same substrings as LIKE and is kept in sync by triggers"""
+    from sqlalchemy import select
+    from api.services import fulltext
+
+    async def names(q):
+        condition = await fulltext.metabolite_text_condition(async_db, q)
+        result = await async_db.execute(select(Metabolite.name).where(condition).order_by(Metabolite.name))
+        return result.scalars().all()
+
+    assert await fulltext.ensure_fulltext_index(async_db.bind)
+    try:
+        assert await names("GLUC") == ["Glucose"]
+        assert await names("hmdb0000") == ["Fructose", "Glucose", "Pyruvate"]
+        assert await names("C6H12") == ["Fructose", "Glucose"]
+        assert await names("ru") == ["Fructose", "Pyruvate"]
+
+        pyruvate = (await async_db.execute(select(Metabolite).where(Metabolite.name == "Pyruvate"))).scalar_one()
+        pyruvate.name_ru = "Пируват"
+        async_db.add(Metabolite(name="Lactate", formula="C3H6O3", exact_mass=90.031694))
+        await async_db.commit()
+        assert await names("пиру") == ["Pyruvate"]
+        assert await names("lact") == ["Lactate"]
+    finally:
+        fulltext._fulltext_databases.clear()
+
+@pytest.mark.asyncio
+async def test_numeric_query_matches_names_and_formulas(async_db):
+    """A bare number is looked up as an accession and still searched as a substring"""
+    from sqlalchemy import select
+    from api.services import fulltext
+
+    async def names(q):
+        condition = await fulltext.metabolite_text_condition(async_db, q)
+        result = await async_db.execute(select(Metabolite.name).where(condition).order_by(Metabolite.name))
+        return result.scalars().all()
+
+    async_db.add(Metabolite(name="Vitamin B12", formula="C63H88CoN14O14P", exact_mass=1354.567))
+    async_db.add(Metabolite(name="Glucose 6-phosphate", formula="C6H13O9P", exact_mass=260.029718, pubchem_cid="5958"))
+    await async_db.commit()
+
+    for fts in (False, True):
+        if fts:
+            assert await fulltext.ensure_fulltext_index(async_db.bind)
+        try:
+            assert await names("12") == ["Fructose", "Glucose", "Vitamin B12"]
+            assert await names("13") == ["Glucose 6-phosphate"]
+            assert await names("5958") == ["Glucose 6-phosphate"]
+            assert "Glucose 6-phosphate" in await names("6")
+        finally:
+            fulltext._fulltext_databases.clear()
+
+def test_parse_identifier_normalizes_accessions():
+    """Identifier patterns map to their column in the stored form; other text is not an identifier"""
+    from api.services.identifiers import Identifier, parse_identifier
+
+    assert parse_identifier(" hmdb0000122 ") == [Identifier("hmdb_id", "HMDB0000122")]
+    assert parse_identifier("HMDB00122") == [Identifier("hmdb_id", "HMDB0000122")]
+    assert parse_identifier("HMDB000012") == [Identifier("hmdb_id", "HMDB000012", prefix=True)]
+    assert parse_identifier("c00031") == [Identifier("kegg_id", "C00031")]
+    assert parse_identifier("ChEBI: 4167") == [Identifier("chebi_id", "CHEBI:4167"), Identifier("chebi_id", "4167")]
+    assert parse_identifier("CID 5793") == [Identifier("pubchem_cid", "5793")]
+    assert [i.column for i in parse_identifier("5793")] == ["pubchem_cid", "chebi_id", "chebi_id"]
+    assert parse_identifier("C6H12O6") == [] and parse_identifier("Glucose") == []
+
+@pytest.mark.asyncio
+async def test_metabolite_lookup_resolves_mixed_identifiers(async_db):
+    """Bulk lookup keeps request order and reports which identifier column matched"""
+    from sqlalchemy import select
+    from api.services.fulltext import metabolite_text_condition
+    from api.services.metabolite_service import MetaboliteService
+
+    glucose = (await async_db.execute(select(Metabolite).where(Metabolite.name == "Glucose"))).scalar_one()
+    glucose.kegg_id, glucose.chebi_id, glucose.pubchem_cid = "C00031", "CHEBI:4167", "5793"
+    await async_db.commit()
+
+    response = await MetaboliteService.lookup_identifiers(
+        async_db, ["C00031", "HMDB00660", "unknown", "4167", "CID:5793", "HMDB000"]
+    )
+    assert [item.metabolite.name if item.metabolite else None for item in response.items] == [
+        "Glucose", "Fructose", None, "Glucose", "Glucose", None
+    ]
+    assert [item.matched_by for item in response.items] == ["kegg_id", "hmdb_id", None, "chebi_id", "pubchem_cid", None]
+    assert response.resolved == 4 and response.items[0].metabolite.pathways == ["Glycolysis"]
+
+    result = await async_db.execute(
+        select(Metabolite.name).where(await metabolite_text_condition(async_db, "HMDB000024")).order_by(Metabolite.name)
+    )
+    assert result.scalars().all() == ["Pyruvate"]
+
+@pytest.mark.asyncio
+async def test_identifier_lookup_batches_in_lists(async_db, monkeypatch):
+    """Every IN list holds at most ID_CHUNK_SIZE values, so many bare numbers stay under the bind limit"""
+    from sqlalchemy import event, select
+    from api.services import metabolite_service
+    from api.services.metabolite_service import MetaboliteService
+
+    monkeypatch.setattr(metabolite_service, "ID_CHUNK_SIZE", 2)
+    glucose = (await async_db.execute(select(Metabolite).where(Metabolite.name == "Glucose"))).scalar_one()
+    glucose.pubchem_cid = "5793"
+    await async_db.commit()
+
+    params = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: params.append(len(parameters))
+    event.listen(async_db.bind.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = await MetaboliteService.lookup_identifiers(async_db, ["1", "2", "3", "5793", "HMDB0000660"])
+    finally:
+        event.remove(async_db.bind.sync_engine, "before_cursor_execute", listener)
+    assert [item.metabolite.name if item.metabolite else None for item in response.items] == [
+        None, None, None, "Glucose", "Fructose"
+    ]
+    assert max(params) <= 2
+
+@pytest.mark.asyncio
+async def test_identifier_lookup_matches_bare_chebi_numbers(async_db):
+    """ChEBI accessions stored as bare numbers (HMDB and ChEBI imports) are found in either notation"""
+    from sqlalchemy import select
+    from api.services.fulltext import metabolite_text_condition
+    from api.services.metabolite_service import MetaboliteService
+
+    fructose = (await async_db.execute(select(Metabolite).where(Metabolite.name == "Fructose"))).scalar_one()
+    fructose.chebi_id = "28757"
+    await async_db.commit()
+
+    response = await MetaboliteService.lookup_identifiers(async_db, ["CHEBI:28757", "28757"])
+    assert [(item.matched_by, item.metabolite.name) for item in response.items] == [
+        ("chebi_id", "Fructose"), ("chebi_id", "Fructose")
+    ]
+    for query in ("CHEBI:28757", "28757"):
+        result = await async_db.execute(select(Metabolite.name).where(await metabolite_text_condition(async_db, query)))
+        assert result.scalars().all() == ["Fructose"]
+
+@pytest.mark.asyncio
+async def test_cursor_pages_walk_all_rows_in_sort_order(async_db):
+    """Following next_cursor visits every row once, NULL sort keys last, and agrees with OFFSET pages"""
+    from sqlalchemy import select
+    from api.services.pagination import fetch_page
+
+    async_db.add_all([
+        Metabolite(name="Lactate", formula="C3H6O3", exact_mass=90.031694),
+        Metabolite(name="Unknown A"),
+        Metabolite(name="Unknown B"),
+        Metabolite(name="Glucose isomer", formula="C6H12O6", exact_mass=180.063388),
+    ])
+    await async_db.commit()
+    query = select(Metabolite)
+
+    for attribute in ("exact_mass", "name", "id"):
+        walked, cursor = [], None
+        while True:
+            rows, cursor = await fetch_page(async_db, query, Metabolite, attribute, 2, cursor)
+            walked.extend(m.id for m in rows)
+            if cursor is None:
+                break
+        paged = []
+        for offset in range(0, 8, 3):
+            rows, _ = await fetch_page(async_db, query, Metabolite, attribute, 3, offset=offset)
+            paged.extend(m.id for m in rows)
+        assert walked == paged and len(set(walked)) == 7
+
+    by_mass, _ = await fetch_page(async_db, query, Metabolite, "exact_mass", 100)
+    assert [m.name for m in by_mass][:2] == ["Pyruvate", "Lactate"]
+    assert [m.exact_mass for m in by_mass][-2:] == [None, None]
+
+    _, cursor = await fetch_page(async_db, query, Metabolite, "name", 2)
+    with pytest.raises(ValueError):
+        await fetch_page(async_db, query, Metabolite, "exact_mass", 2, cursor)
+    with pytest.raises(ValueError):
+        await fetch_page(async_db, query, Metabolite, "id", 2, "not-a-cursor")
+
+@pytest.mark.asyncio
+async def test_search_total_modes_cache_and_estimate(async_db, monkeypatch):
+    """Exact totals are cached per filter until the table changes; estimates and none avoid a full count"""
+    from sqlalchemy import select
+    from api.services import search_count
+    from api.services.data_version import INDEX_VERSION_TTL
+
+    query = select(Metabolite)
+    key = search_count.normalize_filters(q="Gluc", mass=None)
+    assert key == search_count.normalize_filters(q="gluc")
+    assert key != search_count.normalize_filters(q="gluc ")
+    try:
+        assert await search_count.search_total(async_db, query, "exact", "metabolites", key) == (3, False)
+        assert await search_count.search_total(async_db, query, "exact", "metabolites", key) == (3, False)
+        assert search_count.count_cache.hits == 1
+
+        async_db.add(Metabolite(name="Lactate", formula="C3H6O3", exact_mass=90.031694))
+        await async_db.commit()
+        search_count._generations["metabolites"].ttl = 0
+        assert await search_count.search_total(async_db, query, "exact", "metabolites", key) == (4, False)
+
+        monkeypatch.setattr(search_count, "SEARCH_COUNT_ESTIMATE_ROWS", 2)
+        assert await search_count.search_total(async_db, query, "estimate", "metabolites", key) == (4, True)
+        light = query.where(Metabolite.exact_mass < 89)
+        assert await search_count.search_total(async_db, light, "estimate", "metabolites", key) == (1, False)
+        assert await search_count.search_total(async_db, query, "none", "metabolites", key) == (None, False)
+        with pytest.raises(ValueError):
+            await search_count.search_total(async_db, query, "approximate", "metabolites", key)
+    finally:
+        search_count.count_cache.clear()
+        search_count.count_cache.hits = search_count.count_cache.misses = 0
+        search_count._generations["metabolites"].ttl = INDEX_VERSION_TTL
+        search_count._generations["metabolites"].invalidate()
+
+@pytest.mark.asyncio
+async def test_estimate_binds_search_text(async_db):
+    """The EXPLAIN behind an estimate carries the search text as a parameter, not as SQL literals"""
+    from sqlalchemy import event, select
+    from api.services import search_count
+    from api.services.fulltext import metabolite_text_condition
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+    event.listen(async_db.bind.sync_engine, "before_cursor_execute", listener)
+    try:
+        for q in ("o'brien", "gluc"):
+            query = select(Metabolite).where(await metabolite_text_condition(async_db, q), Metabolite.id.in_([1, 2, 3]))
+            await search_count.estimate_count(async_db, query)
+    finally:
+        event.remove(async_db.bind.sync_engine, "before_cursor_execute", listener)
+    explains = [(sql, params) for sql, params in statements if sql.startswith("EXPLAIN")]
+    assert len(explains) == 2
+    assert all("brien" not in sql and "gluc" not in sql for sql, _ in explains)
+    assert "%o'brien%" in explains[0][1] and 3 in explains[0][1]
+
+@pytest.mark.asyncio
+async def test_exact_total_follows_edits_of_searched_columns(async_db):
+    """Editing a name the filter matches invalidates the cached total through the change counter"""
+    import sqlite3
+    from sqlalchemy import select, text
+    from api.services import search_count
+    from api.services.data_version import INDEX_VERSION_TTL, ensure_change_tracking, update_change_tracking
+    from api.services.fulltext import metabolite_text_condition
+
+    assert await ensure_change_tracking(async_db.bind)
+    query = select(Metabolite).where(await metabolite_text_condition(async_db, "glucose "))
+    key = search_count.normalize_filters(q="glucose ")
+    search_count._generations["metabolites"].ttl = 0
+    try:
+        assert await search_count.search_total(async_db, query, "exact", "metabolites", key) == (1, False)
+        await async_db.execute(text("UPDATE metabolites SET name_ru = 'glucose-like' WHERE name = 'Fructose'"))
+        await async_db.commit()
+        assert await search_count.search_total(async_db, query, "exact", "metabolites", key) == (2, False)
+    finally:
+        search_count.count_cache.clear()
+        search_count._generations["metabolites"].ttl = INDEX_VERSION_TTL
+        search_count._generations["metabolites"].invalidate()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE metabolites (id INTEGER PRIMARY KEY, name TEXT)")
+    assert update_change_tracking(conn)
+    conn.execute("UPDATE metabolites SET name = 'x'")
+    conn.execute("INSERT INTO metabolites (name) VALUES ('Glucose')")
+    assert conn.execute("SELECT table_name, counter FROM data_changes").fetchall() == [("metabolites", 2)]
+
+def test_fold_name_and_substring_distance():
+    """Case, diacritics, punctuation and Cyrillic look-alikes fold away; distance is to the best substring"""
+    from api.services.fuzzy_index import fold_name, substring_edit_distance
+
+    assert fold_name("Glucose-6-Phosphate") == "glucose 6 phosphate"
+    assert fold_name("β-D-Glucosé") == "β d glucose"
+    assert fold_name("глюкозa") == fold_name("Глюкоза")
+    assert substring_edit_distance("glucoze", ["glucose", "glucose 6 phosphate", "ab"]).tolist() == [1, 1, 7]
+
+@pytest.mark.asyncio
+async def test_fuzzy_search_typos_and_mixed_script(async_db, tmp_path, monkeypatch):
+    """Typos and mixed Latin/Cyrillic spellings find names across metabolites, enzymes and lipids"""
+    from sqlalchemy import select
+    from api.services import fuzzy_index
+    from api.services.fuzzy_service import FuzzySearchService
+
+    glucose = (await async_db.execute(select(Metabolite).where(Metabolite.name == "Glucose"))).scalar_one()
+    glucose.name_ru = "Глюкоза"
+    await async_db.commit()
+    _use_lipids_db(monkeypatch, tmp_path, [(1, "Glucosylceramide", "C24H47NO8", 477.3302, "Lipid")])
+    fuzzy_index._fuzzy_index.invalidate()
+    try:
+        response = await FuzzySearchService.search(async_db, "glucoze")
+        assert response.max_edits == 2
+        assert [(m.source, m.name, m.distance) for m in response.matches][:2] == [
+            ("metabolites", "Glucose", 1), ("lipids", "Glucosylceramide", 2)
+        ]
+
+        mixed = await FuzzySearchService.search(async_db, "глюкозa", max_edits=0)
+        assert [(m.name, m.matched_name, m.field) for m in mixed.matches] == [("Glucose", "Глюкоза", "name_ru")]
+
+        enzymes = await FuzzySearchService.search(async_db, "hexokinaze", sources="enzymes")
+        assert [(m.source, m.name) for m in enzymes.matches] == [("enzymes", "Hexokinase")]
+        assert (await FuzzySearchService.search(async_db, "glucoze", max_edits=0)).matches == []
+        with pytest.raises(ValueError):
+            await FuzzySearchService.search(async_db, "glucose", sources="proteins")
+    finally:
+        fuzzy_index._fuzzy_index.invalidate()
+
+@pytest.mark.asyncio
+async def test_fuzzy_index_follows_renames(async_db, tmp_path, monkeypatch):
+    """Renaming a compound or enzyme, or adding a Russian name, rebuilds the name index"""
+    from sqlalchemy import text
+    from api.services import fuzzy_index
+    from api.services.data_version import INDEX_VERSION_TTL, ensure_change_tracking
+    from api.services.fuzzy_service import FuzzySearchService
+
+    _use_lipids_db(monkeypatch, tmp_path, [])
+    assert await ensure_change_tracking(async_db.bind)
+    fuzzy_index._fuzzy_index.invalidate()
+    fuzzy_index._fuzzy_index.ttl = 0
+    try:
+        assert (await FuzzySearchService.search(async_db, "пируват")).matches == []
+        await async_db.execute(text("UPDATE metabolites SET name_ru = 'Пируват' WHERE name = 'Pyruvate'"))
+        await async_db.execute(text("UPDATE enzymes SET name = 'Glucokinase' WHERE name = 'Hexokinase'"))
+        await async_db.commit()
+
+        assert [m.name for m in (await FuzzySearchService.search(async_db, "пируват")).matches] == ["Pyruvate"]
+        enzymes = await FuzzySearchService.search(async_db, "glucokinaze", sources="enzymes")
+        assert [m.name for m in enzymes.matches] == ["Glucokinase"]
+    finally:
+        fuzzy_index._fuzzy_index.ttl = INDEX_VERSION_TTL
+        fuzzy_index._fuzzy_index.invalidate()
@@ -7,12 +7,30 @@ import math
 import plotly.express as px
 import plotly.graph_objects as go
 import os
+import sys
 import logging
+from pathlib import Path
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Корень проекта в sys.path, чтобы использовать расчетные модули API
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    from api.services.glycans import search_glycan_compositions
+except ImportError as e:
+    logger.warning(f"Поиск гликановых композиций недоступен: {e}")
+    search_glycan_compositions = None
+
+try:
+    from api.services.search_count import count_cache, sqlite_file_version
+except ImportError as e:
+    logger.warning(f"Кэш количества результатов поиска недоступен: {e}")
+    count_cache = None
+
 # -------------------------
 # Вспомогательные стили/утилиты UI
 # -------------------------
@@ -309,6 +327,18 @@ def _get_lipids_connection():
         logger.error(f"Ошибка подключения к базе липидов: {e}")
         return None
 
+def _count_rows(conn, db_path: str, count_query: str, params: List[Any]) -> int:
+    """Количество результатов поиска; кэшируется по запросу, пока файл базы не изменится"""
+    if count_cache is None:
+        return conn.execute(count_query, params).fetchone()[0]
+    version = sqlite_file_version(db_path)
+    key = (count_query, tuple(params))
+    total = count_cache.get(db_path, version, key)
+    if total is None:
+        total = conn.execute(count_query, params).fetchone()[0]
+        count_cache.put(db_path, version, key, total)
+    return total
+
 def _get_totals() -> Dict[str, Any]:
     """Возвращает агрегированные счетчики для шапки"""
     totals = {"metabolites": 0, "enzymes": 0, "proteins": 0, "carbohydrates": 0, "lipids": 0, "db_status": "unknown"}
@@ -880,8 +910,7 @@ def _search_metabolites(query: Optional[str] = None, mass: Optional[float] = Non
         
         # Подсчет общего количества
         count_query = f"SELECT COUNT(*) FROM ({base_query})"
-        cursor = conn.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        total = _count_rows(conn, METABOLITES_DB_PATH, count_query, params)
         
         # Добавляем пагинацию
         base_query += " LIMIT ? OFFSET ?"
@@ -935,8 +964,7 @@ def _search_enzymes(query: Optional[str] = None, mass: Optional[float] = None, t
         
         # Подсчет общего количества
         count_query = f"SELECT COUNT(*) FROM ({base_query})"
-        cursor = conn.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        total = _count_rows(conn, ENZYMES_DB_PATH, count_query, params)
         
         # Добавляем пагинацию
         base_query += " LIMIT ? OFFSET ?"
@@ -990,8 +1018,7 @@ def _search_proteins(query: Optional[str] = None, mass: Optional[float] = None,
         
         # Подсчет общего количества
         count_query = f"SELECT COUNT(*) FROM ({base_query})"
-        cursor = conn.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        total = _count_rows(conn, PROTEINS_DB_PATH, count_query, params)
         
         # Добавляем пагинацию
         base_query += " LIMIT ? OFFSET ?"
@@ -1039,8 +1066,7 @@ def _search_carbohydrates(query: Optional[str] = None, mass: Optional[float] = N
         
         # Подсчет общего количества
         count_query = base_query.replace("SELECT *", "SELECT COUNT(*)")
-        cursor = conn.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        total = _count_rows(conn, CARBOHYDRATES_DB_PATH, count_query, params)
         
         # Добавляем пагинацию
         base_query += " ORDER BY name LIMIT ? OFFSET ?"
@@ -1049,8 +1075,14 @@ def _search_carbohydrates(query: Optional[str] = None, mass: Optional[float] = N
         cursor = conn.execute(base_query, params)
         results = [dict(row) for row in cursor.fetchall()]
         
+        # Олигосахариды, которых нет в базе, ищем перебором композиций по массе
+        compositions = []
+        if mass and mass > 0 and search_glycan_compositions is not None:
+            compositions = search_glycan_compositions(mass, tol_ppm)
+        
         return {
             "carbohydrates": results,
+            "compositions": compositions,
             "total": total,
             "page": page,
             "page_size": page_size
@@ -1088,8 +1120,7 @@ def _search_lipids(query: Optional[str] = None, mass: Optional[float] = None, to
         
         # Подсчет общего количества
         count_query = base_query.replace("SELECT *", "SELECT COUNT(*)")
-        cursor = conn.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        total = _count_rows(conn, LIPIDS_DB_PATH, count_query, params)
         
         # Добавляем пагинацию
         base_query += " ORDER BY name LIMIT ? OFFSET ?"
@@ -1179,6 +1210,7 @@ def _unified_search(query: str, mass: Optional[float] = None, tol_ppm: int = 10,
             if "error" not in carb_result:
                 results["carbohydrates"]["data"] = carb_result.get("carbohydrates", [])
                 results["carbohydrates"]["total"] = carb_result.get("total", 0)
+                results["carbohydrates"]["compositions"] = carb_result.get("compositions", [])
             else:
                 logger.error(f"Carbohydrate search error: {carb_result['error']}")
         except Exception as e:
@@ -1443,8 +1475,9 @@ if st.session_state.get("search_submitted", False) and st.session_state.get("sea
     total_carbohydrates = results.get("carbohydrates", {}).get("total", 0)
     total_lipids = results.get("lipids", {}).get("total", 0)
     total_all = total_metabolites + total_enzymes + total_proteins + total_carbohydrates + total_lipids
+    glycan_compositions = results.get("carbohydrates", {}).get("compositions", [])
     
-    if total_all > 0:
+    if total_all > 0 or glycan_compositions:
         st.success(f"✅ Найдено {total_all} результатов (метаболиты: {total_metabolites}, ферменты: {total_enzymes}, белки: {total_proteins}, углеводы: {total_carbohydrates}, липиды: {total_lipids})")
         
         # Переключение вида
@@ -1637,6 +1670,26 @@ if st.session_state.get("search_submitted", False) and st.session_state.get("sea
                 for idx, prot in enumerate(proteins):
                     with cols[idx % 3]:
                         _render_protein_card(prot)
+        
+        # Отображение гликановых композиций (перебор по массе)
+        if glycan_compositions:
+            st.subheader(f"🍬 Гликановые композиции ({len(glycan_compositions)})")
+            df = pd.DataFrame([
+                {
+                    "Композиция": comp["name"],
+                    "Формула": comp["formula"],
+                    "Масса": comp["exact_mass"],
+                    "Ошибка, ppm": comp["mass_error_ppm"],
+                    "Степень полимеризации": comp["dp"],
+                }
+                for comp in glycan_compositions
+            ])
+            st.dataframe(
+                df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={"Масса": st.column_config.NumberColumn(format="%.6f")},
+            )
     
     else:
         st.warning("🔍 Результаты не найдены. Попробуйте изменить параметры поиска.")